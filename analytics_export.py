@@ -0,0 +1,401 @@
+"""
+Columnar export of analysis results
+-----------------------------------
+Flattens the nested renovation results (as written by
+RenovationAnalyzer.save_results), the per-photo problem lists and the
+description facts into typed Arrow tables:
+
+- properties:  one row per analysed property
+- photos:      one row per photo analysis (condition, age, urgency, totals)
+- problems:    one row per detected problem
+- cost_items:  one row per immediate/future cost item
+
+and appends them to Parquet datasets partitioned by analysis date, e.g.
+`analytics/cost_items/analysis_date=2026-10-19/<property>-<uuid>-0.parquet`,
+which pandas, DuckDB or pyarrow.dataset read directly.
+
+Usage:
+    python analytics_export.py renovation_analysis_results.json --property-id flat-12
+    python analytics_export.py results.json --description test_dataset/description.txt -o analytics
+"""
+import argparse
+import json
+import re
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from description_parser import PropertyDetails, parse_description
+
+DEFAULT_ROOT = "analytics"
+PARTITION_COLUMN = "analysis_date"
+
+PROPERTIES_SCHEMA = pa.schema(
+    [
+        ("property_id", pa.string()),
+        ("address", pa.string()),
+        ("analysed_at", pa.timestamp("s")),
+        ("year_of_construction", pa.int32()),
+        ("last_renovation_year", pa.int32()),
+        ("rooms", pa.float64()),
+        ("wet_rooms", pa.int32()),
+        ("living_area_m2", pa.float64()),
+        ("balcony_area_m2", pa.float64()),
+        ("renovation_fund_chf", pa.float64()),
+        ("service_charges_chf_month", pa.float64()),
+        ("floor", pa.string()),
+        (PARTITION_COLUMN, pa.string()),
+    ]
+)
+
+PHOTOS_SCHEMA = pa.schema(
+    [
+        ("property_id", pa.string()),
+        ("photo", pa.string()),
+        ("folder", pa.string()),
+        ("category", pa.string()),
+        ("overall_condition", pa.string()),
+        ("years_since_renovation", pa.int32()),
+        ("age_confidence", pa.string()),
+        ("years_until_renovation", pa.int32()),
+        ("urgency", pa.string()),
+        ("priority", pa.string()),
+        ("immediate_cost_chf", pa.float64()),
+        ("future_cost_chf", pa.float64()),
+        ("error", pa.string()),
+        (PARTITION_COLUMN, pa.string()),
+    ]
+)
+
+PROBLEMS_SCHEMA = pa.schema(
+    [
+        ("property_id", pa.string()),
+        ("photo", pa.string()),
+        ("problem", pa.string()),
+        # Bounding box normalised to the photo (0 to 1)
+        ("x_min", pa.float32()),
+        ("y_min", pa.float32()),
+        ("x_max", pa.float32()),
+        ("y_max", pa.float32()),
+        (PARTITION_COLUMN, pa.string()),
+    ]
+)
+
+COST_ITEMS_SCHEMA = pa.schema(
+    [
+        ("property_id", pa.string()),
+        ("photo", pa.string()),
+        ("folder", pa.string()),
+        ("category", pa.string()),
+        ("kind", pa.dictionary(pa.int8(), pa.string())),
+        ("item", pa.string()),
+        ("description", pa.string()),
+        ("cost_chf", pa.float64()),
+        ("unit", pa.string()),
+        ("years_until", pa.int32()),
+        ("urgency", pa.string()),
+        (PARTITION_COLUMN, pa.string()),
+    ]
+)
+
+SCHEMAS = {
+    "properties": PROPERTIES_SCHEMA,
+    "photos": PHOTOS_SCHEMA,
+    "problems": PROBLEMS_SCHEMA,
+    "cost_items": COST_ITEMS_SCHEMA,
+}
+
+
+def _as_float(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace("'", "").replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_int(value) -> Optional[int]:
+    number = _as_float(value)
+    return int(round(number)) if number is not None else None
+
+
+def _columns(schema: pa.Schema) -> Dict[str, list]:
+    return {name: [] for name in schema.names}
+
+
+def _to_table(columns: Dict[str, list], schema: pa.Schema) -> pa.Table:
+    return pa.table(
+        [pa.array(columns[f.name], type=f.type) for f in schema], schema=schema
+    )
+
+
+def properties_table(
+    property_id: str,
+    details: Optional[PropertyDetails] = None,
+    address: Optional[str] = None,
+    analysed_at: Optional[datetime] = None,
+) -> pa.Table:
+    analysed_at = analysed_at or datetime.now()
+    row = {
+        name: getattr(details, name, None)
+        for name in PROPERTIES_SCHEMA.names
+        if details is not None and hasattr(details, name)
+    }
+    row.update(
+        {
+            "property_id": property_id,
+            "address": address,
+            "analysed_at": analysed_at.replace(microsecond=0),
+            PARTITION_COLUMN: analysed_at.date().isoformat(),
+        }
+    )
+    columns = {name: [row.get(name)] for name in PROPERTIES_SCHEMA.names}
+    return _to_table(columns, PROPERTIES_SCHEMA)
+
+
+def photos_table(
+    property_id: str, results: Dict[str, List[Dict]], analysis_date: str
+) -> pa.Table:
+    """One row per photo analysis in RenovationAnalyzer results"""
+    columns = _columns(PHOTOS_SCHEMA)
+    for folder, analyses in results.items():
+        for analysis in analyses:
+            photo = analysis.get("photo_analysis") or {}
+            age = analysis.get("age_assessment") or {}
+            prediction = analysis.get("renovation_prediction") or {}
+            risk = analysis.get("risk_assessment") or {}
+            costs = analysis.get("cost_analysis") or {}
+            parsed = analysis.get("parsed_analysis") or {}
+
+            columns["property_id"].append(property_id)
+            columns["photo"].append(Path(analysis.get("photo_path", "")).name)
+            columns["folder"].append(folder)
+            columns["category"].append(analysis.get("category", folder))
+            columns["overall_condition"].append(
+                photo.get("overall_condition", parsed.get("condition"))
+            )
+            columns["years_since_renovation"].append(
+                _as_int(
+                    age.get(
+                        "estimated_years_since_renovation",
+                        parsed.get("years_since_renovation"),
+                    )
+                )
+            )
+            columns["age_confidence"].append(age.get("confidence_level"))
+            columns["years_until_renovation"].append(
+                _as_int(
+                    prediction.get(
+                        "years_until_renovation_needed",
+                        parsed.get("years_until_renovation"),
+                    )
+                )
+            )
+            columns["urgency"].append(
+                prediction.get("urgency_level", parsed.get("urgency"))
+            )
+            columns["priority"].append(risk.get("priority_level"))
+            columns["immediate_cost_chf"].append(
+                _as_float(
+                    (costs.get("immediate_repairs") or {}).get(
+                        "estimated_cost_chf", parsed.get("immediate_cost")
+                    )
+                )
+            )
+            columns["future_cost_chf"].append(
+                _as_float(
+                    (costs.get("future_renovation") or {}).get(
+                        "estimated_cost_chf", parsed.get("future_cost")
+                    )
+                )
+            )
+            columns["error"].append(analysis.get("error"))
+            columns[PARTITION_COLUMN].append(analysis_date)
+    return _to_table(columns, PHOTOS_SCHEMA)
+
+
+def problems_table(
+    property_id: str,
+    problems: Dict[str, Union[str, List[Dict]]],
+    analysis_date: str,
+) -> pa.Table:
+    """
+    One row per problem. `problems` maps a photo name to the text returned by
+    analyze_image_problems or to a list of {"problem", "box"} with boxes
+    normalised to the photo (analyze_image_problems_located, normalise_boxes).
+    """
+    columns = _columns(PROBLEMS_SCHEMA)
+    for photo, found in problems.items():
+        if isinstance(found, str):
+            found = [
+                {"problem": line.strip()}
+                for line in found.splitlines()
+                if line.strip() and line.strip().lower() != "no problems found"
+            ]
+        for problem in found:
+            box = problem.get("box") or [None] * 4
+            columns["property_id"].append(property_id)
+            columns["photo"].append(photo)
+            columns["problem"].append(problem.get("problem"))
+            for name, value in zip(("x_min", "y_min", "x_max", "y_max"), box):
+                columns[name].append(_as_float(value))
+            columns[PARTITION_COLUMN].append(analysis_date)
+    return _to_table(columns, PROBLEMS_SCHEMA)
+
+
+def cost_items_table(
+    property_id: str, results: Dict[str, List[Dict]], analysis_date: str
+) -> pa.Table:
+    """
+    One row per cost item. Like the app's chart, itemised sections are
+    exported item by item and otherwise as their lump sum.
+    """
+    columns = _columns(COST_ITEMS_SCHEMA)
+
+    def add(folder, analysis, kind, item, description, cost, unit, years, urgency):
+        columns["property_id"].append(property_id)
+        columns["photo"].append(Path(analysis.get("photo_path", "")).name)
+        columns["folder"].append(folder)
+        columns["category"].append(analysis.get("category", folder))
+        columns["kind"].append(kind)
+        columns["item"].append(item)
+        columns["description"].append(description)
+        columns["cost_chf"].append(_as_float(cost) or 0.0)
+        columns["unit"].append(unit)
+        columns["years_until"].append(_as_int(years))
+        columns["urgency"].append(urgency)
+        columns[PARTITION_COLUMN].append(analysis_date)
+
+    for folder, analyses in results.items():
+        for analysis in analyses:
+            costs = analysis.get("cost_analysis") or {}
+            prediction = analysis.get("renovation_prediction") or {}
+            for kind, section_name, years, urgency in (
+                ("immediate", "immediate_repairs", 0, "immediate"),
+                (
+                    "future",
+                    "future_renovation",
+                    prediction.get("years_until_renovation_needed"),
+                    prediction.get("urgency_level"),
+                ),
+            ):
+                section = costs.get(section_name) or {}
+                description = section.get("description")
+                items = section.get("items") or []
+                if items:
+                    for item in items:
+                        add(
+                            folder,
+                            analysis,
+                            kind,
+                            item.get("item"),
+                            description,
+                            item.get("cost"),
+                            item.get("unit"),
+                            years,
+                            urgency,
+                        )
+                elif (_as_float(section.get("estimated_cost_chf")) or 0) > 0:
+                    add(
+                        folder,
+                        analysis,
+                        kind,
+                        None,
+                        description,
+                        section.get("estimated_cost_chf"),
+                        None,
+                        years,
+                        urgency,
+                    )
+    return _to_table(columns, COST_ITEMS_SCHEMA)
+
+
+def append_dataset(table: pa.Table, root: str, name: str, property_id: str) -> Path:
+    """Append `table` to the `name` dataset as new files, never rewriting old ones"""
+    path = Path(root) / name
+    if table.num_rows == 0:
+        return path
+    prefix = re.sub(r"[^A-Za-z0-9_.-]", "_", property_id)
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=[PARTITION_COLUMN],
+        partitioning_flavor="hive",
+        basename_template=f"{prefix}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return path
+
+
+def export_property(
+    property_id: str,
+    results: Optional[Dict[str, List[Dict]]] = None,
+    problems: Optional[Dict[str, Union[str, List[Dict]]]] = None,
+    details: Optional[PropertyDetails] = None,
+    address: Optional[str] = None,
+    root: str = DEFAULT_ROOT,
+) -> Dict[str, int]:
+    """Flatten everything known about one property and append it; returns row counts"""
+    analysed_at = datetime.now()
+    analysis_date = analysed_at.date().isoformat()
+    tables = {
+        "properties": properties_table(property_id, details, address, analysed_at)
+    }
+    if results:
+        tables["photos"] = photos_table(property_id, results, analysis_date)
+        tables["cost_items"] = cost_items_table(property_id, results, analysis_date)
+    if problems:
+        tables["problems"] = problems_table(property_id, problems, analysis_date)
+
+    for name, table in tables.items():
+        append_dataset(table, root, name, property_id)
+    return {name: table.num_rows for name, table in tables.items()}
+
+
+def load_dataset(name: str, root: str = DEFAULT_ROOT) -> ds.Dataset:
+    """Open an exported dataset, e.g. `load_dataset("cost_items").to_table()`"""
+    return ds.dataset(
+        Path(root) / name,
+        schema=SCHEMAS[name],
+        format="parquet",
+        partitioning="hive",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export results to Parquet")
+    parser.add_argument("results", help="renovation_analysis_results.json")
+    parser.add_argument("--property-id", help="Defaults to a random id")
+    parser.add_argument("--description", help="Text file with the description")
+    parser.add_argument("--address")
+    parser.add_argument("--output", "-o", default=DEFAULT_ROOT)
+    args = parser.parse_args()
+
+    with open(args.results, "r", encoding="utf-8") as f:
+        results = json.load(f)
+    details = None
+    if args.description:
+        with open(args.description, "r", encoding="utf-8") as f:
+            details = parse_description(f.read())
+
+    property_id = args.property_id or uuid.uuid4().hex[:12]
+    counts = export_property(
+        property_id,
+        results=results,
+        details=details,
+        address=args.address,
+        root=args.output,
+    )
+    print(f"Exported property {property_id} to {args.output}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
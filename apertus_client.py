@@ -0,0 +1,153 @@
+"""
+Async streaming client for the Apertus property-description analysis.
+
+The OpenAI-compatible clients are pooled per (api key, base url) and live on a
+single background event loop, so their HTTP connections are reused across
+Streamlit reruns instead of being rebuilt for every description.
+"""
+import asyncio
+import os
+import time
+
+from async_runner import get_event_loop
+from lazy_import import lazy_module
+from tracing import current_listing, span, trace_listing
+
+openai = lazy_module("openai")
+
+APERTUS_BASE_URL = "https://api.swisscom.com/layer/swiss-ai-weeks/apertus-70b/v1"
+APERTUS_MODEL = "swiss-ai/Apertus-70B"
+
+DESCRIPTION_SYSTEM_PROMPT = "You are the world's best real estate expert. I need you to read the \
+                    following description of a property and return me an opinion. \
+                    Your response should be concise, and have up to 150 words for potential real estate \
+                    buyers or morgage provider, depending on the use case the user is signalizing. \
+                    Your answer should be a holistic but very short analysis but also concentrated on \
+                    whether renovations might be needed. Note that the very first thing you need to tell \
+                    me is the year the building was constructed, and summarize all renovations performed in \
+                    the property if the user has included these. \
+                    STRUCTURE IT WITH BULLET POINTS. ANSWER ONLY IN ENGLISH, 200 WORDS ABSOLUTE MAX!"
+
+_clients = {}
+
+
+def get_base_url(base_url=None):
+    """Base url of the Apertus endpoint, overridable via APERTUS_BASE_URL."""
+    return base_url or os.getenv("APERTUS_BASE_URL", APERTUS_BASE_URL)
+
+
+def get_async_client(api_key, base_url=None):
+    """
+    Returns the pooled AsyncOpenAI client for the given credentials.
+    Must be called from the background loop the client is bound to.
+    """
+    key = (api_key, get_base_url(base_url))
+    client = _clients.get(key)
+    if client is None:
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=key[1])
+        _clients[key] = client
+    return client
+
+
+async def stream_description_analysis(
+    property_description,
+    api_key,
+    base_url=None,
+    model=APERTUS_MODEL,
+    system_prompt=DESCRIPTION_SYSTEM_PROMPT,
+):
+    """Async generator yielding the Apertus opinion token by token."""
+    client = get_async_client(api_key, base_url)
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": property_description},
+        ],
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content or ""
+        if content:
+            yield content
+
+
+async def analyze_description_stream(
+    property_description,
+    api_key,
+    on_token=None,
+    base_url=None,
+    listing_id=None,
+    **kwargs,
+):
+    """Consumes the stream, forwarding each token to `on_token`, and returns the text."""
+    output_chunks = []
+    with trace_listing(listing_id), span(
+        "describe_property", model=kwargs.get("model", APERTUS_MODEL)
+    ) as s:
+        s.bytes_in = len(property_description.encode("utf-8"))
+        start = time.perf_counter()
+        async for content in stream_description_analysis(
+            property_description, api_key, base_url=base_url, **kwargs
+        ):
+            if not output_chunks:
+                s.attributes["time_to_first_token_s"] = time.perf_counter() - start
+            output_chunks.append(content)
+            if on_token is not None:
+                on_token(content)
+        # Streamed chunks are roughly one token each
+        s.output_tokens = len(output_chunks)
+        s.bytes_out = sum(len(chunk.encode("utf-8")) for chunk in output_chunks)
+    return "".join(output_chunks)
+
+
+def analyze_description_async(
+    property_description, api_key, on_token=None, base_url=None, **kwargs
+):
+    """
+    Starts the description analysis on the background loop and returns
+    immediately with a concurrent.futures.Future resolving to the full text.
+    `on_token` is called from the loop thread as tokens arrive.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        analyze_description_stream(
+            property_description,
+            api_key,
+            on_token=on_token,
+            base_url=base_url,
+            listing_id=current_listing(),
+            **kwargs,
+        ),
+        get_event_loop(),
+    )
+
+
+def analyze_description(property_description, api_key, base_url=None, **kwargs):
+    """Blocking variant returning the full Apertus opinion."""
+    return analyze_description_async(
+        property_description, api_key, base_url=base_url, **kwargs
+    ).result()
+
+
+if __name__ == "__main__":
+    import sys
+
+    from dotenv import load_dotenv
+
+    if len(sys.argv) < 2:
+        print("Usage: python apertus_client.py <description_file>")
+        sys.exit(1)
+
+    load_dotenv()
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        description = f.read()
+
+    future = analyze_description_async(
+        description,
+        os.getenv("APERTUS_SWISSCOM_API_KEY"),
+        on_token=lambda token: print(token, end="", flush=True),
+    )
+    future.result()
+    print()
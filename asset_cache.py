@@ -0,0 +1,107 @@
+"""
+Content-hashed cache of encoded display assets
+----------------------------------------------
+Keeps small pre-encoded JPEG/WebP thumbnails and rendered anomaly overlays
+keyed by the upload's file hash, with least-recently-used eviction by total
+byte size. Streamlit reruns then serve the cached bytes instead of pushing
+full-size images to the browser and redrawing overlays.
+
+Because keys are content hashes, one cache can be shared by all sessions.
+"""
+import io
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+from PIL import Image
+
+DEFAULT_MAX_MB = 128
+THUMBNAIL_SIZE = 256
+OVERLAY_SIZE = 512
+
+
+def encode_image(
+    image: Image.Image,
+    max_size: Optional[int] = None,
+    format: str = "JPEG",
+    quality: int = 80,
+) -> bytes:
+    """Downscale to fit `max_size` and encode, returning the bytes"""
+    if max_size and max(image.size) > max_size:
+        image = image.copy()
+        image.thumbnail((max_size, max_size))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, quality=quality)
+    return buffer.getvalue()
+
+
+class AssetCache:
+    """Thread-safe LRU of encoded assets bounded by total bytes"""
+
+    def __init__(self, max_mb: float = DEFAULT_MAX_MB, format: str = "JPEG"):
+        self.max_bytes = int(max_mb * 2**20)
+        self.format = format
+        self.entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: Hashable, data: bytes):
+        with self.lock:
+            if key in self.entries:
+                self.size_bytes -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.size_bytes += len(data)
+            while self.size_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], bytes]) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = factory()
+            self.put(key, data)
+        return data
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def thumbnail(
+        self, file_hash: str, image: Image.Image, size: int = THUMBNAIL_SIZE
+    ) -> bytes:
+        """Encoded display-size thumbnail of an upload"""
+        return self.get_or_create(
+            ("thumbnail", file_hash, size),
+            lambda: encode_image(image, size, self.format),
+        )
+
+    @staticmethod
+    def overlay_key(file_hash: str, targets) -> Tuple:
+        return ("overlay", file_hash, tuple(sorted(t.lower() for t in targets)))
+
+    def overlay(
+        self,
+        file_hash: str,
+        targets,
+        render: Callable[[], Image.Image],
+        size: int = OVERLAY_SIZE,
+    ) -> bytes:
+        """Encoded overlay, rendering it with `render()` only on a miss"""
+        return self.get_or_create(
+            self.overlay_key(file_hash, targets),
+            lambda: encode_image(render(), size, self.format),
+        )
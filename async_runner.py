@@ -0,0 +1,84 @@
+"""
+Shared background event loop for the async analysis functions
+-------------------------------------------------------------
+The async model and HTTP clients are bound to the loop they were first used
+on, so all synchronous wrappers run their coroutines on one long-lived loop in
+a daemon thread. This keeps connections pooled across calls and works whether
+or not the caller already has an event loop running (Streamlit, notebooks).
+
+Usage:
+    text = run_sync(analyze_image_async_(image, api_key))
+    future = submit(analyze_image_async_(image, api_key))  # concurrent Future
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Returns the background event loop, starting it on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_loop.run_forever, name="async-runner", daemon=True
+            )
+            thread.start()
+        return _loop
+
+
+def _copy_outcome(task, future):
+    try:
+        if task.cancelled():
+            future.set_exception(concurrent.futures.CancelledError())
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+    except concurrent.futures.InvalidStateError:
+        # The caller cancelled the future in the meantime
+        pass
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """
+    Schedules `coro` on the background loop and returns a concurrent Future.
+    The task runs in a copy of the caller's context, so tracing spans nest
+    under the caller's listing and span. Cancelling the future cancels the
+    task, also once it has started.
+    """
+    loop = get_event_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+
+    def start():
+        if future.cancelled():
+            coro.close()
+            return
+        task = context.run(loop.create_task, coro)
+        task.add_done_callback(lambda t: _copy_outcome(t, future))
+        future.add_done_callback(
+            lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel)
+        )
+
+    loop.call_soon_threadsafe(start)
+    return future
+
+
+def run_sync(coro):
+    """Runs `coro` on the background loop and blocks until it finishes."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None and running is _loop:
+        coro.close()
+        raise RuntimeError(
+            "run_sync() called from the background loop; await the coroutine instead"
+        )
+    return submit(coro).result()
@@ -0,0 +1,550 @@
+"""
+Offline benchmark of the analysis pipeline
+------------------------------------------
+Replays recorded responses through fake_backend.FakeBackend and reports
+images/sec, p50/p95 per-image latency, peak memory and API call counts for:
+
+- streamlit:  what app.py runs for a listing: UploadManager decoding,
+              near-duplicate clustering, speculative classification,
+              analysis, located problems and anomaly overlays, the property
+              manifest, plus the Apertus description analysis
+- batch:      the single-image CLI path (process_image + problem analyzer)
+- async:      the async API over all images at once on one event loop, at most
+              --concurrency images in flight
+- renovation: RenovationAnalyzer.analyze_all_categories over the photos
+              classified by the streamlit scenario
+- decode:     the CPU stage alone (decode, resize, hash) through the
+              shared-memory ImagePipeline with --image-processes workers
+- imports:    cold-start import time of each entry module in a fresh
+              interpreter, and which heavy backends it loaded eagerly
+
+Usage:
+    python benchmark.py
+    python benchmark.py --latency-median 0.8 --latency-p95 2.5 --error-rate 0.02
+    python benchmark.py --repeat 5 --output bench.json
+    python benchmark.py --scenarios renovation --renovation-workers 8
+    python benchmark.py --scenarios batch async --repeat 20 --latency-median 0.8
+    python benchmark.py --scenarios imports --import-runs 10
+    python benchmark.py --scenarios decode --repeat 20 --image-processes 32
+    python benchmark.py --record   # capture live responses as fixtures (needs API keys)
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+from PIL import Image
+
+from async_runner import run_sync
+from fake_backend import DEFAULT_FIXTURES, FakeBackend, Fixtures, LatencyModel
+from tracing import trace_listing, tracer
+
+ROOT = Path(__file__).resolve().parent
+IMAGE_DIRS = [ROOT / "photos", ROOT / "test_dataset"]
+PHOTO_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+ANOMALY_TARGETS = ["couch", "sofa", "chair", "bathtub", "Countertop", "roof", "Window"]
+IMPORT_MODULES = [
+    "process_image",
+    "image_room_clasify",
+    "real_estate_problem_analyzer",
+    "nano_edit",
+    "apertus_client",
+    "price_analasys",
+    "job_queue",
+    "inspection_service",
+]
+HEAVY_MODULES = [
+    "google.generativeai",
+    "cv2",
+    "openai",
+    "httpx",
+    "requests",
+    "pandas",
+    "altair",
+    "geopy",
+    "pyarrow",
+]
+IMPORT_SCRIPT = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "seconds = time.perf_counter() - start\n"
+    "print(json.dumps([seconds, [m for m in {heavy!r} if m in sys.modules]]))\n"
+)
+
+
+def collect_images(dirs=IMAGE_DIRS, repeat=1):
+    files = []
+    for folder in dirs:
+        files.extend(
+            sorted(p for p in folder.iterdir() if p.suffix.lower() in PHOTO_EXTENSIONS)
+        )
+    return files * repeat
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+@contextmanager
+def measure(name, backend, n_images):
+    """Collects wall time, per-image latencies, memory and call counts"""
+    report = {"scenario": name, "images": n_images, "latencies": []}
+    calls_before = backend.calls.copy()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        latencies = report.pop("latencies")
+        report.update(
+            {
+                "wall_s": round(elapsed, 3),
+                "images_per_s": round(n_images / elapsed, 2) if elapsed else 0.0,
+                "p50_s": round(percentile(latencies, 50), 3),
+                "p95_s": round(percentile(latencies, 95), 3),
+                "python_heap_peak_mb": round(peak / 2**20, 1),
+                "max_rss_mb": round(
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+                ),
+                "api_calls": dict(backend.calls - calls_before),
+            }
+        )
+
+
+class FileUpload:
+    """A photo file shaped like a Streamlit upload"""
+
+    def __init__(self, path: Path):
+        self.name = path.name
+        self.data = path.read_bytes()
+
+    def getvalue(self) -> bytes:
+        return self.data
+
+
+def parse_analysis(analysis):
+    """The app's parsing of the image analysis answer"""
+    if isinstance(analysis, str):
+        analysis = analysis.strip()
+        if analysis.startswith("```") and analysis.endswith("```"):
+            analysis = analysis[7:-3].strip()
+        try:
+            analysis = json.loads(analysis)
+        except json.JSONDecodeError:
+            analysis = {}
+    return analysis
+
+
+def run_streamlit(files, backend, prompt, description):
+    """
+    Mirror of app.py: uploads decoded once by UploadManager, near-duplicates
+    clustered, classification/analysis/located problems/anomaly overlays
+    started speculatively on upload, then the results loop over the property
+    manifest. Returns the report and the manifest's categorised photos folder.
+    """
+    from apertus_client import analyze_description_async
+    from asset_cache import AssetCache
+    from image_hash import PerceptualHashIndex
+    from image_room_clasify import clasify_image
+    from process_image import analyze_image_
+    from property_manifest import PropertyManifest
+    from real_estate_problem_analyzer import analyze_image_problems_located
+    from speculative import SpeculativeAnalysis, problems_step
+    from upload_manager import UploadManager
+
+    with measure("streamlit", backend, len(files)) as report:
+        errors = 0
+        uploads = []
+        for file in files:
+            upload = FileUpload(file)
+            try:
+                # Header only; undecodable files are rejected like by the uploader
+                Image.open(io.BytesIO(upload.data))
+            except Exception:
+                errors += 1
+                continue
+            uploads.append(upload)
+
+        upload_manager = UploadManager()
+        asset_cache = AssetCache()
+        photos = upload_manager.sync(uploads)
+        duplicate_index = PerceptualHashIndex()
+        for i, photo in enumerate(photos):
+            duplicate_index.add_hash(i, photo.phash)
+            asset_cache.thumbnail(photo.file_hash, photo.thumbnail)
+
+        manifest = PropertyManifest.for_property("benchmark")
+        speculation = SpeculativeAnalysis(
+            upload_manager,
+            "fake-key",
+            prompt,
+            asset_cache=asset_cache,
+            targets=ANOMALY_TARGETS,
+        )
+        skip = {
+            p.file_hash
+            for p in photos
+            if manifest.stored_row(p.file_hash, high_res=False)
+        }
+        speculation.sync(
+            [photos[i] for i in duplicate_index.representatives], skip=skip
+        )
+
+        description_job = analyze_description_async(description, "fake-key")
+        manifest.prune(photo.file_hash for photo in photos)
+        analysed = set()
+        for i, photo in enumerate(photos):
+            start = time.perf_counter()
+            representative = duplicate_index.representative(i)
+            if representative in analysed or manifest.stored_row(
+                photo.file_hash, high_res=False
+            ):
+                report["latencies"].append(time.perf_counter() - start)
+                continue
+            try:
+                speculation.result(photo.file_hash, "overlay")
+                image = upload_manager.analysis_image(photo)
+                category = speculation.result(photo.file_hash, "category")
+                if category is not None:
+                    manifest.add_image(photo.file_hash, photo.name, category, image)
+                else:
+                    category = clasify_image(
+                        image,
+                        "fake-key",
+                        root_folder=manifest.photos_dir,
+                        image_name=manifest.image_name(photo.file_hash),
+                    )
+                    manifest.add(photo.file_hash, photo.name, category)
+                analysis = speculation.result(photo.file_hash, "analysis")
+                if analysis is None:
+                    analysis = analyze_image_(image, "fake-key", prompt=prompt)
+                problems = speculation.result(photo.file_hash, problems_step(False))
+                if problems is None:
+                    problems = analyze_image_problems_located(image, "fake-key")
+                row = {
+                    "Image Name": photo.name,
+                    "Overall Grade": parse_analysis(analysis).get("overall_grade", ""),
+                    "Problems": problems,
+                }
+                manifest.set_row(photo.file_hash, row, high_res=False)
+                analysed.add(i)
+            except Exception:
+                errors += 1
+            finally:
+                upload_manager.release(photo)
+            report["latencies"].append(time.perf_counter() - start)
+        manifest.save()
+        backend.count("apertus")
+        description_job.result()
+        report["errors"] = errors
+    return report, manifest.photos_dir
+
+
+def run_batch(files, backend):
+    """The single-image CLI path over a folder of photos"""
+    from process_image import analyze_image
+    from real_estate_problem_analyzer import analyze_image as find_problems
+
+    with measure("batch", backend, len(files)) as report:
+        errors = 0
+        for file in files:
+            start = time.perf_counter()
+            try:
+                analyze_image(str(file), "fake-key")
+                find_problems(str(file), "fake-key")
+            except Exception:
+                errors += 1
+            report["latencies"].append(time.perf_counter() - start)
+        report["errors"] = errors
+    return report
+
+
+def run_async_batch(files, backend, prompt, concurrency=64):
+    """Analysis and problem finding for every image, awaited concurrently"""
+    from process_image import analyze_image_async_
+    from real_estate_problem_analyzer import analyze_image_problems_async
+
+    async def analyse(file, semaphore, report):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                image = Image.open(file).convert("RGB").resize((512, 512))
+                await asyncio.gather(
+                    analyze_image_async_(image, "fake-key", prompt=prompt),
+                    analyze_image_problems_async(image, "fake-key"),
+                )
+                return 0
+            except Exception:
+                return 1
+            finally:
+                report["latencies"].append(time.perf_counter() - start)
+
+    async def analyse_all(report):
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(
+            *(analyse(file, semaphore, report) for file in files)
+        )
+
+    with measure("async", backend, len(files)) as report:
+        report["errors"] = sum(run_sync(analyse_all(report)))
+    return report
+
+
+def run_renovation(backend, photos_dir, max_workers=1, executor="thread"):
+    """RenovationAnalyzer over the photos the streamlit run categorised"""
+    from price_analasys import RenovationAnalyzer
+
+    analyzer = RenovationAnalyzer(
+        "fake-key",
+        csv_path=str(ROOT / "life_span_detailed_table.csv"),
+        max_workers=max_workers,
+        executor=executor,
+    )
+    analyzer.categorized_photos_path = Path(photos_dir)
+    n_photos = sum(
+        len(analyzer.get_photos_in_category(folder))
+        for folder in analyzer.folder_to_category_mapping
+    )
+    with measure("renovation", backend, n_photos) as report:
+        with trace_listing() as listing_id:
+            results = analyzer.analyze_all_categories()
+        report["latencies"] = [
+            s.latency_s
+            for s in tracer.spans_for_listing(listing_id)
+            if s.stage == "analyze_photo_with_gemini"
+        ]
+        report["errors"] = sum(
+            "error" in r for analyses in results.values() for r in analyses
+        )
+    return report
+
+
+def run_decode(files, backend, processes):
+    """Decoding, resizing and hashing every photo, without model calls"""
+    from image_pipeline import ImagePipeline
+
+    with measure("decode", backend, len(files)) as report:
+        with ImagePipeline(processes) as pipeline:
+            report["errors"] = sum(
+                photo.error is not None for photo in pipeline.decode(files)
+            )
+        report["processes"] = processes
+    return report
+
+
+def run_imports(modules=IMPORT_MODULES, runs=5):
+    """Import time of each module, each run in a fresh interpreter"""
+    reports = []
+    for module in modules:
+        report = {"scenario": "imports", "module": module, "runs": runs}
+        times = []
+        for _ in range(runs):
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES),
+                ],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode != 0:
+                report["error"] = process.stderr.strip().splitlines()[-1]
+                break
+            seconds, loaded = json.loads(process.stdout.strip().splitlines()[-1])
+            times.append(seconds)
+            report["heavy_loaded"] = loaded
+        report["p50_s"] = percentile(times, 50)
+        report["max_s"] = max(times, default=0.0)
+        reports.append(report)
+    return reports
+
+
+def print_import_report(reports):
+    header = f"{'module':30s} {'p50_s':>7s} {'max_s':>7s}  heavy backends loaded"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        loaded = r.get("error") or ", ".join(r["heavy_loaded"]) or "-"
+        print(f"{r['module']:30s} {r['p50_s']:7.3f} {r['max_s']:7.3f}  {loaded}")
+
+
+def print_report(reports):
+    header = (
+        f"{'scenario':12s} {'images':>6s} {'wall_s':>8s} {'img/s':>7s} "
+        f"{'p50_s':>7s} {'p95_s':>7s} {'heap_mb':>8s} {'rss_mb':>8s} {'errors':>6s}  api calls"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(r["api_calls"].items()))
+        print(
+            f"{r['scenario']:12s} {r['images']:6d} {r['wall_s']:8.2f} "
+            f"{r['images_per_s']:7.2f} {r['p50_s']:7.3f} {r['p95_s']:7.3f} "
+            f"{r['python_heap_peak_mb']:8.1f} {r['max_rss_mb']:8.1f} "
+            f"{r.get('errors', 0):6d}  {calls}"
+        )
+
+
+def record_fixtures(files, prompt, output):
+    """
+    Run the app's model calls against the live APIs on the analysis buffers
+    UploadManager decodes, capturing one response per task and photo
+    """
+    from dotenv import load_dotenv
+
+    from fake_backend import recording
+    from image_room_clasify import categorize_image_
+    from price_analasys import RenovationAnalyzer
+    from process_image import analyze_image_
+    from real_estate_problem_analyzer import (
+        analyze_image_problems,
+        analyze_image_problems_located,
+    )
+    from upload_manager import decode_upload
+
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    analyzer = RenovationAnalyzer(
+        api_key, csv_path=str(ROOT / "life_span_detailed_table.csv")
+    )
+    fixtures = Fixtures(DEFAULT_FIXTURES)
+    with recording(fixtures):
+        for file in files:
+            try:
+                _, image, _ = decode_upload(file.read_bytes())
+            except Exception as e:
+                print(f"Skipped {file.name}: {e}")
+                continue
+            category = categorize_image_(image, api_key)
+            analyze_image_(image, api_key, prompt=prompt)
+            analyze_image_problems(image, api_key)
+            analyze_image_problems_located(image, api_key)
+            csv_category = analyzer.folder_to_category_mapping.get(category)
+            if csv_category:
+                analyzer.analyze_photo_with_gemini(
+                    file, csv_category, analyzer.category_data.get(csv_category, [])
+                )
+            print(f"Recorded {file.name}")
+    fixtures.save(output)
+    print(f"Fixtures saved to: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument(
+        "--scenarios", nargs="+", default=["streamlit", "batch", "renovation"]
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the image set")
+    parser.add_argument("--latency-median", type=float, default=0.0)
+    parser.add_argument("--latency-p95", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--apertus-token-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="Images in flight (async)"
+    )
+    parser.add_argument("--renovation-workers", type=int, default=1)
+    parser.add_argument(
+        "--renovation-executor", choices=["thread", "asyncio"], default="thread"
+    )
+    parser.add_argument(
+        "--image-processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Decode worker processes (decode, 0 decodes in-process)",
+    )
+    parser.add_argument(
+        "--import-runs", type=int, default=5, help="Interpreters per module (imports)"
+    )
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    parser.add_argument("--output", "-o", help="Write the reports as JSON")
+    parser.add_argument(
+        "--record", action="store_true", help="Record live responses as fixtures"
+    )
+    args = parser.parse_args()
+
+    files = collect_images(repeat=args.repeat)
+    prompt = (ROOT / "streamlit-image-uploader" / "prompt.txt").read_text()
+    description = (ROOT / "test_dataset" / "description.txt").read_text()
+
+    if args.record:
+        record_fixtures(collect_images(), prompt, args.fixtures)
+        return
+
+    import_reports = []
+    if "imports" in args.scenarios:
+        import_reports = run_imports(runs=args.import_runs)
+        print_import_report(import_reports)
+
+    reports = []
+    if set(args.scenarios) - {"imports"}:
+        backend = FakeBackend(
+            LatencyModel(
+                args.latency_median, args.latency_p95, args.error_rate, seed=args.seed
+            ),
+            Fixtures(args.fixtures),
+        )
+
+        # clasify_image writes Categorised_photos/ relative to the working dir
+        workdir = tempfile.mkdtemp(prefix="housing-bench-")
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with backend.install(apertus_token_delay=args.apertus_token_delay):
+                if "streamlit" in args.scenarios or "renovation" in args.scenarios:
+                    report, photos_dir = run_streamlit(
+                        files, backend, prompt, description
+                    )
+                    reports.append(report)
+                if "batch" in args.scenarios:
+                    reports.append(run_batch(files, backend))
+                if "decode" in args.scenarios:
+                    reports.append(run_decode(files, backend, args.image_processes))
+                if "async" in args.scenarios:
+                    reports.append(
+                        run_async_batch(files, backend, prompt, args.concurrency)
+                    )
+                if "renovation" in args.scenarios:
+                    reports.append(
+                        run_renovation(
+                            backend,
+                            photos_dir,
+                            args.renovation_workers,
+                            args.renovation_executor,
+                        )
+                    )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if reports:
+        print_report(reports)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports + import_reports, f, indent=2)
+        print(f"Reports saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Structured parsing of property descriptions
+-------------------------------------------
+Turns free-text listing descriptions (see test_dataset/description.txt) into
+typed fields with cheap regular expressions, so facts the listing already
+states (build year, rooms, wet rooms, areas, renovation fund) never need a
+model call. Fields the rules cannot find can optionally be filled in by
+Apertus.
+
+Usage:
+    python description_parser.py test_dataset/description.txt
+    python description_parser.py descriptions/ --output parsed.jsonl
+"""
+import argparse
+import json
+import re
+import sys
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+YEAR = r"(1[5-9]\d\d|20\d\d)"
+NUMBER = r"(\d[\d',’]*(?:[.,]\d+)?)"
+AREA_UNIT = r"\s*(?:m²|m2|sqm|qm)"
+
+BUILD_YEAR_PATTERNS = [
+    re.compile(
+        r"(?:year of construction|construction year|built in|built|baujahr|erbaut)"
+        r"[^\d\n]{0,20}" + YEAR,
+        re.IGNORECASE,
+    ),
+    # Table-style listings put the bare year on its own line
+    re.compile(r"^\s*" + YEAR + r"\s*$", re.MULTILINE),
+]
+RENOVATION_YEAR_PATTERN = re.compile(
+    r"(?:renovated|renovation(?! fund)|refurbished|modernised|modernized|saniert|renoviert)"
+    r"[^\d\n]{0,30}" + YEAR,
+    re.IGNORECASE,
+)
+ROOMS_PATTERN = re.compile(
+    r"(\d{1,2}(?:[.,]5)?)[\s-]*(?:rooms?|zimmer|room apartment)\b", re.IGNORECASE
+)
+WET_ROOMS_PATTERN = re.compile(
+    r"(\d{1,2})\s*(?:wet rooms?|nasszellen?)\b", re.IGNORECASE
+)
+WET_ROOM_ITEM_PATTERN = re.compile(
+    r"(\d{1,2})\s*x\s*(?:[\w-]+\s+){0,2}?(?:bathroom|bath|shower room|wc|toilet|bad|dusche)\b",
+    re.IGNORECASE,
+)
+LIVING_AREA_PATTERN = re.compile(
+    r"(?:net living area|living area|living space|wohnfläche)[^\d\n]{0,20}"
+    + NUMBER
+    + AREA_UNIT,
+    re.IGNORECASE,
+)
+BALCONY_AREA_PATTERN = re.compile(
+    r"(?:balcony|terrace|balkon|terrasse)[^\d\n]{0,30}" + NUMBER + AREA_UNIT,
+    re.IGNORECASE,
+)
+SERVICE_CHARGES_PATTERN = re.compile(
+    r"(?:service charges|nebenkosten)[^\d\n]{0,20}" + NUMBER + r"\s*CHF",
+    re.IGNORECASE,
+)
+RENOVATION_FUND_PATTERN = re.compile(
+    r"(?:renovation fund|erneuerungsfonds)", re.IGNORECASE
+)
+CHF_AMOUNT_PATTERN = re.compile(
+    r"(?:CHF\s*" + NUMBER + r"|" + NUMBER + r"\s*CHF)", re.IGNORECASE
+)
+FLOOR_PATTERN = re.compile(
+    r"\b(ground floor|\d{1,2}(?:st|nd|rd|th)\s+floor|attic|basement)\b",
+    re.IGNORECASE,
+)
+
+EXTRACTION_SYSTEM_PROMPT = """You extract facts from real estate listings.
+Return ONLY a JSON object with these keys, using null when the listing does not state a value:
+{
+    "year_of_construction": int,
+    "last_renovation_year": int,
+    "rooms": float,
+    "wet_rooms": int,
+    "living_area_m2": float,
+    "balcony_area_m2": float,
+    "renovation_fund_chf": float,
+    "service_charges_chf_month": float,
+    "floor": str
+}"""
+
+
+@dataclass
+class PropertyDetails:
+    """Typed facts extracted from a property description"""
+
+    year_of_construction: Optional[int] = None
+    last_renovation_year: Optional[int] = None
+    rooms: Optional[float] = None
+    wet_rooms: Optional[int] = None
+    living_area_m2: Optional[float] = None
+    balcony_area_m2: Optional[float] = None
+    renovation_fund_chf: Optional[float] = None
+    service_charges_chf_month: Optional[float] = None
+    floor: Optional[str] = None
+    sources: Dict[str, str] = field(default_factory=dict)
+
+    def missing_fields(self) -> List[str]:
+        return [
+            f.name
+            for f in fields(self)
+            if f.name != "sources" and getattr(self, f.name) is None
+        ]
+
+    def building_age(self, year: Optional[int] = None) -> Optional[int]:
+        """Years since construction, the upper bound for any element's age"""
+        if self.year_of_construction is None:
+            return None
+        return max(0, (year or datetime.now().year) - self.year_of_construction)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _to_number(text: str) -> float:
+    text = text.replace("'", "").replace("’", "")
+    # "194,000" is a thousands separator, "5,5" a decimal comma
+    if re.fullmatch(r"\d{1,3}(?:,\d{3})+", text):
+        text = text.replace(",", "")
+    return float(text.replace(",", "."))
+
+
+def _first(pattern, text):
+    match = pattern.search(text)
+    return match.group(1) if match else None
+
+
+def _parse_build_year(text: str) -> Optional[int]:
+    this_year = datetime.now().year
+    for pattern in BUILD_YEAR_PATTERNS:
+        for match in pattern.finditer(text):
+            year = int(match.group(1))
+            if year <= this_year:
+                return year
+    return None
+
+
+def _parse_wet_rooms(text: str) -> Optional[int]:
+    explicit = _first(WET_ROOMS_PATTERN, text)
+    if explicit:
+        return int(explicit)
+    counts = [int(m.group(1)) for m in WET_ROOM_ITEM_PATTERN.finditer(text)]
+    return sum(counts) if counts else None
+
+
+def _parse_renovation_fund(text: str) -> Optional[float]:
+    """Sums the CHF amounts listed after the last renovation fund heading"""
+    matches = list(RENOVATION_FUND_PATTERN.finditer(text))
+    if not matches:
+        return None
+    block = text[matches[-1].end() :]
+    amounts = [
+        _to_number(m.group(1) or m.group(2)) for m in CHF_AMOUNT_PATTERN.finditer(block)
+    ]
+    return sum(amounts) if amounts else None
+
+
+def parse_description_rules(text: str) -> PropertyDetails:
+    """Extract property facts using regular expressions only (no model call)"""
+    details = PropertyDetails()
+
+    details.year_of_construction = _parse_build_year(text)
+    renovation_years = [int(y) for y in RENOVATION_YEAR_PATTERN.findall(text)]
+    if renovation_years:
+        details.last_renovation_year = max(renovation_years)
+
+    rooms = _first(ROOMS_PATTERN, text)
+    if rooms:
+        details.rooms = _to_number(rooms)
+
+    details.wet_rooms = _parse_wet_rooms(text)
+
+    living_area = _first(LIVING_AREA_PATTERN, text)
+    if living_area:
+        details.living_area_m2 = _to_number(living_area)
+
+    balcony_area = _first(BALCONY_AREA_PATTERN, text)
+    if balcony_area:
+        details.balcony_area_m2 = _to_number(balcony_area)
+
+    service_charges = _first(SERVICE_CHARGES_PATTERN, text)
+    if service_charges:
+        details.service_charges_chf_month = _to_number(service_charges)
+
+    details.renovation_fund_chf = _parse_renovation_fund(text)
+
+    floor = _first(FLOOR_PATTERN, text)
+    if floor:
+        details.floor = floor.lower()
+
+    for name in PropertyDetails.__dataclass_fields__:
+        if name != "sources" and getattr(details, name) is not None:
+            details.sources[name] = "rules"
+    return details
+
+
+def _fill_with_llm(details: PropertyDetails, text: str, api_key: str) -> None:
+    """Ask Apertus for the fields the rules could not find"""
+    from apertus_client import analyze_description
+
+    response = analyze_description(
+        text, api_key, system_prompt=EXTRACTION_SYSTEM_PROMPT
+    )
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    if not match:
+        return
+    try:
+        extracted = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return
+
+    for name in details.missing_fields():
+        value = extracted.get(name)
+        if value is None:
+            continue
+        try:
+            if name == "floor":
+                value = str(value)
+            elif name in ("year_of_construction", "last_renovation_year", "wet_rooms"):
+                value = int(value)
+            else:
+                value = float(value)
+        except (TypeError, ValueError):
+            continue
+        setattr(details, name, value)
+        details.sources[name] = "llm"
+
+
+def parse_description(
+    text: str, api_key: Optional[str] = None, use_llm: bool = False
+) -> PropertyDetails:
+    """
+    Parse a property description into typed fields.
+    The LLM fallback is only used when `use_llm` is set and rules left gaps.
+    """
+    details = parse_description_rules(text)
+    if use_llm and api_key and details.missing_fields():
+        try:
+            _fill_with_llm(details, text, api_key)
+        except Exception as e:
+            print(f"LLM fallback failed: {e}")
+    return details
+
+
+def parse_descriptions(texts: List[str]) -> List[PropertyDetails]:
+    """Bulk rule-based parsing, suitable for large description corpora"""
+    return [parse_description_rules(text) for text in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract structured fields from property descriptions"
+    )
+    parser.add_argument("paths", nargs="+", help="Description files or folders")
+    parser.add_argument("--output", "-o", help="Write results as JSONL")
+    parser.add_argument(
+        "--llm", action="store_true", help="Fill missing fields with Apertus"
+    )
+    args = parser.parse_args()
+
+    files = []
+    for path in map(Path, args.paths):
+        files.extend(sorted(path.glob("*.txt")) if path.is_dir() else [path])
+
+    api_key = None
+    if args.llm:
+        import os
+
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.getenv("APERTUS_SWISSCOM_API_KEY")
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for file in files:
+            details = parse_description(
+                file.read_text(encoding="utf-8"), api_key=api_key, use_llm=args.llm
+            )
+            record = {"file": str(file), **details.to_dict()}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Nearest-neighbour reuse of renovation estimates
+-----------------------------------------------
+Every photo used to pay a full analyze_photo_with_gemini call, although most
+kitchens and bathrooms look like one already analysed for another listing.
+EstimateIndex keeps one embedding per analysed photo (the local room
+classifier's colour/layout/texture features) with its renovation result, in
+a flat NumPy index shared by all properties. For a new photo the k nearest
+results of the same category are looked up with one matrix product:
+
+- at a similarity of ESTIMATE_REUSE_SIMILARITY or more the stored estimate
+  is served without calling the model;
+- otherwise neighbours above ESTIMATE_CALIBRATION_SIMILARITY are added to
+  the prompt as calibration examples, which keeps cost estimates of alike
+  rooms consistent across the portfolio.
+
+The index is enabled by ESTIMATE_INDEX_PATH and grows with every fresh
+analysis; build it from stored results with the CLI.
+
+Usage:
+    index = EstimateIndex.from_env()
+    neighbours = index.nearest(embed_photo(image), "Kitchen", k=3)
+
+    python estimate_index.py build properties/ --index estimate_index.npz
+    python estimate_index.py query photo.jpg --category Kitchen
+"""
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_hash import file_hash
+from local_room_classifier import (
+    GRID,
+    HUE_BINS,
+    ORIENTATION_BINS,
+    SATURATION_BINS,
+    VALUE_BINS,
+    extract_features,
+    open_for_features,
+)
+from property_manifest import RESULT_CACHE_NAME, load_json
+
+DEFAULT_REUSE_SIMILARITY = 0.98
+DEFAULT_CALIBRATION_SIMILARITY = 0.9
+DEFAULT_NEIGHBOURS = 3
+
+# Colour histogram, colour layout, texture; edge statistics are left out
+FEATURE_BLOCKS = [
+    HUE_BINS * SATURATION_BINS * VALUE_BINS,
+    GRID * GRID * 3,
+    4 * ORIENTATION_BINS,
+]
+
+
+def embed_photo(image: Image.Image) -> np.ndarray:
+    """
+    Unit-length embedding of a photo. Each feature block is normalised on
+    its own so the colour layout does not outweigh colour and texture.
+    """
+    features = extract_features(image)
+    blocks = np.split(features, np.cumsum(FEATURE_BLOCKS))[: len(FEATURE_BLOCKS)]
+    vector = np.concatenate(
+        [block / (np.linalg.norm(block) + 1e-6) for block in blocks]
+    )
+    return (vector / (np.linalg.norm(vector) + 1e-6)).astype(np.float32)
+
+
+def embed_photo_file(path) -> np.ndarray:
+    with open_for_features(path) as image:
+        return embed_photo(image)
+
+
+def calibration_examples(neighbours: List[Tuple[float, Dict]]) -> str:
+    """Prompt block summarising the neighbours' assessments"""
+    lines = [
+        "CALIBRATION: assessments of the most similar photos analysed before "
+        "(similarity in brackets). Keep your estimates consistent with them "
+        "where this photo shows the same condition:"
+    ]
+    for similarity, result in neighbours:
+        age = result.get("age_assessment") or {}
+        prediction = result.get("renovation_prediction") or {}
+        costs = result.get("cost_analysis") or {}
+        immediate = (costs.get("immediate_repairs") or {}).get("estimated_cost_chf")
+        future = (costs.get("future_renovation") or {}).get("estimated_cost_chf")
+        condition = (result.get("photo_analysis") or {}).get("overall_condition")
+        lines.append(
+            f"- [{similarity:.2f}] condition {condition}, "
+            f"{age.get('estimated_years_since_renovation')} years since renovation, "
+            f"renovation in {prediction.get('years_until_renovation_needed')} years "
+            f"({prediction.get('urgency_level')}), immediate repairs {immediate} CHF, "
+            f"future renovation {future} CHF"
+        )
+    return "\n".join(lines)
+
+
+class EstimateIndex:
+    """Flat index of photo embeddings -> renovation results, per category"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        reuse_similarity: float = DEFAULT_REUSE_SIMILARITY,
+        calibration_similarity: float = DEFAULT_CALIBRATION_SIMILARITY,
+        neighbours: int = DEFAULT_NEIGHBOURS,
+    ):
+        self.path = path
+        self.reuse_similarity = reuse_similarity
+        self.calibration_similarity = calibration_similarity
+        self.neighbours = neighbours
+        self.keys: List[str] = []
+        self.categories: List[str] = []
+        self.results: List[Dict] = []
+        self.vectors = np.zeros((0, sum(FEATURE_BLOCKS)), dtype=np.float32)
+        self.positions: Dict[str, int] = {}
+        self.added: List[str] = []
+        # Photos of one analyzer run are looked up and added from many threads
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    @classmethod
+    def from_env(cls) -> Optional["EstimateIndex"]:
+        """Index at ESTIMATE_INDEX_PATH, or None when reuse is not enabled"""
+        path = os.getenv("ESTIMATE_INDEX_PATH")
+        if not path:
+            return None
+        reuse = os.getenv("ESTIMATE_REUSE_SIMILARITY")
+        calibration = os.getenv("ESTIMATE_CALIBRATION_SIMILARITY")
+        return cls(
+            path,
+            reuse_similarity=float(reuse) if reuse else DEFAULT_REUSE_SIMILARITY,
+            calibration_similarity=(
+                float(calibration) if calibration else DEFAULT_CALIBRATION_SIMILARITY
+            ),
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _load(self, path: str):
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            keys = [str(key) for key in data["keys"]]
+            categories = [str(category) for category in data["categories"]]
+            results = [json.loads(str(result)) for result in data["results"]]
+        for key, category, vector, result in zip(keys, categories, vectors, results):
+            self._put(key, category, vector, result)
+
+    def _put(self, key: str, category: str, vector: np.ndarray, result: Dict):
+        with self.lock:
+            self._put_locked(key, category, vector, result)
+
+    def _put_locked(self, key: str, category: str, vector: np.ndarray, result: Dict):
+        position = self.positions.get(key)
+        if position is None:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            self.categories.append(category)
+            self.results.append(result)
+            self.vectors = np.vstack([self.vectors, vector[None, :]])
+        else:
+            self.categories[position] = category
+            self.results[position] = result
+            self.vectors[position] = vector
+
+    def add(self, key: str, category: str, vector: np.ndarray, result: Dict):
+        """Store (or replace) the result of the photo with content hash `key`"""
+        with self.lock:
+            self._put_locked(key, category, vector, result)
+            self.added.append(key)
+
+    def nearest(
+        self, vector: np.ndarray, category: str, k: Optional[int] = None
+    ) -> List[Tuple[float, Dict]]:
+        """Up to k (similarity, result) pairs of the category, most similar first"""
+        k = k or self.neighbours
+        with self.lock:
+            candidates = np.flatnonzero(np.array(self.categories) == category)
+            if candidates.size == 0:
+                return []
+            similarities = self.vectors[candidates] @ vector
+        order = np.argsort(-similarities)[:k]
+        return [(float(similarities[i]), self.results[candidates[i]]) for i in order]
+
+    def lookup(
+        self, vector: np.ndarray, category: str
+    ) -> Tuple[Optional[Dict], List[Tuple[float, Dict]]]:
+        """
+        (reusable result, calibration neighbours): a result when the closest
+        photo is similar enough to serve its estimate, else the neighbours
+        worth showing the model.
+        """
+        neighbours = self.nearest(vector, category)
+        if neighbours and neighbours[0][0] >= self.reuse_similarity:
+            similarity, result = neighbours[0]
+            return {**result, "reused_similarity": round(similarity, 4)}, []
+        return None, [n for n in neighbours if n[0] >= self.calibration_similarity]
+
+    def save(self, path: Optional[str] = None):
+        """
+        Write through a temporary file, merged with entries other processes
+        saved since this index was loaded (last writer wins per photo).
+        """
+        path = path or self.path
+        if os.path.exists(path):
+            merged = EstimateIndex(path)
+            for key in dict.fromkeys(self.added):
+                position = self.positions[key]
+                merged._put(
+                    key,
+                    self.categories[position],
+                    self.vectors[position],
+                    self.results[position],
+                )
+        else:
+            merged = self
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                vectors=merged.vectors,
+                keys=np.array(merged.keys, dtype=str),
+                categories=np.array(merged.categories, dtype=str),
+                results=np.array(
+                    [json.dumps(r, ensure_ascii=False) for r in merged.results],
+                    dtype=str,
+                ),
+            )
+        os.replace(tmp_path, path)
+        self.added = []
+
+
+def build_index(index: EstimateIndex, properties_dir: str) -> int:
+    """Add the stored renovation results of every property whose photo exists"""
+    added = 0
+    for cache_path in sorted(Path(properties_dir).glob(f"*/{RESULT_CACHE_NAME}")):
+        for result in load_json(cache_path, {}).values():
+            photo_path = Path(result.get("photo_path", ""))
+            if "error" in result or "reused_similarity" in result:
+                continue
+            if not result.get("category") or not photo_path.is_file():
+                continue
+            key = file_hash(photo_path.read_bytes())
+            index.add(key, result["category"], embed_photo_file(photo_path), result)
+            added += 1
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or query the index of stored renovation estimates"
+    )
+    parser.add_argument(
+        "--index", default=os.getenv("ESTIMATE_INDEX_PATH", "estimate_index.npz")
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index stored results of properties")
+    build.add_argument("properties_dir", nargs="?", default="properties")
+    query = commands.add_parser("query", help="Show the neighbours of a photo")
+    query.add_argument("photo")
+    query.add_argument("--category", required=True, help="CSV category")
+    query.add_argument("-k", type=int, default=DEFAULT_NEIGHBOURS)
+    args = parser.parse_args()
+
+    index = EstimateIndex(args.index)
+    if args.command == "build":
+        added = build_index(index, args.properties_dir)
+        index.save()
+        print(f"Indexed {added} analyses, {len(index)} photos in {args.index}")
+        return
+
+    for similarity, result in index.nearest(
+        embed_photo_file(args.photo), args.category, args.k
+    ):
+        costs = result.get("cost_analysis") or {}
+        future = (costs.get("future_renovation") or {}).get("estimated_cost_chf")
+        print(
+            f"{similarity:.3f}  {Path(result['photo_path']).name}  future {future} CHF"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Local OpenAI-compatible stand-in for the Apertus endpoint
+---------------------------------------------------------
+Serves POST /v1/chat/completions (streaming and non-streaming) with a canned
+answer so the description analysis can be exercised without network access.
+
+Usage:
+    python fake_apertus.py --port 8765
+    APERTUS_BASE_URL=http://127.0.0.1:8765/v1 python -m streamlit run streamlit-image-uploader/app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = (
+    "- Built in 2002.\n"
+    "- No renovations are mentioned in the description.\n"
+    "- 5.5 rooms, one bathroom and one guest WC, approx. 124 m2 net living area.\n"
+    "- The renovation fund looks healthy for a building of this age.\n"
+    "- Expect kitchen and bathroom refurbishment within the next 5-10 years."
+)
+
+
+def _split_tokens(text):
+    """Splits text into word-sized chunks, keeping the whitespace."""
+    tokens = []
+    current = ""
+    for char in text:
+        current += char
+        if char in " \n":
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+class FakeApertusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(request)
+
+        model = request.get("model", "fake-apertus")
+        created = int(time.time())
+        text = self.server.response_text
+
+        if not request.get("stream"):
+            self._send_json(
+                200,
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        for token in _split_tokens(text) + [None]:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": token} if token else {},
+                        "finish_reason": None if token else "stop",
+                    }
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if token and self.server.token_delay:
+                time.sleep(self.server.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeApertusServer:
+    """
+    Runs the stand-in on a background thread.
+
+        with FakeApertusServer() as server:
+            analyze_description(text, "test-key", base_url=server.base_url)
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, response_text=DEFAULT_RESPONSE, token_delay=0.0
+    ):
+        self.httpd = ThreadingHTTPServer((host, port), FakeApertusHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.response_text = response_text
+        self.httpd.token_delay = token_delay
+        self.httpd.requests = []
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Apertus stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--token-delay", type=float, default=0.02, help="Seconds between tokens"
+    )
+    args = parser.parse_args()
+
+    server = FakeApertusServer(args.host, args.port, token_delay=args.token_delay)
+    print(f"Fake Apertus listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Recorded-response fake model backend
+------------------------------------
+Replays responses from benchmark_fixtures/responses.json in place of Gemini,
+the Vision object-localisation endpoint and Apertus, with configurable
+latency and error-rate distributions, so the pipeline can be measured on a
+plain Linux box without network access.
+
+Responses recorded for a specific image take precedence over the per-task
+defaults. They are keyed by the image's pHash, so a photo matches its
+fixtures whether it was decoded by UploadManager, resized by the CLI or
+re-encoded; crops (high-resolution tiles) fall back to the defaults. Record
+new fixtures against the live APIs with `python benchmark.py --record`.
+
+Usage:
+    backend = FakeBackend(LatencyModel(median_s=0.8, p95_s=2.5, error_rate=0.02))
+    with backend.install():
+        analyze_image_problems(image, "fake-key")
+    print(backend.calls)
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from image_hash import DEFAULT_THRESHOLD, hamming_distance, phash
+
+DEFAULT_FIXTURES = Path(__file__).parent / "benchmark_fixtures" / "responses.json"
+
+# Prompt fragments identifying which pipeline stage a request belongs to
+TASK_MARKERS = [
+    ("analyze_tile", "close-up crop"),
+    ("analyze_photo_with_gemini", "ANALYSIS TASKS"),
+    ("categorize_image", "categorize this image"),
+    ("analyze_image_problems_located", "normalised to the whole image"),
+    ("analyze_image_problems", "find any problems"),
+]
+
+
+class FakeBackendError(Exception):
+    """Injected failure, standing in for a 429/5xx from the real API"""
+
+
+class LatencyModel:
+    """Log-normal latency given its median and 95th percentile, plus an error rate"""
+
+    def __init__(
+        self,
+        median_s: float = 0.0,
+        p95_s: Optional[float] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.median_s = median_s
+        p95_s = p95_s if p95_s is not None else median_s
+        self.sigma = math.log(p95_s / median_s) / 1.645 if median_s > 0 else 0.0
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.median_s <= 0:
+            return 0.0
+        with self.lock:
+            return self.random.lognormvariate(math.log(self.median_s), self.sigma)
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def wait(self, task: str):
+        time.sleep(self.sample())
+        if self.should_fail():
+            raise FakeBackendError(f"Injected failure for {task}")
+
+    async def wait_async(self, task: str):
+        await asyncio.sleep(self.sample())
+        if self.should_fail():
+            raise FakeBackendError(f"Injected failure for {task}")
+
+
+class Fixtures:
+    """Recorded responses per task, falling back to per-task defaults"""
+
+    def __init__(self, path=DEFAULT_FIXTURES):
+        self.path = Path(path)
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.defaults: Dict = data.get("defaults", {})
+        self.recorded: Dict[str, Dict[str, object]] = data.get("recorded", {})
+        self.match_bits = DEFAULT_THRESHOLD
+        self.lock = threading.Lock()
+
+    def lookup(self, task: str, key: Optional[str]):
+        recorded = self.recorded.get(task, {})
+        if key:
+            if key in recorded:
+                return recorded[key]
+            value = int(key, 16)
+            distance, closest = min(
+                ((hamming_distance(value, int(k, 16)), k) for k in recorded),
+                default=(None, None),
+            )
+            if closest is not None and distance <= self.match_bits:
+                return recorded[closest]
+        default = self.defaults.get(task, self.defaults.get("analyze_image", ""))
+        if isinstance(default, list):
+            # Spread images deterministically over the listed answers
+            index = int(key, 16) % len(default) if key else 0
+            return default[index]
+        return default
+
+    def record(self, task: str, key: Optional[str], response):
+        if not key:
+            return
+        with self.lock:
+            self.recorded.setdefault(task, {})[key] = response
+
+    def save(self, path=None):
+        with open(path or self.path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"defaults": self.defaults, "recorded": self.recorded},
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+
+
+def fixture_key(image) -> Optional[str]:
+    """pHash of a PIL image as 16 hex digits, None without an image"""
+    if image is None or not hasattr(image, "tobytes"):
+        return None
+    return f"{phash(image):016x}"
+
+
+def detect_task(prompt: str) -> str:
+    for task, marker in TASK_MARKERS:
+        if marker in prompt:
+            return task
+    return "analyze_image"
+
+
+def _split_contents(contents):
+    prompt = " ".join(c for c in contents if isinstance(c, str))
+    images = [c for c in contents if hasattr(c, "tobytes")]
+    return prompt, images[0] if images else None
+
+
+def _fake_response(text: str, prompt: str):
+    return SimpleNamespace(
+        text=text,
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=len(prompt) // 4 + 258,  # 258 tokens per image
+            candidates_token_count=len(text) // 4,
+        ),
+    )
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel answering from fixtures"""
+
+    def __init__(self, backend: "FakeBackend", model_name: str = "fake"):
+        self.backend = backend
+        self.model_name = model_name
+
+    def _answer(self, prompt, image, task):
+        text = self.backend.fixtures.lookup(task, fixture_key(image))
+        if task == "analyze_photo_with_gemini":
+            category = re.search(r'from the "(.+?)" category', prompt)
+            text = text.replace("{category}", category.group(1) if category else "")
+        return _fake_response(text, prompt)
+
+    def generate_content(self, contents, **kwargs):
+        prompt, image = _split_contents(contents)
+        task = detect_task(prompt)
+        self.backend.count(task)
+        self.backend.latency.wait(task)
+        return self._answer(prompt, image, task)
+
+    async def generate_content_async(self, contents, **kwargs):
+        prompt, image = _split_contents(contents)
+        task = detect_task(prompt)
+        self.backend.count(task)
+        await self.backend.latency.wait_async(task)
+        return self._answer(prompt, image, task)
+
+
+class _FakeHTTPResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeRequests:
+    """Stands in for the `requests` module used by the Vision calls"""
+
+    def __init__(self, backend: "FakeBackend"):
+        self.backend = backend
+
+    def post(self, url, json=None, **kwargs):
+        self.backend.count("vision")
+        try:
+            self.backend.latency.wait("vision")
+        except FakeBackendError as e:
+            return _FakeHTTPResponse({"error": {"message": str(e)}}, status_code=503)
+        return _FakeHTTPResponse(self.backend.fixtures.defaults["vision"])
+
+
+class FakeAsyncHTTPClient:
+    """Stands in for the pooled httpx.AsyncClient of the async Vision calls"""
+
+    def __init__(self, backend: "FakeBackend"):
+        self.backend = backend
+
+    async def post(self, url, json=None, **kwargs):
+        self.backend.count("vision")
+        try:
+            await self.backend.latency.wait_async("vision")
+        except FakeBackendError as e:
+            return _FakeHTTPResponse({"error": {"message": str(e)}}, status_code=503)
+        return _FakeHTTPResponse(self.backend.fixtures.defaults["vision"])
+
+
+class FakeBackend:
+    """Counts calls per task and patches the pipeline modules while installed"""
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        fixtures: Optional[Fixtures] = None,
+    ):
+        self.latency = latency or LatencyModel()
+        self.fixtures = fixtures or Fixtures()
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, task: str):
+        with self.lock:
+            self.calls[task] += 1
+
+    def model(self, model_name: str = "fake", **kwargs):
+        return FakeGenerativeModel(self, model_name)
+
+    @contextmanager
+    def install(self, apertus_token_delay: float = 0.0):
+        """Patch genai, the Vision clients and the Apertus base url"""
+        import os
+
+        import google.generativeai as genai
+
+        import nano_edit
+        from fake_apertus import FakeApertusServer
+
+        saved = (
+            genai.GenerativeModel,
+            genai.configure,
+            nano_edit.requests,
+            nano_edit.get_http_client,
+        )
+        saved_base_url = os.environ.get("APERTUS_BASE_URL")
+        server = FakeApertusServer(token_delay=apertus_token_delay).start()
+
+        genai.GenerativeModel = self.model
+        genai.configure = lambda **kwargs: None
+        nano_edit.requests = FakeRequests(self)
+        nano_edit.get_http_client = lambda: FakeAsyncHTTPClient(self)
+        os.environ["APERTUS_BASE_URL"] = server.base_url
+        try:
+            yield self
+        finally:
+            (
+                genai.GenerativeModel,
+                genai.configure,
+                nano_edit.requests,
+                nano_edit.get_http_client,
+            ) = saved
+            if saved_base_url is None:
+                os.environ.pop("APERTUS_BASE_URL", None)
+            else:
+                os.environ["APERTUS_BASE_URL"] = saved_base_url
+            server.stop()
+
+
+class RecordingModel:
+    """Wraps a real genai model and stores its answers as fixtures"""
+
+    def __init__(self, model, fixtures: Fixtures):
+        self.model = model
+        self.fixtures = fixtures
+        self.model_name = getattr(model, "model_name", "recorded")
+
+    def generate_content(self, contents, **kwargs):
+        response = self.model.generate_content(contents, **kwargs)
+        prompt, image = _split_contents(contents)
+        self.fixtures.record(detect_task(prompt), fixture_key(image), response.text)
+        return response
+
+    async def generate_content_async(self, contents, **kwargs):
+        response = await self.model.generate_content_async(contents, **kwargs)
+        prompt, image = _split_contents(contents)
+        self.fixtures.record(detect_task(prompt), fixture_key(image), response.text)
+        return response
+
+
+@contextmanager
+def recording(fixtures: Fixtures):
+    """Patch genai so every live response is captured into `fixtures`"""
+    import google.generativeai as genai
+
+    original = genai.GenerativeModel
+    genai.GenerativeModel = lambda *args, **kwargs: RecordingModel(
+        original(*args, **kwargs), fixtures
+    )
+    try:
+        yield fixtures
+    finally:
+        genai.GenerativeModel = original
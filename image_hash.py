@@ -0,0 +1,199 @@
+"""
+Perceptual hashing of listing photos
+------------------------------------
+Computes 64-bit pHash / dHash fingerprints with NumPy and clusters
+near-duplicate uploads (re-exports, highlighted copies, resized versions) so
+each cluster only goes through the model pipeline once.
+
+Usage:
+    python image_hash.py photos/ test_dataset/ --threshold 10
+"""
+
+import argparse
+import hashlib
+from pathlib import Path
+from typing import Dict, Hashable, List
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+HASH_SIZE = 8
+PHASH_SIZE = 32
+DEFAULT_THRESHOLD = 10
+
+_dct_matrices = {}
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, cached per size"""
+    if n not in _dct_matrices:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        matrix[0] /= np.sqrt(2.0)
+        _dct_matrices[n] = matrix
+    return _dct_matrices[n]
+
+
+def _grayscale(image: Image.Image, size) -> np.ndarray:
+    return np.asarray(
+        image.convert("L").resize(size, Image.Resampling.LANCZOS), dtype=np.float64
+    )
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def phash(image: Image.Image) -> int:
+    """DCT-based perceptual hash, robust to resizing, re-encoding and small edits"""
+    pixels = _grayscale(image, (PHASH_SIZE, PHASH_SIZE))
+    dct = _dct_matrix(PHASH_SIZE)
+    coefficients = (dct @ pixels @ dct.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes overall brightness
+    median = np.median(coefficients.ravel()[1:])
+    return _bits_to_int(coefficients > median)
+
+
+def dhash(image: Image.Image) -> int:
+    """Gradient hash comparing horizontally adjacent pixels"""
+    pixels = _grayscale(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def content_hash(image: Image.Image) -> str:
+    """Exact hash of the decoded pixels, for caching per image"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def file_hash(data: bytes) -> str:
+    """Exact hash of encoded file bytes, cheaper than decoding"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+class PerceptualHashIndex:
+    """
+    Incremental index of perceptual hashes.
+
+    Every added image joins the cluster of the closest existing image within
+    `threshold` bits, otherwise it starts a new cluster whose representative is
+    the image itself.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, method: str = "phash"):
+        if method not in ("phash", "dhash"):
+            raise ValueError(f"Unknown hash method: {method}")
+        self.threshold = threshold
+        self.hash_function = phash if method == "phash" else dhash
+        self.keys: List[Hashable] = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.cluster_of: Dict[Hashable, int] = {}
+        self.representatives: List[Hashable] = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def nearest(self, value: int):
+        """Returns (key, distance) of the closest indexed hash, or (None, None)"""
+        if not self.keys:
+            return None, None
+        distances = _popcount(self.hashes ^ np.uint64(value))
+        best = int(np.argmin(distances))
+        return self.keys[best], int(distances[best])
+
+    def add_hash(self, key: Hashable, value: int) -> int:
+        """Index a precomputed hash and return its cluster id"""
+        match, distance = self.nearest(value)
+        if match is not None and distance <= self.threshold:
+            cluster = self.cluster_of[match]
+        else:
+            cluster = len(self.representatives)
+            self.representatives.append(key)
+
+        self.keys.append(key)
+        self.hashes = np.append(self.hashes, np.uint64(value))
+        self.cluster_of[key] = cluster
+        return cluster
+
+    def add(self, key: Hashable, image: Image.Image) -> int:
+        """Hash and index an image, returning its cluster id"""
+        return self.add_hash(key, self.hash_function(image))
+
+    def representative(self, key: Hashable) -> Hashable:
+        """Key of the image whose analysis `key` can reuse"""
+        return self.representatives[self.cluster_of[key]]
+
+    def is_duplicate(self, key: Hashable) -> bool:
+        return self.representative(key) != key
+
+    def clusters(self) -> List[List[Hashable]]:
+        groups = [[] for _ in self.representatives]
+        for key in self.keys:
+            groups[self.cluster_of[key]].append(key)
+        return groups
+
+
+def cluster_images(
+    images: Dict[Hashable, Image.Image],
+    threshold: int = DEFAULT_THRESHOLD,
+    method: str = "phash",
+) -> PerceptualHashIndex:
+    """Cluster a dict of images, keeping insertion order for representatives"""
+    index = PerceptualHashIndex(threshold=threshold, method=method)
+    for key, image in images.items():
+        index.add(key, image)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate photos")
+    parser.add_argument("paths", nargs="+", help="Image files or folders")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--method", choices=["phash", "dhash"], default="phash")
+    args = parser.parse_args()
+
+    extensions = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp"}
+    files = []
+    for path in map(Path, args.paths):
+        if path.is_dir():
+            files.extend(
+                sorted(p for p in path.iterdir() if p.suffix.lower() in extensions)
+            )
+        else:
+            files.append(path)
+
+    index = PerceptualHashIndex(threshold=args.threshold, method=args.method)
+    unreadable = 0
+    for file in files:
+        try:
+            with Image.open(file) as image:
+                index.add(str(file), image)
+        except (UnidentifiedImageError, OSError) as e:
+            print(f"Unreadable, skipped: {file} ({e})")
+            unreadable += 1
+
+    clusters = index.clusters()
+    for cluster in clusters:
+        if len(cluster) > 1:
+            print(f"Near-duplicates ({len(cluster)}):")
+            for key in cluster:
+                print(f"  - {key}")
+    print(
+        f"{len(files) - unreadable} photos -> {len(clusters)} distinct clusters"
+        + (f" ({unreadable} unreadable)" if unreadable else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Shared-memory process pool for CPU-bound image work
+---------------------------------------------------
+Decoding multi-megabyte JPEGs, resizing and hashing run under the GIL, so a
+batch of photos decodes on one core however many threads call the models.
+ImagePipeline decodes in a pool of worker processes. The pixels are not
+pickled back: each worker writes the analysis buffer and the thumbnail into
+one of a fixed set of shared-memory slots created by the parent, and only
+the slot index and a few fields cross the process boundary. The number of
+slots bounds the photos in flight, so memory stays constant for any batch
+size, and decoded photos are yielded as they complete, so the caller can
+start the (network-bound) model calls while the next photos are decoded.
+
+Decoding matches UploadManager (decode_upload, pHash of the thumbnail), so
+results are the same as in the app. Daemonic processes (the job queue
+workers the app starts) cannot have children and decode inline instead.
+
+Usage:
+    with ImagePipeline(processes=8) as pipeline:
+        for photo in pipeline.decode(paths):  # completion order
+            future = submit(categorize_image_async_(photo.analysis, api_key))
+
+    python image_pipeline.py photos/ test_dataset/ --processes 8
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_hash import file_hash, phash
+from upload_manager import ANALYSIS_SIZE, THUMBNAIL_SIZE, decode_upload
+
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp"}
+SLOTS_PER_PROCESS = 2
+# Starting a worker costs about as much as decoding a few photos
+MIN_PHOTOS_PER_PROCESS = 4
+
+
+def default_processes() -> int:
+    """IMAGE_PROCESSES, else one process per core (0 decodes in the caller)"""
+    value = os.getenv("IMAGE_PROCESSES")
+    return int(value) if value else os.cpu_count() or 1
+
+
+@dataclass
+class DecodedPhoto:
+    """One decoded file, or the error that prevented decoding it"""
+
+    path: Path
+    file_hash: str = ""
+    phash: int = 0
+    original_size: Tuple[int, int] = (0, 0)
+    analysis: Optional[Image.Image] = field(default=None, repr=False)
+    thumbnail: Optional[Image.Image] = field(default=None, repr=False)
+    error: Optional[str] = None
+
+
+def slot_bytes(analysis_size=ANALYSIS_SIZE) -> int:
+    """Room for an RGB analysis buffer and the largest RGB thumbnail"""
+    return analysis_size[0] * analysis_size[1] * 3 + THUMBNAIL_SIZE**2 * 3
+
+
+def _decode(path: Path, analysis_size) -> Tuple[Dict, Image.Image, Image.Image]:
+    data = Path(path).read_bytes()
+    thumbnail, analysis, original_size = decode_upload(data, analysis_size)
+    fields = {
+        "file_hash": file_hash(data),
+        "phash": phash(thumbnail),
+        "original_size": original_size,
+        "thumbnail_size": thumbnail.size,
+    }
+    return fields, analysis, thumbnail
+
+
+# Worker side: slots are attached once per process and kept open
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if name not in _attached:
+        # Spawned workers share the parent's resource tracker, so the slot
+        # stays registered once and is unlinked by the parent alone
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    return _attached[name]
+
+
+def _decode_into_slot(path: str, slot_name: str, analysis_size) -> Dict:
+    fields, analysis, thumbnail = _decode(Path(path), analysis_size)
+    buffer = np.ndarray((slot_bytes(analysis_size),), np.uint8, _attach(slot_name).buf)
+    pixels = np.asarray(analysis, dtype=np.uint8).ravel()
+    buffer[: pixels.size] = pixels
+    thumb = np.asarray(thumbnail, dtype=np.uint8).ravel()
+    buffer[pixels.size : pixels.size + thumb.size] = thumb
+    return fields
+
+
+class ImagePipeline:
+    """Process pool decoding photos into shared-memory slots"""
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        analysis_size: Tuple[int, int] = ANALYSIS_SIZE,
+        slots: Optional[int] = None,
+    ):
+        self.processes = default_processes() if processes is None else processes
+        self.analysis_size = analysis_size
+        self.n_slots = slots or max(1, self.processes) * SLOTS_PER_PROCESS
+        self.executor = None
+        self.slots: List[shared_memory.SharedMemory] = []
+
+    @classmethod
+    def for_batch(cls, n_photos: int, **kwargs) -> "ImagePipeline":
+        """Pipeline with no more processes than the batch can keep busy"""
+        processes = min(default_processes(), n_photos // MIN_PHOTOS_PER_PROCESS)
+        return cls(processes, **kwargs)
+
+    def __enter__(self) -> "ImagePipeline":
+        if self.processes > 1 and not multiprocessing.current_process().daemon:
+            self.slots = [
+                shared_memory.SharedMemory(
+                    create=True, size=slot_bytes(self.analysis_size)
+                )
+                for _ in range(self.n_slots)
+            ]
+            # spawn: the app and the queue workers run threads, fork is unsafe
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        for memory in self.slots:
+            memory.close()
+            memory.unlink()
+        self.slots = []
+
+    def _from_slot(self, path: Path, slot: int, fields: Dict) -> DecodedPhoto:
+        width, height = self.analysis_size
+        analysis_bytes = width * height * 3
+        thumb_width, thumb_height = fields.pop("thumbnail_size")
+        buffer = self.slots[slot].buf
+        # One copy out of the slot, which is reused right after
+        analysis = Image.frombytes("RGB", self.analysis_size, buffer[:analysis_bytes])
+        thumbnail = Image.frombytes(
+            "RGB",
+            (thumb_width, thumb_height),
+            buffer[analysis_bytes : analysis_bytes + thumb_width * thumb_height * 3],
+        )
+        return DecodedPhoto(path, analysis=analysis, thumbnail=thumbnail, **fields)
+
+    def _decode_inline(self, paths: List[Path]) -> Iterator[DecodedPhoto]:
+        for path in paths:
+            try:
+                fields, analysis, thumbnail = _decode(path, self.analysis_size)
+            except Exception as e:
+                yield DecodedPhoto(path, error=f"{type(e).__name__}: {e}")
+                continue
+            fields.pop("thumbnail_size")
+            yield DecodedPhoto(path, analysis=analysis, thumbnail=thumbnail, **fields)
+
+    def decode(self, paths: Iterable[Path]) -> Iterator[DecodedPhoto]:
+        """
+        Decode `paths`, yielding each photo as soon as it is ready (completion
+        order). Without worker processes photos are decoded in the caller.
+        """
+        paths = [Path(path) for path in paths]
+        if self.executor is None:
+            yield from self._decode_inline(paths)
+            return
+
+        free = list(range(len(self.slots)))
+        queued = iter(paths)
+        running: Dict[concurrent.futures.Future, Tuple[Path, int]] = {}
+
+        def fill():
+            while free:
+                path = next(queued, None)
+                if path is None:
+                    return
+                slot = free.pop()
+                future = self.executor.submit(
+                    _decode_into_slot,
+                    str(path),
+                    self.slots[slot].name,
+                    self.analysis_size,
+                )
+                running[future] = (path, slot)
+
+        fill()
+        while running:
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                path, slot = running.pop(future)
+                try:
+                    photo = self._from_slot(path, slot, future.result())
+                except Exception as e:
+                    photo = DecodedPhoto(path, error=f"{type(e).__name__}: {e}")
+                free.append(slot)
+                fill()
+                yield photo
+
+
+def collect_photos(paths: Iterable[str]) -> List[Path]:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(
+                sorted(
+                    p for p in path.iterdir() if p.suffix.lower() in PHOTO_EXTENSIONS
+                )
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode photos in a shared-memory process pool"
+    )
+    parser.add_argument("paths", nargs="+", help="Image files or folders")
+    parser.add_argument("--processes", type=int, default=default_processes())
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the photo set")
+    args = parser.parse_args()
+
+    files = collect_photos(args.paths) * args.repeat
+    with ImagePipeline(args.processes) as pipeline:
+        start = time.perf_counter()
+        decoded = list(pipeline.decode(files))
+        elapsed = time.perf_counter() - start
+    for photo in decoded:
+        if photo.error:
+            print(f"{photo.path}: {photo.error}")
+    print(
+        f"{len(decoded)} photos with {args.processes} processes in {elapsed:.2f}s "
+        f"({len(decoded) / elapsed:.1f} photos/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
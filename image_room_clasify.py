@@ -1,10 +1,36 @@
+import asyncio
 import os
 import sys
 
-import google.generativeai as genai
 from dotenv import load_dotenv
 from PIL import Image
 
+from async_runner import run_sync
+from lazy_import import lazy_module
+from local_room_classifier import DEFAULT_CONFIDENCE, load_default_classifier
+from model_cascade import ModelCascade
+from tracing import record_usage, span, traced
+
+genai = lazy_module("google.generativeai")
+
+ROOM_CATEGORIES = [
+    "Balconies SunBlinds Conservatory",
+    "Bath Shower Wc",
+    "Building Envelope",
+    "Ceilings Walls Doors",
+    "Central Hot Water Preparation",
+    "Chimney",
+    "Community Facilities",
+    "Floor Coverings",
+    "Heating Ventilation Climate",
+    "Kitchen",
+]
+
+
+def escalate_category(category):
+    """Ask the stronger model when the answer is not one of the categories"""
+    return None if category in ROOM_CATEGORIES else "unknown category"
+
 
 def categorize_image(image_path, api_key):
     genai.configure(api_key=api_key)
@@ -26,13 +52,27 @@ def categorize_image(image_path, api_key):
 
 Category:"""
 
-    response = model.generate_content([prompt, image])
+    with span("categorize_image", model="gemini-2.5-flash", image=image_path):
+        response = model.generate_content([prompt, image])
+        record_usage(response)
     return response.text.strip()
 
 
-def categorize_image_(image, api_key):
+async def categorize_image_async_(
+    image, api_key, local_classifier=None, confidence_threshold=DEFAULT_CONFIDENCE
+):
+    # Confident local predictions skip the remote model entirely
+    if local_classifier is not None:
+        with span("categorize_image_", model="local", image=image) as s:
+            # CPU-bound, keep it off the event loop
+            category, confidence = await asyncio.to_thread(
+                local_classifier.predict, image
+            )
+            s.attributes["confidence"] = confidence
+        if confidence >= confidence_threshold:
+            return category
+
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.5-flash")
 
     prompt = """You are an expert real estate inspector. Please categorize this image into exactly ONE of the following categories. Respond with only the category name:
 
@@ -49,14 +89,44 @@ def categorize_image_(image, api_key):
 
 Category:"""
 
-    response = model.generate_content([prompt, image])
-    return response.text.strip()
-
-
-def clasify_image(image, api_key, counter=0):
-    if counter == 0:
+    async def call(model_name):
+        model = genai.GenerativeModel(model_name)
+        with span("categorize_image_", model=model_name, image=image):
+            response = await model.generate_content_async([prompt, image])
+            record_usage(response)
+        return response.text.strip()
+
+    category, _ = await ModelCascade.for_task("classify").run_async(
+        call, escalate_category
+    )
+    return category
+
+
+def categorize_image_(
+    image, api_key, local_classifier=None, confidence_threshold=DEFAULT_CONFIDENCE
+):
+    return run_sync(
+        categorize_image_async_(image, api_key, local_classifier, confidence_threshold)
+    )
+
+
+@traced("clasify_image")
+def clasify_image(
+    image,
+    api_key,
+    counter=0,
+    local_classifier=None,
+    root_folder="Categorised_photos",
+    image_name=None,
+):
+    """
+    Categorize `image` and save it into `root_folder`/<category>/. Without an
+    `image_name` photos are numbered by `counter` and the folders are cleared
+    at counter 0; a content-addressed `image_name` (see PropertyManifest)
+    keeps earlier photos so only new ones need classifying.
+    """
+    if image_name is None and counter == 0:
         # clear the files inside the folders
-        root_folder = "Categorised_photos"
         if os.path.exists(root_folder):
             for folder in os.listdir(root_folder):
                 folder_path = os.path.join(root_folder, folder)
@@ -67,13 +137,13 @@ def clasify_image(image, api_key, counter=0):
         else:
             os.makedirs(root_folder, exist_ok=True)
 
-    category = categorize_image_(image, api_key)
+    category = categorize_image_(image, api_key, local_classifier=local_classifier)
     # save the image in the corresponding folder
-    root_folder = "Categorised_photos"
     category_folder = os.path.join(root_folder, category)
     os.makedirs(category_folder, exist_ok=True)
-    image_name = f"image_{counter}.jpg"
+    image_name = image_name or f"image_{counter}.jpg"
     image.save(os.path.join(category_folder, image_name))
+    return category
 
 
 if __name__ == "__main__":
@@ -85,5 +155,9 @@ if __name__ == "__main__":
     image_path = sys.argv[1]
     api_key = os.getenv("GOOGLE_API_KEY")
 
-    result = categorize_image(image_path, api_key)
+    local_classifier = load_default_classifier()
+    if local_classifier is not None:
+        result = categorize_image_(Image.open(image_path), api_key, local_classifier)
+    else:
+        result = categorize_image(image_path, api_key)
     print(f"Category: {result}")
@@ -0,0 +1,447 @@
+"""
+HTTP inspection service
+-----------------------
+A small ASGI application exposing the analysis pipeline as a JSON API for
+programmatic clients such as the listing ingestion system:
+
+    POST /v1/classify    {"image": "<base64>"}                  -> {"category"}
+    POST /v1/problems    {"image": "<base64>"}                  -> {"problems"}
+    POST /v1/anomalies   {"image": "<base64>", "targets": [..]} -> {"image"}
+    POST /v1/renovation  {"images": ["<base64>", ..], "description": "..."}
+                                                -> {"results", "totals", "summary"}
+    GET  /metrics        Prometheus metrics (pipeline stages and service queue)
+    GET  /healthz
+
+Identical concurrent requests (same endpoint, image hash and parameters) are
+coalesced into one in-flight computation. Computations run at most
+`max_concurrency` at a time; once `max_pending` are queued or running, new
+ones are rejected with 503 and a Retry-After header instead of piling up.
+
+Usage:
+    python inspection_service.py --port 8000
+    uvicorn inspection_service:app --port 8000
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from description_parser import parse_description
+from image_hash import file_hash
+from image_room_clasify import categorize_image_async_
+from lazy_import import lazy_module
+from local_room_classifier import load_default_classifier
+from nano_edit import detect_and_draw_async_
+from price_analasys import DEFAULT_MAX_WORKERS, RenovationAnalyzer
+from rate_limit import RateLimiter
+from real_estate_problem_analyzer import analyze_image_problems_async
+from tracing import record_cache_hit, trace_listing, tracer
+from upload_manager import decode_upload
+
+cv2 = lazy_module("cv2")
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_MAX_PENDING = 256
+MAX_BODY_BYTES = 64 * 2**20
+DEFAULT_TARGETS = ["couch", "sofa", "chair", "bathtub", "Countertop", "roof", "Window"]
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Overloaded(HTTPError):
+    def __init__(self):
+        super().__init__(503, "Service overloaded, retry later", {"retry-after": "5"})
+
+
+class Coalescer:
+    """
+    Shares one in-flight task between identical requests and bounds the
+    number of computations queued or running.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.in_flight: Dict[tuple, asyncio.Task] = {}
+        self.running = 0
+        self.coalesced = Counter()
+        self.rejected = Counter()
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.in_flight) - self.running
+
+    async def _run(self, key: tuple, factory):
+        try:
+            async with self.semaphore:
+                self.running += 1
+                try:
+                    return await factory()
+                finally:
+                    self.running -= 1
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def run(self, key: tuple, factory):
+        """Await the computation for `key`, starting it with `factory()` if needed"""
+        endpoint = key[0]
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced[endpoint] += 1
+            record_cache_hit(f"service_{endpoint}", coalesced=True)
+        else:
+            if len(self.in_flight) >= self.max_pending:
+                self.rejected[endpoint] += 1
+                raise Overloaded()
+            task = asyncio.ensure_future(self._run(key, factory))
+            self.in_flight[key] = task
+        # A disconnecting client must not cancel the work other requests share
+        return await asyncio.shield(task)
+
+
+def _decode_image(encoded: str):
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (ValueError, TypeError):
+        raise HTTPError(400, "Images must be base64 encoded")
+    return data
+
+
+async def _analysis_image(data: bytes):
+    """The 512x512 analysis buffer the app also uses, decoded off the loop"""
+    try:
+        _, analysis, _ = await asyncio.to_thread(decode_upload, data)
+    except Exception as e:
+        raise HTTPError(400, f"Could not decode image: {e}")
+    return analysis
+
+
+class InspectionService:
+    """ASGI application; one instance serves all requests"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        vision_api_key: Optional[str] = None,
+        csv_path: str = "life_span_detailed_table.csv",
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        load_dotenv()
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        self.vision_api_key = vision_api_key or self.api_key
+        self.csv_path = csv_path
+        self.local_classifier = load_default_classifier()
+        self.coalescer = Coalescer(max_concurrency, max_pending)
+        # One Gemini quota shared by all renovation requests
+        self.rate_limiter = RateLimiter.from_env(
+            "GEMINI_REQUESTS_PER_MINUTE", burst=DEFAULT_MAX_WORKERS
+        )
+        # Built on the first renovation request, then copied per listing
+        self.analyzer: Optional[RenovationAnalyzer] = None
+        self.analyzer_lock = asyncio.Lock()
+        self.responses = Counter()
+        self.routes = {
+            ("POST", "/v1/classify"): self.classify,
+            ("POST", "/v1/problems"): self.problems,
+            ("POST", "/v1/anomalies"): self.anomalies,
+            ("POST", "/v1/renovation"): self.renovation,
+            ("GET", "/metrics"): self.metrics,
+            ("GET", "/healthz"): self.healthz,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        handler = self.routes.get((scope["method"], path))
+        headers = {}
+        try:
+            if handler is None:
+                if any(route_path == path for _, route_path in self.routes):
+                    raise HTTPError(405, "Method not allowed")
+                raise HTTPError(404, "Not found")
+            body = await self.read_body(receive) if scope["method"] == "POST" else b""
+            status, content_type, payload = await handler(body, scope)
+        except HTTPError as e:
+            status, content_type = e.status, "application/json"
+            payload = json.dumps({"error": str(e)}).encode("utf-8")
+            headers = e.headers
+        except Exception as e:
+            # Upstream model or API failure
+            status, content_type = 502, "application/json"
+            payload = json.dumps({"error": f"{type(e).__name__}: {e}"}).encode("utf-8")
+
+        self.responses[(path, status)] += 1
+        raw_headers = [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(payload)).encode("latin-1")),
+        ] + [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+        await send(
+            {"type": "http.response.start", "status": status, "headers": raw_headers}
+        )
+        await send({"type": "http.response.body", "body": payload})
+
+    async def read_body(self, receive) -> bytes:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "Client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    def parse_json(body: bytes) -> Dict:
+        try:
+            request = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return request
+
+    def single_image(self, request: Dict) -> bytes:
+        if not isinstance(request.get("image"), str):
+            raise HTTPError(400, "Missing 'image' (base64)")
+        return _decode_image(request["image"])
+
+    async def respond(self, endpoint: str, key: tuple, request: Dict, factory):
+        with trace_listing(request.get("listing_id")):
+            result = await self.coalescer.run((endpoint,) + key, factory)
+        return 200, "application/json", json.dumps(result).encode("utf-8")
+
+    async def classify(self, body: bytes, scope):
+        request = self.parse_json(body)
+        data = self.single_image(request)
+
+        async def compute():
+            image = await _analysis_image(data)
+            category = await categorize_image_async_(
+                image, self.api_key, local_classifier=self.local_classifier
+            )
+            return {"category": category}
+
+        return await self.respond("classify", (file_hash(data),), request, compute)
+
+    async def problems(self, body: bytes, scope):
+        request = self.parse_json(body)
+        data = self.single_image(request)
+
+        async def compute():
+            image = await _analysis_image(data)
+            text = await analyze_image_problems_async(image, self.api_key)
+            problems = [line.strip() for line in text.splitlines() if line.strip()]
+            if problems == ["No problems found"]:
+                problems = []
+            return {"problems": problems}
+
+        return await self.respond("problems", (file_hash(data),), request, compute)
+
+    async def anomalies(self, body: bytes, scope):
+        request = self.parse_json(body)
+        data = self.single_image(request)
+        targets = request.get("targets") or DEFAULT_TARGETS
+        if not isinstance(targets, list) or not all(
+            isinstance(t, str) for t in targets
+        ):
+            raise HTTPError(400, "'targets' must be a list of object names")
+        targets_key = tuple(sorted(t.lower() for t in targets))
+
+        async def compute():
+            image = await _analysis_image(data)
+            overlay = await detect_and_draw_async_(
+                image, targets, api_key=self.vision_api_key
+            )
+            # detect_and_draw_ returns a BGR array, which is what cv2 encodes
+            ok, encoded = cv2.imencode(".jpg", overlay)
+            if not ok:
+                raise RuntimeError("Could not encode the overlay")
+            return {
+                "image": base64.b64encode(encoded.tobytes()).decode("ascii"),
+                "format": "jpeg",
+            }
+
+        return await self.respond(
+            "anomalies", (file_hash(data), targets_key), request, compute
+        )
+
+    async def renovation(self, body: bytes, scope):
+        request = self.parse_json(body)
+        images = request.get("images")
+        if not isinstance(images, list) or not images:
+            raise HTTPError(400, "Missing 'images' (list of base64)")
+        datas = [_decode_image(encoded) for encoded in images]
+        description = request.get("description") or ""
+        hashes = [file_hash(data) for data in datas]
+        description_hash = hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+        async def compute():
+            return await self.run_renovation(datas, hashes, description)
+
+        return await self.respond(
+            "renovation", (tuple(hashes), description_hash), request, compute
+        )
+
+    async def renovation_analyzer(self) -> RenovationAnalyzer:
+        """The shared analyzer, built off the event loop on first use"""
+        async with self.analyzer_lock:
+            if self.analyzer is None:
+                # Configures genai and loads the CSV and estimate index
+                self.analyzer = await asyncio.to_thread(
+                    RenovationAnalyzer,
+                    self.api_key,
+                    csv_path=self.csv_path,
+                    rate_limiter=self.rate_limiter,
+                )
+        return self.analyzer
+
+    async def run_renovation(
+        self, datas: List[bytes], hashes: List[str], description: str
+    ) -> Dict:
+        """Classify every photo, then cost each one against its category"""
+        details = parse_description(description) if description else None
+        analyzer = (await self.renovation_analyzer()).for_listing(details)
+        semaphore = asyncio.Semaphore(analyzer.max_workers)
+
+        with tempfile.TemporaryDirectory(prefix="housing-service-") as workdir:
+
+            async def analyse(data, digest):
+                async with semaphore:
+                    image = await _analysis_image(data)
+                    folder = await categorize_image_async_(
+                        image, self.api_key, local_classifier=self.local_classifier
+                    )
+                    csv_category = analyzer.folder_to_category_mapping.get(folder)
+                    if csv_category is None:
+                        return folder, {
+                            "photo_path": digest,
+                            "category": folder,
+                            "error": "Unknown category",
+                        }
+                    photo_path = Path(workdir) / f"{digest}.jpg"
+                    await asyncio.to_thread(image.save, photo_path)
+                    result = await analyzer.analyze_photo_with_gemini_async(
+                        photo_path,
+                        csv_category,
+                        analyzer.category_data.get(csv_category, []),
+                    )
+                    result["photo_path"] = digest
+                    return folder, result
+
+            outcomes = await asyncio.gather(
+                *(analyse(data, digest) for data, digest in zip(datas, hashes))
+            )
+
+        results: Dict[str, List[Dict]] = {}
+        for folder, result in outcomes:
+            results.setdefault(folder, []).append(result)
+        if analyzer.estimate_index is not None and analyzer.estimate_index.added:
+            await asyncio.to_thread(analyzer.estimate_index.save)
+        return {
+            "property_details": details.to_dict() if details else None,
+            "results": results,
+            "totals": analyzer.cost_totals(results),
+            "summary": analyzer.generate_summary_report(results),
+        }
+
+    async def metrics(self, body: bytes, scope):
+        coalescer = self.coalescer
+        lines = [
+            "# TYPE housing_service_queue_depth gauge",
+            f"housing_service_queue_depth {coalescer.queue_depth}",
+            "# TYPE housing_service_in_flight gauge",
+            f"housing_service_in_flight {coalescer.running}",
+            "# TYPE housing_service_coalesced_total counter",
+        ]
+        lines += [
+            f'housing_service_coalesced_total{{endpoint="{endpoint}"}} {count}'
+            for endpoint, count in sorted(coalescer.coalesced.items())
+        ]
+        lines.append("# TYPE housing_service_rejected_total counter")
+        lines += [
+            f'housing_service_rejected_total{{endpoint="{endpoint}"}} {count}'
+            for endpoint, count in sorted(coalescer.rejected.items())
+        ]
+        lines.append("# TYPE housing_service_responses_total counter")
+        lines += [
+            f'housing_service_responses_total{{path="{path}",status="{status}"}} {count}'
+            for (path, status), count in sorted(self.responses.items())
+        ]
+        payload = tracer.render_prometheus() + "\n".join(lines) + "\n"
+        return 200, "text/plain; version=0.0.4", payload.encode("utf-8")
+
+    async def healthz(self, body: bytes, scope):
+        return 200, "application/json", b'{"status": "ok"}'
+
+
+def create_app(**kwargs) -> InspectionService:
+    return InspectionService(**kwargs)
+
+
+# For `uvicorn inspection_service:app`
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Housing inspection HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING)
+    parser.add_argument("--csv", default="life_span_detailed_table.csv")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    service = create_app(
+        csv_path=args.csv,
+        max_concurrency=args.max_concurrency,
+        max_pending=args.max_pending,
+    )
+    uvicorn.run(service, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,602 @@
+"""
+Durable job queue for long-running property analyses
+----------------------------------------------------
+Jobs are rows in a SQLite database (WAL mode, safe across processes). The UI
+and the CLIs enqueue them and return immediately; a pool of worker processes
+claims jobs by priority, runs them and stores the result, so the work
+survives a closed browser tab.
+
+- status:       queued -> running -> succeeded / failed / cancelled
+- retry:        failed attempts are re-queued with exponential backoff until
+                `max_attempts` is reached
+- cancellation: queued jobs are cancelled at once, running jobs at the next
+                checkpoint of their handler (every batch of photos)
+- crashes:      jobs whose worker stopped sending heartbeats are re-queued
+- reruns:       a failed job's dedupe key is only enqueued again after a
+                backoff that doubles with each failure
+
+Usage:
+    python job_queue.py worker --workers 8
+    python job_queue.py enqueue photos/ --description test_dataset/description.txt
+    python job_queue.py status 1
+    python job_queue.py cancel 1
+    python job_queue.py list
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from tracing import retry_attempt, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.getenv("JOB_QUEUE_DB", "jobs.sqlite")
+DEFAULT_JOBS_DIR = os.getenv("JOB_QUEUE_DIR", "jobs")
+ACTIVE_STATUSES = ("queued", "running")
+HEARTBEAT_INTERVAL_S = 10.0
+STALE_AFTER_S = 120.0
+RETRY_BACKOFF_S = 5.0
+# Wait before a failed job's dedupe key may be enqueued again
+FAILED_BACKOFF_S = 60.0
+FAILED_BACKOFF_MAX_S = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    dedupe_key TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, available_at);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key);
+"""
+
+
+class JobCancelled(Exception):
+    """Raised at a handler checkpoint once cancellation was requested"""
+
+
+class JobQueue:
+    """SQLite-backed queue; every method opens its own short transaction"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = str(path)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        # Autocommit; multi-statement updates use explicit BEGIN IMMEDIATE
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict,
+        priority: int = 0,
+        max_attempts: int = 3,
+        dedupe_key: Optional[str] = None,
+    ) -> int:
+        """
+        Add a job and return its id. With a `dedupe_key`, an active or
+        succeeded job with the same key is returned instead of a new one, and
+        so is a failed one until its backoff has passed: the backoff doubles
+        with each failed job of the key, up to FAILED_BACKOFF_MAX_S.
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if dedupe_key is not None:
+                    row = connection.execute(
+                        "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN "
+                        "('queued', 'running', 'succeeded') ORDER BY id DESC LIMIT 1",
+                        (dedupe_key,),
+                    ).fetchone()
+                    if row is None:
+                        row = self._failed_in_backoff(connection, dedupe_key, now)
+                    if row is not None:
+                        connection.execute("COMMIT")
+                        return row["id"]
+                cursor = connection.execute(
+                    "INSERT INTO jobs (kind, payload, priority, max_attempts, "
+                    "dedupe_key, created_at, available_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        kind,
+                        json.dumps(payload),
+                        priority,
+                        max_attempts,
+                        dedupe_key,
+                        now,
+                        now,
+                    ),
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    @staticmethod
+    def _failed_in_backoff(connection, dedupe_key: str, now: float):
+        """Latest failed job of the key if re-enqueueing it is too early"""
+        row = connection.execute(
+            "SELECT id, finished_at, (SELECT COUNT(*) FROM jobs WHERE dedupe_key = ? "
+            "AND status = 'failed') AS failures FROM jobs WHERE dedupe_key = ? "
+            "AND status = 'failed' ORDER BY id DESC LIMIT 1",
+            (dedupe_key, dedupe_key),
+        ).fetchone()
+        if row is None:
+            return None
+        backoff = min(
+            FAILED_BACKOFF_MAX_S, FAILED_BACKOFF_S * 2 ** (row["failures"] - 1)
+        )
+        return row if now < row["finished_at"] + backoff else None
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued job now, or flag a running one; False if finished"""
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+            if cursor.rowcount:
+                return True
+            cursor = connection.execute(
+                "UPDATE jobs SET cancel_requested = 1 "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+            return bool(cursor.rowcount)
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Atomically take the highest-priority job that is ready to run"""
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                    "ORDER BY priority DESC, id ASC LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return None
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, "
+                    "attempts = attempts + 1, started_at = ?, heartbeat_at = ? "
+                    "WHERE id = ?",
+                    (worker, now, now, row["id"]),
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        job = _row_to_job(row)
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id: int, progress: Optional[str] = None) -> bool:
+        """Refresh the job's heartbeat; returns True if cancellation was requested"""
+        with self.connect() as connection:
+            if progress is None:
+                connection.execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                    (time.time(), job_id),
+                )
+            else:
+                connection.execute(
+                    "UPDATE jobs SET heartbeat_at = ?, progress = ? WHERE id = ?",
+                    (time.time(), progress, job_id),
+                )
+            row = connection.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def complete(self, job_id: int, result: Dict):
+        self._finish(job_id, "succeeded", result=json.dumps(result))
+
+    def mark_cancelled(self, job_id: int):
+        self._finish(job_id, "cancelled")
+
+    def fail(self, job_id: int, error: str):
+        """Re-queue with backoff while attempts remain, else mark failed"""
+        job = self.get(job_id)
+        if job is not None and job["cancel_requested"]:
+            self._finish(job_id, "cancelled", error=error)
+            return
+        if job is not None and job["attempts"] < job["max_attempts"]:
+            delay = RETRY_BACKOFF_S * 2 ** (job["attempts"] - 1)
+            with self.connect() as connection:
+                connection.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, worker = NULL, "
+                    "available_at = ? WHERE id = ? AND status = 'running'",
+                    (error, time.time() + delay, job_id),
+                )
+            return
+        self._finish(job_id, "failed", error=error)
+
+    def requeue_stale(self, stale_after_s: float = STALE_AFTER_S) -> int:
+        """
+        Give jobs of crashed workers back to the queue, or cancel them if
+        that was requested before the crash
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'cancelled', worker = NULL, "
+                "finished_at = ?, error = 'worker stopped responding' "
+                "WHERE status = 'running' AND heartbeat_at < ? AND cancel_requested",
+                (now, now - stale_after_s),
+            )
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, "
+                "cancel_requested = 0, error = 'worker stopped responding' "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (now - stale_after_s,),
+            )
+        return cursor.rowcount
+
+    def _finish(self, job_id: int, status: str, result=None, error=None):
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id),
+            )
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    if job["result"] is not None:
+        job["result"] = json.loads(job["result"])
+    return job
+
+
+class JobContext:
+    """Handed to handlers for progress reports and cancellation checkpoints"""
+
+    def __init__(self, queue: JobQueue, job: Dict):
+        self.queue = queue
+        self.job = job
+        self.cancel_requested = False
+
+    def checkpoint(self, progress: Optional[str] = None):
+        if self.queue.heartbeat(self.job["id"], progress):
+            self.cancel_requested = True
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+def run_property_analysis(context: JobContext) -> Dict:
+    """
+    Renovation costing of one property. Payload: `photos_dir` (already
+    sorted into category folders if `categorised`), optional `description`,
+    the `output_dir` for results and an optional `result_cache` file of
+    per-photo results shared by the runs of the same property. Photos that
+    cannot be decoded are skipped and listed in the result's `skipped`.
+    """
+    from async_runner import submit
+    from description_parser import parse_description
+    from image_pipeline import ImagePipeline
+    from image_room_clasify import categorize_image_async_
+    from price_analasys import DEFAULT_MAX_WORKERS, RenovationAnalyzer
+    from property_manifest import load_json, save_json
+    from rate_limit import RateLimiter
+
+    payload = context.job["payload"]
+    api_key = os.getenv("GOOGLE_API_KEY")
+    output_dir = Path(payload["output_dir"])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    photos_dir = Path(payload["photos_dir"])
+    skipped: Dict[str, str] = {}
+
+    if not payload.get("categorised"):
+        categorised = output_dir / "Categorised_photos"
+        photos = sorted(p for p in photos_dir.iterdir() if p.is_file())
+        # Photos are decoded in worker processes and each classification call
+        # starts as soon as its photo is decoded, overlapping the two
+        categories = {}
+        try:
+            with ImagePipeline.for_batch(len(photos)) as pipeline:
+                for i, decoded in enumerate(pipeline.decode(photos)):
+                    context.checkpoint(f"decoding {i + 1}/{len(photos)}")
+                    if decoded.error:
+                        # One unreadable file does not fail the property
+                        logger.warning(f"Skipping {decoded.path.name}: {decoded.error}")
+                        skipped[decoded.path.name] = decoded.error
+                        continue
+                    categories[decoded.path] = submit(
+                        categorize_image_async_(decoded.analysis, api_key)
+                    )
+            photos = [photo for photo in photos if photo in categories]
+            for i, photo_path in enumerate(photos):
+                context.checkpoint(f"classifying {i + 1}/{len(photos)}")
+                category = categories[photo_path].result()
+                (categorised / category).mkdir(parents=True, exist_ok=True)
+                shutil.copy(photo_path, categorised / category / photo_path.name)
+        finally:
+            for future in categories.values():
+                future.cancel()
+        photos_dir = categorised
+
+    description = payload.get("description")
+    details = parse_description(description) if description else None
+    analyzer = RenovationAnalyzer(
+        api_key,
+        csv_path=payload.get("csv_path", "life_span_detailed_table.csv"),
+        property_details=details,
+        # Every worker process draws on the one quota kept in the queue database
+        rate_limiter=RateLimiter.from_env(
+            "GEMINI_REQUESTS_PER_MINUTE",
+            burst=DEFAULT_MAX_WORKERS,
+            shared_path=context.queue.path,
+        ),
+    )
+    analyzer.categorized_photos_path = photos_dir
+
+    cache_path = payload.get("result_cache")
+    cache = load_json(Path(cache_path), {}) if cache_path else None
+
+    context.checkpoint("analyzing renovation costs")
+    try:
+        results = analyzer.analyze_all_categories(cache, context.checkpoint)
+    finally:
+        if cache_path:
+            # Kept on cancellation too, so a rerun starts where this one stopped.
+            # Concurrent runs of one property may overwrite each other's cache,
+            # which only costs re-analysing a few photos next time
+            save_json(Path(cache_path), cache)
+    context.checkpoint("writing results")
+
+    results_path = output_dir / "renovation_analysis_results.json"
+    summary_path = output_dir / "renovation_analysis_summary.md"
+    analyzer.save_results(results, str(results_path))
+    summary_path.write_text(analyzer.generate_summary_report(results), encoding="utf-8")
+
+    if os.getenv("ANALYTICS_DIR"):
+        from analytics_export import export_property
+
+        export_property(
+            output_dir.name,
+            results=results,
+            details=details,
+            root=os.getenv("ANALYTICS_DIR"),
+        )
+    return {
+        "results_path": str(results_path),
+        "summary_path": str(summary_path),
+        "photos": sum(len(analyses) for analyses in results.values()),
+        "category_estimates": analyzer.category_estimates,
+        "skipped": skipped,
+    }
+
+
+HANDLERS: Dict[str, Callable[[JobContext], Dict]] = {
+    "property_analysis": run_property_analysis,
+}
+
+
+def run_job(queue: JobQueue, job: Dict):
+    context = JobContext(queue, job)
+    stop = threading.Event()
+
+    def heartbeat():
+        # Keeps the job alive and picks up cancellation during long stages
+        while not stop.wait(HEARTBEAT_INTERVAL_S):
+            if queue.heartbeat(job["id"]):
+                context.cancel_requested = True
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        handler = HANDLERS[job["kind"]]
+        # Attempts after the first are retries of a failed run
+        with retry_attempt(job["attempts"] - 1), span(job["kind"], job_id=job["id"]):
+            result = handler(context)
+    except JobCancelled:
+        logger.info(f"Job {job['id']} cancelled")
+        queue.mark_cancelled(job["id"])
+    except Exception as e:
+        logger.error(f"Job {job['id']} failed: {e}")
+        queue.fail(job["id"], f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+    else:
+        queue.complete(job["id"], result)
+    finally:
+        stop.set()
+
+
+def run_worker(db_path: str = DEFAULT_DB_PATH, poll_interval: float = 1.0):
+    """Claim and run jobs until interrupted"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    queue = JobQueue(db_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {worker} started")
+    while True:
+        queue.requeue_stale()
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"Worker {worker} running job {job['id']} ({job['kind']})")
+        run_job(queue, job)
+
+
+def start_workers(
+    n_workers: Optional[int] = None,
+    db_path: str = DEFAULT_DB_PATH,
+    daemon: bool = True,
+) -> List[multiprocessing.Process]:
+    """
+    Spawn worker processes, one per core by default. Daemonic workers stop
+    with their parent (the app) but cannot start processes of their own, so
+    they decode photos inline; the `worker` command starts non-daemonic ones
+    that decode in an ImagePipeline process pool.
+    """
+    # Fresh interpreters: forking a process that already opened gRPC channels
+    # (the app, after its Gemini calls) is not safe
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(n_workers or os.cpu_count() or 1):
+        process = context.Process(target=run_worker, args=(db_path,), daemon=daemon)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def enqueue_property_analysis(
+    queue: JobQueue,
+    photos_dir: str,
+    description: Optional[str] = None,
+    categorised: bool = False,
+    priority: int = 0,
+    jobs_dir: str = DEFAULT_JOBS_DIR,
+    dedupe_key: Optional[str] = None,
+    result_cache: Optional[str] = None,
+) -> int:
+    """
+    Enqueue a property_analysis job writing into its own output folder.
+    `result_cache` reuses and updates the per-photo results of earlier runs.
+    """
+    output_dir = Path(jobs_dir) / (dedupe_key or f"{time.time_ns():x}")
+    return queue.enqueue(
+        "property_analysis",
+        {
+            "photos_dir": str(Path(photos_dir).resolve()),
+            "categorised": categorised,
+            "description": description,
+            "output_dir": str(output_dir.resolve()),
+            "csv_path": str(Path("life_span_detailed_table.csv").resolve()),
+            "result_cache": str(Path(result_cache).resolve()) if result_cache else None,
+        },
+        priority=priority,
+        dedupe_key=dedupe_key,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Property analysis job queue")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="Run worker processes")
+    worker.add_argument("--workers", type=int, default=os.cpu_count())
+
+    enqueue = commands.add_parser("enqueue", help="Enqueue a property analysis")
+    enqueue.add_argument("photos_dir")
+    enqueue.add_argument("--description", help="Text file with the description")
+    enqueue.add_argument("--categorised", action="store_true")
+    enqueue.add_argument("--priority", type=int, default=0)
+    enqueue.add_argument(
+        "--result-cache", help="Per-photo results file reused across runs"
+    )
+
+    status = commands.add_parser("status", help="Show a job")
+    status.add_argument("job_id", type=int)
+    cancel = commands.add_parser("cancel", help="Cancel a job")
+    cancel.add_argument("job_id", type=int)
+    commands.add_parser("list", help="List recent jobs")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    queue = JobQueue(args.db)
+
+    if args.command == "worker":
+        processes = start_workers(args.workers, args.db, daemon=False)
+        print(f"Started {len(processes)} workers on {args.db}")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "enqueue":
+        description = None
+        if args.description:
+            with open(args.description, "r", encoding="utf-8") as f:
+                description = f.read()
+        job_id = enqueue_property_analysis(
+            queue,
+            args.photos_dir,
+            description=description,
+            categorised=args.categorised,
+            priority=args.priority,
+            result_cache=args.result_cache,
+        )
+        print(f"Enqueued job {job_id}")
+    elif args.command == "status":
+        job = queue.get(args.job_id)
+        print(json.dumps(job, indent=2) if job else f"No job {args.job_id}")
+    elif args.command == "cancel":
+        print("Cancelled" if queue.cancel(args.job_id) else "Job already finished")
+    else:
+        for job in queue.list():
+            print(
+                f"{job['id']:5d} {job['kind']:18s} {job['status']:10s} "
+                f"p={job['priority']} attempts={job['attempts']} "
+                f"{job['progress'] or ''}"
+            )
+
+
+if __name__ == "__main__":
+    main()
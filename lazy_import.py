@@ -0,0 +1,59 @@
+"""
+Lazy loading of heavy optional dependencies
+-------------------------------------------
+`google.generativeai`, OpenCV, the OpenAI client, pandas and friends take
+from a few hundred milliseconds to seconds to import. Modules bind them with
+`lazy_module` instead of a top-level import, so the import is paid on first
+attribute access and only by the code paths that need the backend. This
+keeps cold start of the CLIs, queue workers and the service short.
+
+Usage:
+    genai = lazy_module("google.generativeai")
+    genai.configure(api_key=api_key)  # imports google.generativeai here
+
+    python benchmark.py --scenarios imports
+"""
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that imports it on first attribute access. Every
+    access is forwarded to the real module, so attributes patched on it
+    (e.g. by fake_backend) are seen through the stand-in too.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """The module if it is already imported, else a LazyModule for it"""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    return name in sys.modules
@@ -0,0 +1,196 @@
+"""
+Local room classifier
+---------------------
+Cheap colour/texture features plus a softmax linear head, trained with NumPy
+on labelled folders such as Categorised_photos/<category>/*.jpg. Runs at
+hundreds of images per second on one CPU and is used as a pre-filter in
+front of the Gemini categorisation: confident predictions are answered
+locally, ambiguous ones are escalated to the remote model.
+
+Train and evaluate with train_room_classifier.py.
+"""
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+FEATURE_SIZE = 64
+DEFAULT_MODEL_PATH = "room_classifier.npz"
+DEFAULT_CONFIDENCE = 0.8
+
+HUE_BINS = 12
+SATURATION_BINS = 4
+VALUE_BINS = 4
+GRID = 4
+ORIENTATION_BINS = 8
+
+
+def open_for_features(path) -> Image.Image:
+    """Open an image file, letting JPEG draft mode decode it at reduced size"""
+    image = Image.open(path)
+    if image.format == "JPEG":
+        image.draft("RGB", (FEATURE_SIZE * 2, FEATURE_SIZE * 2))
+    return image
+
+
+def prepare_image(image: Image.Image) -> Image.Image:
+    return image.convert("RGB").resize(
+        (FEATURE_SIZE, FEATURE_SIZE), Image.Resampling.BILINEAR, reducing_gap=2.0
+    )
+
+
+def extract_features(image: Image.Image) -> np.ndarray:
+    """Colour histogram, spatial colour layout and gradient orientation features"""
+    small = prepare_image(image)
+    rgb = np.asarray(small, dtype=np.float32) / 255.0
+    hsv = np.asarray(small.convert("HSV"), dtype=np.int32)
+
+    # Joint HSV colour histogram
+    h = hsv[..., 0] * HUE_BINS // 256
+    s = hsv[..., 1] * SATURATION_BINS // 256
+    v = hsv[..., 2] * VALUE_BINS // 256
+    joint = (h * SATURATION_BINS + s) * VALUE_BINS + v
+    colour_hist = np.bincount(
+        joint.ravel(), minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS
+    ).astype(np.float32)
+    colour_hist /= colour_hist.sum()
+
+    # Coarse spatial layout: mean colour per grid cell (floors, ceilings, sky)
+    cell = FEATURE_SIZE // GRID
+    layout = rgb.reshape(GRID, cell, GRID, cell, 3).mean(axis=(1, 3)).ravel()
+
+    # Texture: gradient orientation histograms per image quadrant
+    gray = rgb.mean(axis=2)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = (np.arctan2(gy, gx) % np.pi) / np.pi * ORIENTATION_BINS
+    orientation = np.minimum(orientation.astype(np.int32), ORIENTATION_BINS - 1)
+
+    half = FEATURE_SIZE // 2
+    texture = []
+    for rows in (slice(0, half), slice(half, None)):
+        for cols in (slice(0, half), slice(half, None)):
+            hist = np.bincount(
+                orientation[rows, cols].ravel(),
+                weights=magnitude[rows, cols].ravel(),
+                minlength=ORIENTATION_BINS,
+            )
+            texture.append(hist / (hist.sum() + 1e-6))
+    edge_stats = np.array(
+        [magnitude.mean(), magnitude.std(), (magnitude > 0.1).mean()],
+        dtype=np.float32,
+    )
+
+    return np.concatenate(
+        [colour_hist, layout, np.concatenate(texture), edge_stats]
+    ).astype(np.float32)
+
+
+class LocalRoomClassifier:
+    """Softmax regression over extract_features()"""
+
+    def __init__(
+        self,
+        labels: Sequence[str],
+        weights: np.ndarray,
+        bias: np.ndarray,
+        mean: np.ndarray,
+        std: np.ndarray,
+    ):
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def train(
+        cls,
+        features: np.ndarray,
+        labels: Sequence[str],
+        epochs: int = 500,
+        learning_rate: float = 0.5,
+        l2: float = 1e-3,
+    ) -> "LocalRoomClassifier":
+        """Fit the linear head with full-batch gradient descent"""
+        classes = sorted(set(labels))
+        y = np.array([classes.index(label) for label in labels])
+        mean = features.mean(axis=0)
+        std = features.std(axis=0) + 1e-6
+        x = (features - mean) / std
+
+        n, d = x.shape
+        one_hot = np.eye(len(classes), dtype=np.float32)[y]
+        weights = np.zeros((d, len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+
+        for _ in range(epochs):
+            probabilities = _softmax(x @ weights + bias)
+            error = (probabilities - one_hot) / n
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+
+        return cls(classes, weights, bias, mean, std)
+
+    def predict_proba_features(self, features: np.ndarray) -> np.ndarray:
+        x = (np.atleast_2d(features) - self.mean) / self.std
+        return _softmax(x @ self.weights + self.bias)
+
+    def predict_proba(self, images: List[Image.Image]) -> np.ndarray:
+        return self.predict_proba_features(
+            np.stack([extract_features(image) for image in images])
+        )
+
+    def predict(self, image: Image.Image) -> Tuple[str, float]:
+        """Returns (category, confidence) for a single image"""
+        probabilities = self.predict_proba([image])[0]
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        np.savez(
+            path,
+            labels=np.array(self.labels),
+            weights=self.weights,
+            bias=self.bias,
+            mean=self.mean,
+            std=self.std,
+        )
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH) -> "LocalRoomClassifier":
+        data = np.load(path)
+        return cls(
+            [str(label) for label in data["labels"]],
+            data["weights"],
+            data["bias"],
+            data["mean"],
+            data["std"],
+        )
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+_default_classifier = None
+
+
+def load_default_classifier() -> Optional[LocalRoomClassifier]:
+    """
+    Loads the classifier from ROOM_CLASSIFIER_PATH (default room_classifier.npz),
+    or returns None when no trained model exists.
+    """
+    global _default_classifier
+    if _default_classifier is None:
+        path = os.getenv("ROOM_CLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+        if not os.path.exists(path):
+            return None
+        _default_classifier = LocalRoomClassifier.load(path)
+    return _default_classifier
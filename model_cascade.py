@@ -0,0 +1,115 @@
+"""
+Model cascade: cheap model first, stronger model only when needed
+-----------------------------------------------------------------
+Each Gemini task runs on an ordered list of models. The first (cheapest,
+fastest) model answers most photos; the answer is passed to the task's
+`escalate` check, which returns a reason (malformed answer, low confidence,
+urgent finding) when the next model should be asked instead. The last model's
+answer is always accepted. Every attempt is a tracing span under its own
+model (counting the escalations before it as retries), and each escalation
+is recorded as a `<stage>_escalation` span, so /metrics shows how often each
+task escalates and why.
+
+The model lists are configured per task with GEMINI_MODELS_<TASK>, a comma
+separated list; a single model disables the cascade for that task.
+
+Usage:
+    cascade = ModelCascade.for_task("renovation")
+    result, model_name = await cascade.run_async(call, escalate)
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from tracing import retry_attempt, span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MODELS: Dict[str, List[str]] = {
+    "classify": ["gemini-2.0-flash-lite", "gemini-2.5-flash"],
+    "analysis": ["gemini-2.0-flash-lite", "gemini-2.0-flash"],
+    "problems": ["gemini-2.0-flash-lite", "gemini-2.0-flash"],
+    "renovation": ["gemini-2.0-flash-lite", "gemini-2.0-flash-exp"],
+}
+ESCALATE_URGENCY = ("immediate", "urgent")
+ESCALATE_CONFIDENCE = ("low",)
+
+
+class ModelCascade:
+    def __init__(self, task: str, models: List[str]):
+        if not models:
+            raise ValueError(f"No models configured for task {task!r}")
+        self.task = task
+        self.models = models
+
+    @classmethod
+    def for_task(cls, task: str) -> "ModelCascade":
+        """Cascade for `task`, overridden by GEMINI_MODELS_<TASK>"""
+        value = os.getenv(f"GEMINI_MODELS_{task.upper()}")
+        if value:
+            models = [model.strip() for model in value.split(",") if model.strip()]
+        else:
+            models = DEFAULT_MODELS[task]
+        return cls(task, models)
+
+    @property
+    def strongest(self) -> str:
+        return self.models[-1]
+
+    async def run_async(
+        self,
+        call: Callable[[str], Awaitable[T]],
+        escalate: Callable[[T], Optional[str]],
+    ) -> Tuple[T, str]:
+        """
+        Await `call(model_name)` on each model in turn until `escalate`
+        accepts the result (returns None). Errors of all but the last model
+        escalate too. Returns the accepted result and the model that gave it.
+        """
+        for i, model_name in enumerate(self.models):
+            # Each escalation counts as a retry on the next model's span
+            if i == len(self.models) - 1:
+                with retry_attempt(i):
+                    return await call(model_name), model_name
+            try:
+                with retry_attempt(i):
+                    result = await call(model_name)
+            except Exception as e:
+                reason = f"error: {type(e).__name__}"
+            else:
+                reason = escalate(result)
+                if reason is None:
+                    return result, model_name
+            logger.info(f"Escalating {self.task} from {model_name}: {reason}")
+            with span(f"{self.task}_escalation", model=model_name, reason=reason):
+                pass
+
+
+def json_answer(text: str):
+    """The JSON value in a model answer, allowing ```json fences, else None"""
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def escalate_renovation(result: Dict) -> Optional[str]:
+    """Escalate unparsable, low-confidence or urgent renovation assessments"""
+    if "error" in result:
+        return "schema"
+    confidence = (result.get("age_assessment") or {}).get("confidence_level")
+    if str(confidence).lower() in ESCALATE_CONFIDENCE:
+        return "low confidence"
+    urgency = (result.get("renovation_prediction") or {}).get("urgency_level")
+    if str(urgency).lower() in ESCALATE_URGENCY:
+        return f"{urgency} urgency"
+    return None
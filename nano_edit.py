@@ -8,24 +8,35 @@ This script:
 4. Draws bounding boxes + labels on the image
 5. Saves the output image
 
+`detect_and_draw_async_` is the non-blocking variant for PIL images; it uses a
+pooled httpx.AsyncClient per event loop and `detect_and_draw_` wraps it.
+
 Requirements:
-- pip install opencv-python requests
+- pip install opencv-python requests httpx
 - Google Cloud project with Vision API enabled
 - Set your API key as environment variable:
     $env:GOOGLE_CLOUD_API_KEY="your_api_key_here"
 """
-
+import asyncio
 import base64
 import io
 import json
 import os
 import sys
+import weakref
 
-import cv2
-import numpy as np
-import requests
 from dotenv import load_dotenv
 
+from async_runner import run_sync
+from lazy_import import lazy_module
+from tracing import span
+
+# OpenCV, NumPy and the HTTP clients load on first use
+cv2 = lazy_module("cv2")
+httpx = lazy_module("httpx")
+np = lazy_module("numpy")
+requests = lazy_module("requests")
+
 # Load .env file
 load_dotenv()
 
@@ -100,7 +111,29 @@ def detect_and_draw(image_path, target_objects, output_path="output.jpg", api_ke
     print(f"Processed image saved at: {output_path}")
 
 
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client():
+    """Pooled async HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=60.0)
+        _http_clients[loop] = client
+    return client
+
+
+async def detect_and_draw_async_(image, target_objects, api_key=None):
+    with span("detect_and_draw_", model="vision-object-localization", image=image) as s:
+        return await _detect_and_draw(image, target_objects, api_key, s)
+
+
 def detect_and_draw_(image, target_objects, api_key=None):
+    return run_sync(detect_and_draw_async_(image, target_objects, api_key=api_key))
+
+
+async def _detect_and_draw(image, target_objects, api_key, current_span):
 
     image_bytes = io.BytesIO()
     image.save(
@@ -122,7 +155,9 @@ def detect_and_draw_(image, target_objects, api_key=None):
     }
 
     # Make the request
-    response = requests.post(url, json=request_json)
+    response = await get_http_client().post(url, json=request_json)
+    current_span.bytes_in += len(encoded_image)
+    current_span.bytes_out += len(response.content)
 
     if response.status_code != 200:
         raise Exception(f"API request failed: {response.status_code} - {response.text}")
@@ -0,0 +1,285 @@
+"""
+Adaptive photo sampling per category
+------------------------------------
+Listings often have ten photos of the same bathroom. Analysing all of them
+costs ten renovation calls and, summed, a ten-fold cost. AdaptiveSampler
+orders the photos of each category by informativeness (sharp, wide shots
+first, then the ones least like those already taken), analyses them in
+rounds and stops a category once its condition and mean cost no longer
+move, giving one category-level estimate with a confidence interval.
+
+Sampling is enabled with ADAPTIVE_SAMPLING=1; ADAPTIVE_SAMPLING_TOLERANCE is
+the relative change of the mean cost under which a category is settled.
+
+Usage:
+    sampler = AdaptiveSampler(round_size=2, tolerance=0.1)
+    results, estimates = sampler.run(photos_by_category, analyse)
+
+    python photo_sampling.py Categorised_photos/Kitchen
+"""
+
+import argparse
+import math
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from estimate_index import embed_photo
+from local_room_classifier import open_for_features
+from problem_dedup import cost_entries
+
+DEFAULT_ROUND_SIZE = 2
+DEFAULT_MIN_PHOTOS = 2
+DEFAULT_TOLERANCE = 0.1
+SHARPNESS_SIZE = 256
+COVERAGE_GRID = 4
+
+# Two-sided 95% Student t quantiles by degrees of freedom, 1.96 beyond
+T_95 = {
+    1: 12.71,
+    2: 4.30,
+    3: 3.18,
+    4: 2.78,
+    5: 2.57,
+    6: 2.45,
+    7: 2.36,
+    8: 2.31,
+    9: 2.26,
+}
+
+
+def photo_quality(image) -> Tuple[float, float]:
+    """
+    (sharpness, coverage) of a photo: variance of the Laplacian, and the
+    share of grid cells with texture (wide shots rather than blank close-ups).
+    """
+    gray = image.convert("L")
+    gray.thumbnail((SHARPNESS_SIZE, SHARPNESS_SIZE))
+    pixels = np.asarray(gray, dtype=np.float32) / 255.0
+    laplacian = (
+        pixels[:-2, 1:-1]
+        + pixels[2:, 1:-1]
+        + pixels[1:-1, :-2]
+        + pixels[1:-1, 2:]
+        - 4 * pixels[1:-1, 1:-1]
+    )
+    energy = np.abs(laplacian)
+    rows = np.array_split(np.arange(energy.shape[0]), COVERAGE_GRID)
+    cols = np.array_split(np.arange(energy.shape[1]), COVERAGE_GRID)
+    cells = np.array([energy[np.ix_(r, c)].mean() for r in rows for c in cols])
+    coverage = float((cells >= 0.5 * energy.mean()).mean())
+    return float(laplacian.var()), coverage
+
+
+def order_by_informativeness(paths: Sequence[Path]) -> List[Path]:
+    """
+    Greedy ordering: the sharpest, widest photo first, then each time the
+    photo whose quality times dissimilarity to those already picked is
+    highest, so near-duplicate angles come last. Photos that cannot be
+    decoded have quality 0 and come after all others.
+    """
+    if len(paths) <= 1:
+        return list(paths)
+    vectors, sharpness, coverage, unreadable = [], [], [], []
+    readable = []
+    for path in paths:
+        try:
+            with open_for_features(path) as image:
+                vector = embed_photo(image)
+                s, c = photo_quality(image)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            unreadable.append(path)
+            continue
+        readable.append(path)
+        vectors.append(vector)
+        sharpness.append(s)
+        coverage.append(c)
+    if len(readable) <= 1:
+        return readable + unreadable
+    paths = readable
+    vectors = np.stack(vectors)
+    sharpness = np.array(sharpness)
+    quality = 0.5 * sharpness / (sharpness.max() + 1e-9) + 0.5 * np.array(coverage)
+
+    order = [int(np.argmax(quality))]
+    max_similarity = vectors @ vectors[order[0]]
+    remaining = set(range(len(paths))) - set(order)
+    while remaining:
+        candidates = sorted(remaining)
+        scores = quality[candidates] * (1.0 - max_similarity[candidates] + 1e-3)
+        best = candidates[int(np.argmax(scores))]
+        order.append(best)
+        remaining.discard(best)
+        max_similarity = np.maximum(max_similarity, vectors @ vectors[best])
+    return [paths[i] for i in order] + unreadable
+
+
+def _mean_interval(values: List[float]) -> Tuple[float, float, float]:
+    """Mean and 95% confidence interval of the mean"""
+    n = len(values)
+    mean = float(np.mean(values))
+    if n < 2:
+        return mean, mean, mean
+    half_width = T_95.get(n - 1, 1.96) * float(np.std(values, ddof=1)) / math.sqrt(n)
+    return mean, max(0.0, mean - half_width), mean + half_width
+
+
+def category_estimate(analyses: List[Dict], photos_total: int) -> Dict:
+    """
+    Category-level estimate from the photos analysed so far: the most
+    common condition and the mean per-photo costs with 95% intervals.
+    `photos_costed` counts the analyses the costs are based on (failed ones
+    are left out); without any, the estimate has no costs.
+    """
+    costs = {"immediate": [], "future": []}
+    conditions = Counter()
+    for analysis in analyses:
+        if "error" in analysis and "parsed_analysis" not in analysis:
+            continue
+        condition = (analysis.get("photo_analysis") or {}).get("overall_condition") or (
+            analysis.get("parsed_analysis") or {}
+        ).get("condition")
+        if condition:
+            conditions[str(condition).lower()] += 1
+        totals = {"immediate": 0.0, "future": 0.0}
+        for entry in cost_entries(analysis):
+            totals[entry["kind"]] += entry["cost"]
+        for kind, total in totals.items():
+            costs[kind].append(total)
+
+    estimate = {
+        "photos_analysed": len(analyses),
+        "photos_total": photos_total,
+        "photos_costed": len(costs["immediate"]),
+        "condition": conditions.most_common(1)[0][0] if conditions else "unknown",
+    }
+    if not costs["immediate"]:
+        return estimate
+    for kind in ("immediate", "future"):
+        mean, low, high = _mean_interval(costs[kind])
+        estimate[f"{kind}_cost_chf"] = round(mean)
+        estimate[f"{kind}_cost_ci_chf"] = [round(low), round(high)]
+    total = [i + f for i, f in zip(costs["immediate"], costs["future"])]
+    mean, low, high = _mean_interval(total)
+    estimate["total_cost_chf"] = round(mean)
+    estimate["total_cost_ci_chf"] = [round(low), round(high)]
+    return estimate
+
+
+class AdaptiveSampler:
+    """Round-based analysis of the most informative photos of each category"""
+
+    def __init__(
+        self,
+        round_size: int = DEFAULT_ROUND_SIZE,
+        min_photos: int = DEFAULT_MIN_PHOTOS,
+        tolerance: float = DEFAULT_TOLERANCE,
+        max_photos: Optional[int] = None,
+    ):
+        self.round_size = max(1, round_size)
+        self.min_photos = max(1, min_photos)
+        self.tolerance = tolerance
+        self.max_photos = max_photos
+
+    @classmethod
+    def from_env(cls) -> Optional["AdaptiveSampler"]:
+        """Sampler if ADAPTIVE_SAMPLING=1, else None (every photo is analysed)"""
+        if os.getenv("ADAPTIVE_SAMPLING", "0") != "1":
+            return None
+        tolerance = os.getenv("ADAPTIVE_SAMPLING_TOLERANCE")
+        return cls(tolerance=float(tolerance) if tolerance else DEFAULT_TOLERANCE)
+
+    def settled(self, previous: Optional[Dict], current: Dict) -> bool:
+        """
+        Whether one more round of successful analyses left the condition and
+        mean cost in place. Failed analyses do not count, and a category
+        without a cost estimate is never settled.
+        """
+        if previous is None or current["photos_costed"] < self.min_photos:
+            return False
+        if current["photos_costed"] <= previous["photos_costed"]:
+            return False
+        if previous["condition"] != current["condition"]:
+            return False
+        before = previous.get("total_cost_chf")
+        after = current.get("total_cost_chf")
+        if before is None or after is None:
+            return False
+        return abs(after - before) <= self.tolerance * max(abs(before), 1.0)
+
+    def run(
+        self,
+        photos: Dict[str, Sequence[Path]],
+        analyse: Callable[[List[Tuple[str, Path]]], List[Dict]],
+    ) -> Tuple[Dict[str, List[Dict]], Dict[str, Dict]]:
+        """
+        Analyse the photos of every category in rounds. Each round sends the
+        next photos of all unsettled categories to `analyse` at once, which
+        returns one result per (category, photo) in order.
+        Returns (results per category, estimate per category).
+        """
+        queues = {
+            category: order_by_informativeness(list(paths))
+            for category, paths in photos.items()
+            if paths
+        }
+        limit = {
+            category: min(len(queue), self.max_photos or len(queue))
+            for category, queue in queues.items()
+        }
+        results = {category: [] for category in queues}
+        estimates: Dict[str, Dict] = {}
+        active = set(queues)
+
+        while active:
+            batch = []
+            for category in sorted(active):
+                taken = len(results[category])
+                size = self.min_photos if taken == 0 else self.round_size
+                batch.extend(
+                    (category, path)
+                    for path in queues[category][
+                        taken : min(taken + size, limit[category])
+                    ]
+                )
+            for (category, _), result in zip(batch, analyse(batch)):
+                results[category].append(result)
+
+            for category in list(active):
+                estimate = category_estimate(results[category], len(queues[category]))
+                done = len(results[category]) >= limit[category]
+                if done or self.settled(estimates.get(category), estimate):
+                    active.discard(category)
+                estimates[category] = estimate
+        return results, estimates
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show the order in which photos of a category are analysed"
+    )
+    parser.add_argument("folder", help="Folder of one category's photos")
+    args = parser.parse_args()
+
+    extensions = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"}
+    paths = sorted(
+        p for p in Path(args.folder).iterdir() if p.suffix.lower() in extensions
+    )
+    for rank, path in enumerate(order_by_informativeness(paths), start=1):
+        try:
+            with open_for_features(path) as image:
+                sharpness, coverage = photo_quality(image)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            print(f"{rank:>3}. {path.name:<40} cannot be decoded")
+            continue
+        print(
+            f"{rank:>3}. {path.name:<40} sharpness {sharpness:.4f}  coverage {coverage:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,103 @@
+import asyncio
 import base64
+import copy
 import csv
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from description_parser import PropertyDetails
+from estimate_index import EstimateIndex, calibration_examples, embed_photo_file
+from image_hash import file_hash
+from async_runner import run_sync
+from lazy_import import lazy_module
+from model_cascade import ModelCascade, escalate_renovation
+from photo_sampling import AdaptiveSampler
+from problem_dedup import cost_entries, dedupe_cost_items
+from rate_limit import RateLimiter
+from tracing import in_context, record_cache_hit, record_usage, span
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+genai = lazy_module("google.generativeai")
+
+DEFAULT_MAX_WORKERS = 8
+EXECUTOR_MODES = ("thread", "asyncio")
+# Floor Coverings rows priced per m² of floor (baseboards are not)
+FLOOR_AREA_ITEMS = (
+    "Floors",
+    "Laminate Floors",
+    "Parquet",
+    "Underlays",
+    "Installation Floors",
+    "Tile Floors",
+    "Carpet",
+    "Cleaning: Coverings",
+    "Cleaning: Parquet",
+)
+
 
 class RenovationAnalyzer:
-    def __init__(self, api_key: str, csv_path: str = "life_span_detailed_table.csv"):
+    def __init__(
+        self,
+        api_key: str,
+        csv_path: str = "life_span_detailed_table.csv",
+        property_details: Optional[PropertyDetails] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        executor: str = "thread",
+        rate_limiter: Optional[RateLimiter] = None,
+        cascade: Optional[ModelCascade] = None,
+        estimate_index: Optional[EstimateIndex] = None,
+        sampler: Optional[AdaptiveSampler] = None,
+    ):
         """
         Initialize the Renovation Analyzer
 
         Args:
             api_key: Google Gemini API key
             csv_path: Path to the lifespan CSV file
+            property_details: Facts parsed from the listing description, used to
+                scale unit prices and bound age estimates
+            max_workers: Photos analysed concurrently (1 runs sequentially)
+            executor: "thread" for a thread pool, "asyncio" for async requests
+            rate_limiter: Shared Gemini request limiter, by default configured
+                from GEMINI_REQUESTS_PER_MINUTE (unlimited if unset)
+            cascade: Models tried in turn per photo, by default configured from
+                GEMINI_MODELS_RENOVATION
+            estimate_index: Prior analyses reused for near-identical photos and
+                shown as calibration otherwise, by default ESTIMATE_INDEX_PATH
+                (disabled if unset)
+            sampler: Analyses only the most informative photos of each category
+                until its estimate settles, by default enabled by
+                ADAPTIVE_SAMPLING=1 (every photo is analysed otherwise)
         """
+        if executor not in EXECUTOR_MODES:
+            raise ValueError(f"executor must be one of {EXECUTOR_MODES}")
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash-exp")
+        self.cascade = cascade or ModelCascade.for_task("renovation")
+        self.estimate_index = estimate_index or EstimateIndex.from_env()
+        self.sampler = sampler or AdaptiveSampler.from_env()
+        # Category-level estimates of the last sampled run, by folder
+        self.category_estimates: Dict[str, Dict] = {}
         self.csv_path = csv_path
+        self.property_details = property_details
         self.category_data = self.load_category_data()
         self.categorized_photos_path = Path("Categorised_photos")
+        self.max_workers = max(1, max_workers)
+        self.executor = executor
+        self.rate_limiter = rate_limiter or RateLimiter.from_env(
+            "GEMINI_REQUESTS_PER_MINUTE", burst=self.max_workers
+        )
 
         # Mapping between folder names and CSV categories
         self.folder_to_category_mapping = {
@@ -46,6 +113,15 @@ class RenovationAnalyzer:
             "Kitchen": "Kitchen",
         }
 
+    def for_listing(
+        self, property_details: Optional[PropertyDetails]
+    ) -> "RenovationAnalyzer":
+        """Copy sharing the loaded CSV, models and index, for another listing"""
+        analyzer = copy.copy(self)
+        analyzer.property_details = property_details
+        analyzer.category_estimates = {}
+        return analyzer
+
     def load_category_data(self) -> Dict[str, List[Dict]]:
         """Load and organize data from the CSV file by category"""
         category_data = {}
@@ -99,6 +175,53 @@ class RenovationAnalyzer:
 
         return photos
 
+    def estimate_item_quantity(
+        self, category: str, item_name: str, unit: str
+    ) -> Optional[float]:
+        """
+        Estimate how many units of a priced item the property has. Only floor
+        coverings are scaled, by the living area: wall and ceiling areas,
+        glazing and fixture counts are not stated in listings (a wet room may
+        be a guest WC without bathtub).
+        """
+        details = self.property_details
+        if details is None:
+            return None
+
+        if (
+            unit == "per m²"
+            and category == "Floor Coverings"
+            and item_name.startswith(FLOOR_AREA_ITEMS)
+        ):
+            return details.living_area_m2
+        return None
+
+    def create_property_facts(self) -> str:
+        """Describe the facts stated in the listing for the prompt"""
+        details = self.property_details
+        if details is None:
+            return ""
+
+        facts = []
+        if details.year_of_construction:
+            facts.append(
+                f"- Year of construction: {details.year_of_construction} "
+                f"(nothing can be older than {details.building_age()} years)"
+            )
+        if details.last_renovation_year:
+            facts.append(f"- Last renovation mentioned: {details.last_renovation_year}")
+        if details.rooms:
+            facts.append(f"- Rooms: {details.rooms}")
+        if details.wet_rooms:
+            facts.append(f"- Wet rooms: {details.wet_rooms}")
+        if details.living_area_m2:
+            facts.append(f"- Net living area: {details.living_area_m2:.0f} m²")
+        if details.balcony_area_m2:
+            facts.append(f"- Balcony area: {details.balcony_area_m2:.0f} m²")
+        if not facts:
+            return ""
+        return "PROPERTY FACTS stated in the listing:\n" + "\n".join(facts) + "\n"
+
     def create_analysis_prompt(
         self, category: str, category_items: List[Dict], photo_path: str
     ) -> str:
@@ -116,6 +239,12 @@ class RenovationAnalyzer:
             item_info = f"- {item_name}: Lifespan {lifespan} years"
             if price != "-" and price_type != "-":
                 item_info += f", {price_type} cost: {price} CHF {unit}"
+                quantity = self.estimate_item_quantity(category, item_name, unit)
+                if quantity:
+                    item_info += (
+                        f" (this property: ~{quantity:g} units, "
+                        f"~{float(price) * quantity:,.0f} CHF in total)"
+                    )
             items_info.append(item_info)
 
         items_text = "\n".join(items_info)
@@ -123,6 +252,7 @@ class RenovationAnalyzer:
         prompt = f"""
 You are an expert building renovation assessor analyzing a photograph from the "{category}" category.
 
+{self.create_property_facts()}
 REFERENCE DATA for this category:
 {items_text}
 
@@ -181,11 +311,20 @@ Provide realistic assessments based on what you can actually see in the photo. R
     def analyze_photo_with_gemini(
         self, photo_path: Path, category: str, category_items: List[Dict]
     ) -> Dict:
-        """Analyze a single photo using Gemini 2.0-flash API"""
+        """Analyze a single photo with the Gemini model cascade"""
+        return run_sync(
+            self.analyze_photo_with_gemini_async(photo_path, category, category_items)
+        )
+
+    async def analyze_photo_with_gemini_async(
+        self, photo_path: Path, category: str, category_items: List[Dict]
+    ) -> Dict:
+        """Analyze a single photo without blocking the event loop"""
 
         try:
-            # Load image for Gemini
-            image = self.load_image_for_gemini(str(photo_path))
+            # Load image for Gemini; decoding and embedding run in threads so
+            # the other photos' requests keep flowing meanwhile
+            image = await asyncio.to_thread(self.load_image_for_gemini, str(photo_path))
             if image is None:
                 return {"error": "Failed to load image"}
 
@@ -194,56 +333,116 @@ Provide realistic assessments based on what you can actually see in the photo. R
                 category, category_items, str(photo_path)
             )
 
-            # Make API call with Gemini
-            response = self.model.generate_content([prompt, image])
-
-            # Parse response
-            response_text = response.text.strip()
+            # Serve the stored estimate of a near-identical photo, else show
+            # the closest ones to the model as calibration
+            vector = None
+            if self.estimate_index is not None:
+                vector = await asyncio.to_thread(embed_photo_file, photo_path)
+                reused, neighbours = self.estimate_index.lookup(vector, category)
+                if reused is not None:
+                    image.close()
+                    record_cache_hit(
+                        "analyze_photo_with_gemini", image=photo_path, category=category
+                    )
+                    return self.reuse_estimate(reused, photo_path)
+                if neighbours:
+                    prompt += "\n" + calibration_examples(neighbours) + "\n"
+
+            # Make API call with Gemini, escalating to the stronger model for
+            # unparsable, low-confidence or urgent assessments
+            async def call(model_name):
+                with span(
+                    "analyze_photo_with_gemini",
+                    model=model_name,
+                    image=photo_path,
+                    category=category,
+                ):
+                    await self.rate_limiter.wait_async()
+                    model = genai.GenerativeModel(model_name)
+                    response = await model.generate_content_async([prompt, image])
+                    record_usage(response)
+                return self.parse_analysis_response(response.text, photo_path, category)
 
-            # Try to extract JSON from response text
             try:
-                # Try to parse as pure JSON first
-                analysis_result = json.loads(response_text)
-            except json.JSONDecodeError:
-                # If that fails, try to extract JSON from markdown code blocks
-                import re
-
-                json_match = re.search(
-                    r"```(?:json)?\s*(\{.*?\})\s*```",
-                    response_text,
-                    re.DOTALL | re.IGNORECASE,
+                result, model_name = await self.cascade.run_async(
+                    call, escalate_renovation
                 )
-                if json_match:
-                    try:
-                        analysis_result = json.loads(json_match.group(1))
-                    except json.JSONDecodeError:
-                        # If JSON extraction from code blocks fails, try to find any JSON-like structure
-                        json_match = re.search(
-                            r"(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})",
-                            response_text,
-                            re.DOTALL,
-                        )
-                        if json_match:
-                            try:
-                                analysis_result = json.loads(json_match.group(1))
-                            except json.JSONDecodeError:
-                                raise json.JSONDecodeError(
-                                    "No valid JSON found", response_text, 0
-                                )
-                        else:
+            finally:
+                # Release the decoded pixels and file handle right away
+                image.close()
+            result["model"] = model_name
+            if vector is not None and "error" not in result:
+                data = await asyncio.to_thread(Path(photo_path).read_bytes)
+                self.estimate_index.add(file_hash(data), category, vector, result)
+            return result
+
+        except Exception as e:
+            logger.error(f"Error analyzing photo {photo_path}: {e}")
+            return {
+                "photo_path": str(photo_path),
+                "category": category,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat(),
+            }
+
+    def reuse_estimate(self, result: Dict, photo_path: Path) -> Dict:
+        """Stored result of a near-identical photo, as the result of this one"""
+        result = copy.deepcopy(result)
+        self.bound_age_estimate(result)
+        result["photo_path"] = str(photo_path)
+        result["timestamp"] = datetime.now().isoformat()
+        result["model"] = "estimate_index"
+        return result
+
+    def extract_json(self, response_text: str) -> Dict:
+        """Parse the JSON object in a response, raising JSONDecodeError if none"""
+        try:
+            # Try to parse as pure JSON first
+            analysis_result = json.loads(response_text)
+        except json.JSONDecodeError:
+            # If that fails, try to extract JSON from markdown code blocks
+            import re
+
+            json_match = re.search(
+                r"```(?:json)?\s*(\{.*?\})\s*```",
+                response_text,
+                re.DOTALL | re.IGNORECASE,
+            )
+            if json_match:
+                try:
+                    analysis_result = json.loads(json_match.group(1))
+                except json.JSONDecodeError:
+                    # If JSON extraction from code blocks fails, try to find any JSON-like structure
+                    json_match = re.search(
+                        r"(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})",
+                        response_text,
+                        re.DOTALL,
+                    )
+                    if json_match:
+                        try:
+                            analysis_result = json.loads(json_match.group(1))
+                        except json.JSONDecodeError:
                             raise json.JSONDecodeError(
-                                "No JSON structure found", response_text, 0
+                                "No valid JSON found", response_text, 0
                             )
-                else:
-                    raise json.JSONDecodeError(
-                        "No JSON code block found", response_text, 0
-                    )
+                    else:
+                        raise json.JSONDecodeError(
+                            "No JSON structure found", response_text, 0
+                        )
+            else:
+                raise json.JSONDecodeError("No JSON code block found", response_text, 0)
+        return analysis_result
+
+    def parse_analysis_response(
+        self, response_text: str, photo_path: Path, category: str
+    ) -> Dict:
+        """Parse Gemini's JSON answer, falling back to text extraction"""
 
-            # Add metadata to successful parse
-            analysis_result["photo_path"] = str(photo_path)
-            analysis_result["timestamp"] = datetime.now().isoformat()
-            return analysis_result
+        response_text = response_text.strip()
 
+        # Try to extract JSON from response text
+        try:
+            analysis_result = self.extract_json(response_text)
         except json.JSONDecodeError:
             # If JSON parsing fails completely, return structured raw response
             logger.warning(
@@ -260,14 +459,26 @@ Provide realistic assessments based on what you can actually see in the photo. R
                 ),
             }
 
-        except Exception as e:
-            logger.error(f"Error analyzing photo {photo_path}: {e}")
-            return {
-                "photo_path": str(photo_path),
-                "category": category,
-                "error": str(e),
-                "timestamp": datetime.now().isoformat(),
-            }
+        self.bound_age_estimate(analysis_result)
+
+        # Add metadata to successful parse
+        analysis_result["photo_path"] = str(photo_path)
+        analysis_result["timestamp"] = datetime.now().isoformat()
+        return analysis_result
+
+    def bound_age_estimate(self, analysis_result: Dict) -> None:
+        """Clamp the estimated age to the building's age from the description"""
+        if self.property_details is None:
+            return
+        max_age = self.property_details.building_age()
+        age_assessment = analysis_result.get("age_assessment")
+        if max_age is None or not isinstance(age_assessment, dict):
+            return
+
+        years_since = age_assessment.get("estimated_years_since_renovation")
+        if isinstance(years_since, (int, float)) and years_since > max_age:
+            age_assessment["estimated_years_since_renovation"] = max_age
+            age_assessment["bounded_by_year_of_construction"] = True
 
     def extract_key_info_from_text(self, text: str, category: str) -> Dict:
         """Extract key information from non-JSON response text"""
@@ -346,8 +557,8 @@ Provide realistic assessments based on what you can actually see in the photo. R
 
         return extracted
 
-    def analyze_category(self, folder_name: str) -> List[Dict]:
-        """Analyze all photos in a specific category folder"""
+    def category_tasks(self, folder_name: str) -> List[Tuple]:
+        """(folder, photo, CSV category, CSV items) for each photo in a folder"""
 
         # Get corresponding CSV category
         csv_category = self.folder_to_category_mapping.get(folder_name)
@@ -367,32 +578,176 @@ Provide realistic assessments based on what you can actually see in the photo. R
             logger.info(f"No photos found in folder: {folder_name}")
             return []
 
-        logger.info(f"Analyzing {len(photos)} photos in category: {csv_category}")
+        logger.info(f"Found {len(photos)} photos in category: {csv_category}")
+        return [
+            (folder_name, photo_path, csv_category, category_items)
+            for photo_path in photos
+        ]
+
+    def run_tasks(self, tasks: List[Tuple]) -> List[Dict]:
+        """Analyze the photos of `tasks`, returning results in the same order"""
+        if self.max_workers == 1 or len(tasks) <= 1:
+            results = []
+            for i, (_, photo_path, csv_category, category_items) in enumerate(tasks):
+                logger.info(f"Analyzing photo {i+1}/{len(tasks)}: {photo_path.name}")
+                results.append(
+                    self.analyze_photo_with_gemini(
+                        photo_path, csv_category, category_items
+                    )
+                )
+            return results
 
-        results = []
-        for i, photo_path in enumerate(photos):
-            logger.info(f"Analyzing photo {i+1}/{len(photos)}: {photo_path.name}")
+        logger.info(
+            f"Analyzing {len(tasks)} photos with {self.max_workers} "
+            f"{self.executor} workers"
+        )
+        if self.executor == "asyncio":
+            return run_sync(self.run_tasks_async(tasks))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    in_context(
+                        self.analyze_photo_with_gemini,
+                        photo_path,
+                        csv_category,
+                        category_items,
+                    )
+                )
+                for _, photo_path, csv_category, category_items in tasks
+            ]
+            return [future.result() for future in futures]
+
+    async def run_tasks_async(self, tasks: List[Tuple]) -> List[Dict]:
+        """Run the tasks on the event loop, at most `max_workers` at a time"""
+        semaphore = asyncio.Semaphore(self.max_workers)
 
-            result = self.analyze_photo_with_gemini(
-                photo_path, csv_category, category_items
+        async def run(photo_path, csv_category, category_items):
+            async with semaphore:
+                return await self.analyze_photo_with_gemini_async(
+                    photo_path, csv_category, category_items
+                )
+
+        return await asyncio.gather(
+            *(
+                run(photo_path, csv_category, category_items)
+                for _, photo_path, csv_category, category_items in tasks
             )
-            results.append(result)
+        )
 
-        return results
+    def analyze_category(self, folder_name: str) -> List[Dict]:
+        """Analyze all photos in a specific category folder"""
+        return self.run_tasks(self.category_tasks(folder_name))
 
-    def analyze_all_categories(self) -> Dict[str, List[Dict]]:
-        """Analyze all photos in all category folders"""
+    def photo_key(self, folder_name: str, photo_path: Path) -> str:
+        """Content-addressed key of a (category, photo) analysis"""
+        return f"{folder_name}/{file_hash(Path(photo_path).read_bytes())}"
 
-        all_results = {}
+    def run_batches(
+        self, tasks: List[Tuple], checkpoint: Optional[Callable[[str], None]] = None
+    ) -> List[Dict]:
+        """
+        run_tasks in batches of `max_workers` photos, calling `checkpoint`
+        with the progress before each batch so a caller can stop between them
+        """
+        if checkpoint is None:
+            return self.run_tasks(tasks)
+        results = []
+        for start in range(0, len(tasks), self.max_workers):
+            checkpoint(f"analyzing photos {start + 1}-{len(tasks)}")
+            results.extend(self.run_tasks(tasks[start : start + self.max_workers]))
+        return results
+
+    def run_cached(
+        self,
+        tasks: List[Tuple],
+        cache: Optional[Dict[str, Dict]] = None,
+        checkpoint: Optional[Callable[[str], None]] = None,
+    ) -> List[Dict]:
+        """
+        run_batches, serving photos already in `cache` (photo_key -> result)
+        without a call and storing the new results in it
+        """
+        if cache is None:
+            return self.run_batches(tasks, checkpoint)
+        keys = [self.photo_key(folder_name, photo) for folder_name, photo, *_ in tasks]
+        pending = {}
+        for key, task in zip(keys, tasks):
+            if key not in cache or "error" in cache[key]:
+                pending.setdefault(key, task)
+        logger.info(
+            f"Reusing {len(tasks) - len(pending)} stored analyses, "
+            f"analyzing {len(pending)} new or changed photos"
+        )
+        pending_keys = list(pending)
+        for start in range(0, len(pending_keys), self.max_workers):
+            # Stored batch by batch, so a cancelled run keeps what it analysed
+            batch = pending_keys[start : start + self.max_workers]
+            if checkpoint is not None:
+                checkpoint(f"analyzing photos {start + 1}-{len(pending_keys)}")
+            cache.update(zip(batch, self.run_tasks([pending[k] for k in batch])))
+        return [
+            {**cache[key], "photo_path": str(photo)}
+            for key, (_, photo, *_) in zip(keys, tasks)
+        ]
+
+    def analyze_all_categories(
+        self,
+        cache: Optional[Dict[str, Dict]] = None,
+        checkpoint: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, List[Dict]]:
+        """
+        Analyze all photos in all category folders. Every (category, photo)
+        pair is scheduled on one worker pool, so the total time is bound by
+        the slowest calls rather than the sum over categories.
+
+        With a `cache` (photo_key -> result from an earlier run) only new,
+        replaced or previously failed photos are sent to Gemini; the cache is
+        updated in place and stale photos are dropped from it.
+
+        With a sampler, each category's photos are analysed in rounds, most
+        informative first, until its estimate settles; the results then hold
+        the analysed photos only and category_estimates the per-category
+        estimates with their confidence intervals.
+
+        `checkpoint(progress)` is called before each batch of `max_workers`
+        photos; an exception it raises (a job's cancellation) stops the run
+        there.
+        """
 
+        tasks = []
         for folder_name in self.folder_to_category_mapping.keys():
-            logger.info(f"\n{'='*50}")
-            logger.info(f"Processing category folder: {folder_name}")
-            logger.info(f"{'='*50}")
+            tasks.extend(self.category_tasks(folder_name))
+
+        if self.sampler is None:
+            all_results = {}
+            for (folder_name, *_), result in zip(
+                tasks, self.run_cached(tasks, cache, checkpoint)
+            ):
+                all_results.setdefault(folder_name, []).append(result)
+        else:
+            by_photo = {(task[0], task[1]): task for task in tasks}
+            photos = {}
+            for folder_name, photo, *_ in tasks:
+                photos.setdefault(folder_name, []).append(photo)
+            all_results, self.category_estimates = self.sampler.run(
+                photos,
+                lambda batch: self.run_cached(
+                    [by_photo[b] for b in batch], cache, checkpoint
+                ),
+            )
+            analysed = sum(len(results) for results in all_results.values())
+            logger.info(f"Adaptive sampling analysed {analysed}/{len(tasks)} photos")
+
+        if cache is not None:
+            current = {
+                self.photo_key(folder_name, photo) for folder_name, photo, *_ in tasks
+            }
+            for stale in set(cache) - current:
+                del cache[stale]
 
-            results = self.analyze_category(folder_name)
-            if results:
-                all_results[folder_name] = results
+        if self.estimate_index is not None and self.estimate_index.added:
+            self.estimate_index.save()
 
         return all_results
 
@@ -409,8 +764,40 @@ Provide realistic assessments based on what you can actually see in the photo. R
         except Exception as e:
             logger.error(f"Error saving results: {e}")
 
+    def category_cost_totals(
+        self, folder_name: str, analyses: List[Dict]
+    ) -> Tuple[float, float]:
+        """
+        (immediate, future) CHF of one category: its estimate from a sampled
+        run, else the sum of its distinct cost items
+        """
+        estimate = self.category_estimates.get(folder_name)
+        if estimate is not None and "total_cost_chf" in estimate:
+            return estimate["immediate_cost_chf"], estimate["future_cost_chf"]
+        immediate, future = 0.0, 0.0
+        for item in dedupe_cost_items(analyses):
+            if item["kind"] == "immediate":
+                immediate += item["cost"]
+            else:
+                future += item["cost"]
+        return immediate, future
+
+    def cost_totals(self, results: Dict[str, List[Dict]]) -> Dict[str, float]:
+        """Property totals as counted by the summary report"""
+        totals = {"immediate_chf": 0.0, "future_chf": 0.0}
+        for folder_name, analyses in results.items():
+            immediate, future = self.category_cost_totals(folder_name, analyses)
+            totals["immediate_chf"] += immediate
+            totals["future_chf"] += future
+        totals["total_chf"] = totals["immediate_chf"] + totals["future_chf"]
+        return totals
+
     def generate_summary_report(self, results: Dict[str, List[Dict]]) -> str:
-        """Generate a summary report from analysis results"""
+        """
+        Generate a summary report from analysis results. Totals count each
+        distinct cost item of a category once, however many photos show it,
+        or use the category estimate of a sampled run.
+        """
 
         report = []
         report.append("# RENOVATION ANALYSIS SUMMARY REPORT")
@@ -422,7 +809,33 @@ Provide realistic assessments based on what you can actually see in the photo. R
 
         for folder_name, analyses in results.items():
             report.append(f"## {folder_name}")
-            report.append(f"Photos analyzed: {len(analyses)}\n")
+            estimate = self.category_estimates.get(folder_name)
+            if estimate is not None:
+                report.append(
+                    f"Photos analyzed: {estimate['photos_analysed']} of "
+                    f"{estimate['photos_total']} (adaptive sampling)"
+                )
+            else:
+                report.append(f"Photos analyzed: {len(analyses)}")
+
+            distinct_items = dedupe_cost_items(analyses)
+            listed = sum(1 for analysis in analyses for _ in cost_entries(analysis))
+            immediate, future = self.category_cost_totals(folder_name, analyses)
+            total_immediate_cost += immediate
+            total_future_cost += future
+            if estimate is not None and "total_cost_chf" in estimate:
+                low, high = estimate["total_cost_ci_chf"]
+                report.append(
+                    f"Category estimate: {estimate['condition']} condition, "
+                    f"{estimate['total_cost_chf']:,.0f} CHF "
+                    f"(95% CI {low:,.0f} to {high:,.0f} CHF)"
+                )
+            if estimate is None and listed > len(distinct_items):
+                report.append(
+                    f"Cost items: {len(distinct_items)} distinct of {listed} listed "
+                    f"(items seen on several photos are counted once)"
+                )
+            report.append("")
 
             for analysis in analyses:
                 if "error" in analysis:
@@ -442,12 +855,6 @@ Provide realistic assessments based on what you can actually see in the photo. R
                         report.append(
                             f"  - **Extracted immediate cost**: {parsed.get('immediate_cost', 0)} CHF"
                         )
-
-                        # Add to totals if we have valid numbers
-                        if isinstance(parsed.get("immediate_cost"), (int, float)):
-                            total_immediate_cost += parsed["immediate_cost"]
-                        if isinstance(parsed.get("future_cost"), (int, float)):
-                            total_future_cost += parsed["future_cost"]
                     continue
 
                 photo_name = Path(analysis["photo_path"]).name
@@ -496,11 +903,6 @@ Provide realistic assessments based on what you can actually see in the photo. R
                         .get("estimated_cost_chf", 0)
                     )
 
-                    if isinstance(immediate, (int, float)):
-                        total_immediate_cost += immediate
-                    if isinstance(future, (int, float)):
-                        total_future_cost += future
-
                     report.append(f"- **Immediate repair cost**: {immediate} CHF")
                     report.append(f"- **Future renovation cost**: {future} CHF")
 
@@ -536,7 +938,7 @@ def main():
     # Initialize analyzer
     analyzer = RenovationAnalyzer(api_key)
 
-    print("Starting renovation analysis with Gemini 2.0-flash...")
+    print(f"Starting renovation analysis with {', '.join(analyzer.cascade.models)}...")
     print(f"Found {len(analyzer.category_data)} categories in CSV")
     print(f"Will analyze folders: {list(analyzer.folder_to_category_mapping.keys())}")
 
@@ -0,0 +1,301 @@
+"""
+Semantic deduplication of problems across photos
+------------------------------------------------
+Every photo is analysed on its own, so a water stain seen from three angles
+is listed three times, and costed three times by the renovation analysis.
+Problem descriptions (and cost items) are embedded locally as hashed bags of
+normalised words and character trigrams, and clustered per property and per
+category by cosine similarity, so each distinct problem is reported and
+costed once, whichever photos show it. Two entries of the same photo are
+never merged: a photo listing two items means two pieces of work. Cost items
+must also name the same thing (head noun and its modifier: "floor tiles" is
+not "wall tiles"), as items of one category share most of their words.
+
+Usage:
+    index = ProblemIndex()
+    index.add("Water stain on ceiling", group="Kitchen", photo="a.jpg")
+    index.add("water stains on the ceiling", group="Kitchen", photo="b.jpg")
+    len(index.clusters())  # 1
+
+    python problem_dedup.py renovation_analysis_results.json
+"""
+
+import argparse
+import json
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+VECTOR_SIZE = 2048
+DEFAULT_THRESHOLD = 0.6
+STOPWORDS = {
+    "a", "an", "and", "at", "by", "for", "from", "in", "is", "of", "on", "or",
+    "the", "to", "with", "visible", "some", "small", "minor", "possible",
+}  # fmt: skip
+# Words ending the noun phrase that names the object of a cost item
+PHRASE_BREAKS = {
+    "in", "on", "of", "at", "for", "with", "from", "by", "to", "near", "around",
+    "under", "above", "behind", "and", "or", "including", "incl",
+}  # fmt: skip
+# Words describing the work rather than what it is done to
+ACTION_WORDS = {
+    "replace", "replacement", "repair", "repaint", "paint", "painting", "renovate",
+    "renovation", "install", "installation", "fix", "refurbish", "refurbishment",
+    "clean", "cleaning", "seal", "reseal", "sand", "refinish", "update",
+    "upgrade", "remove", "removal", "treat", "treatment", "new", "partial",
+    "full", "complete", "re",
+}  # fmt: skip
+
+
+def normalise_problem(text: str) -> List[str]:
+    """Lower-case content words of a description, plurals folded"""
+    text = re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", str(text).lower())
+    words = []
+    for word in re.findall(r"[^\W\d_]+", text):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def head_phrase(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (head noun, modifier) of the first noun phrase of a description:
+    "Replace floor tiles in bathroom" -> ("tile", "floor"). The modifier is
+    None when the head stands alone or follows an action word.
+    """
+    words = []
+    for word in re.findall(r"[^\W\d_]+", str(text).lower()):
+        if word in PHRASE_BREAKS and words:
+            break
+        if word not in STOPWORDS and word not in ACTION_WORDS:
+            words.extend(normalise_problem(word))
+        elif words:
+            # An action word after the object ("tiles replacement") ends it
+            break
+    if not words:
+        return None, None
+    return words[-1], words[-2] if len(words) > 1 else None
+
+
+def same_head(a: str, b: str) -> bool:
+    """True if both describe the same thing: same head noun, no conflicting modifier"""
+    head_a, modifier_a = head_phrase(a)
+    head_b, modifier_b = head_phrase(b)
+    if head_a != head_b:
+        return False
+    return modifier_a is None or modifier_b is None or modifier_a == modifier_b
+
+
+def embed_problem(text: str, size: int = VECTOR_SIZE) -> np.ndarray:
+    """
+    Unit vector of hashed words and character trigrams. Trigrams make
+    "cracked"/"crack" and "mould"/"mold" close; crc32 keeps it stable across
+    processes.
+    """
+    vector = np.zeros(size, dtype=np.float32)
+    for word in normalise_problem(text):
+        vector[zlib.crc32(word.encode("utf-8")) % size] += 2.0
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i : i + 3].encode("utf-8")) % size] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ProblemIndex:
+    """
+    Incremental index of problem descriptions.
+
+    A description joins the most similar cluster of its group (e.g. the photo
+    category) with a cosine similarity of at least `threshold`, otherwise it
+    starts a new cluster represented by itself. Groups never mix, and neither
+    do two descriptions of the same `photo`. With `match_heads`, the
+    description must also name the same thing as the cluster (same_head).
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, match_heads: bool = False):
+        self.threshold = threshold
+        self.match_heads = match_heads
+        self.vectors: Dict[Hashable, np.ndarray] = {}
+        self.cluster_ids: Dict[Hashable, List[int]] = {}
+        self.clusters_: List[Dict] = []
+
+    def __len__(self):
+        return sum(len(cluster["members"]) for cluster in self.clusters_)
+
+    def _joins(self, cluster: int, text: str, photo: Hashable) -> bool:
+        if photo is not None and any(
+            member.get("photo") == photo
+            for member in self.clusters_[cluster]["members"]
+        ):
+            return False
+        return not self.match_heads or same_head(
+            self.clusters_[cluster]["problem"], text
+        )
+
+    def add(
+        self, text: str, group: Hashable = None, photo: Hashable = None, **member
+    ) -> int:
+        """Index a description with its `member` data, returning its cluster id"""
+        vector = embed_problem(text)
+        vectors = self.vectors.get(group)
+        cluster = None
+        if vectors is not None and vector.any():
+            similarities = vectors @ vector
+            for best in np.argsort(-similarities, kind="stable"):
+                if similarities[best] < self.threshold:
+                    break
+                if self._joins(self.cluster_ids[group][best], text, photo):
+                    cluster = self.cluster_ids[group][best]
+                    break
+
+        if cluster is None:
+            cluster = len(self.clusters_)
+            self.clusters_.append({"problem": text, "group": group, "members": []})
+            # Only representatives are compared against, like PerceptualHashIndex
+            self.vectors[group] = (
+                vector[None, :] if vectors is None else np.vstack([vectors, vector])
+            )
+            self.cluster_ids.setdefault(group, []).append(cluster)
+        self.clusters_[cluster]["members"].append(
+            {"problem": text, "photo": photo, **member}
+        )
+        return cluster
+
+    def clusters(self) -> List[Dict]:
+        """{"problem", "group", "members"} per distinct problem"""
+        return self.clusters_
+
+
+def _problem_list(found: Union[str, List[Dict]]) -> List[Dict]:
+    if isinstance(found, str):
+        # Numbered lines as written by format_located_problems
+        lines = [re.sub(r"^\d+\.\s*", "", line.strip()) for line in found.splitlines()]
+        return [
+            {"problem": line}
+            for line in lines
+            if line and line.lower() != "no problems found"
+        ]
+    return list(found or [])
+
+
+def dedupe_problems(
+    problems: Dict[str, Union[str, List[Dict]]],
+    categories: Optional[Dict[str, str]] = None,
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[Dict]:
+    """
+    Distinct problems of a property. `problems` maps a photo to the text or
+    located list of its problems, `categories` a photo to its category.
+    Returns {"problem", "category", "photos"} per distinct problem.
+    """
+    categories = categories or {}
+    index = ProblemIndex(threshold)
+    for photo, found in problems.items():
+        for problem in _problem_list(found):
+            index.add(problem["problem"], group=categories.get(photo), photo=photo)
+    return [
+        {
+            "problem": cluster["problem"],
+            "category": cluster["group"],
+            "photos": list(
+                dict.fromkeys(member["photo"] for member in cluster["members"])
+            ),
+        }
+        for cluster in index.clusters()
+    ]
+
+
+COST_SECTIONS = {"immediate_repairs": "immediate", "future_renovation": "future"}
+
+
+def cost_entries(analysis: Dict) -> Iterable[Dict]:
+    """
+    Cost entries of one photo analysis: its items, or the lump sum of
+    sections without items (like the app's chart and the analytics export).
+    """
+    if "error" in analysis:
+        parsed = analysis.get("parsed_analysis") or {}
+        for kind in ("immediate", "future"):
+            cost = parsed.get(f"{kind}_cost")
+            if isinstance(cost, (int, float)) and cost > 0:
+                # Nothing to compare on, so never merged
+                yield {"kind": kind, "item": None, "cost": float(cost)}
+        return
+    for section, kind in COST_SECTIONS.items():
+        data = (analysis.get("cost_analysis") or {}).get(section) or {}
+        items = [item for item in data.get("items") or [] if isinstance(item, dict)]
+        if items:
+            for item in items:
+                cost = item.get("cost")
+                if isinstance(cost, (int, float)):
+                    yield {"kind": kind, "item": item.get("item"), "cost": cost}
+        else:
+            cost = data.get("estimated_cost_chf")
+            if isinstance(cost, (int, float)) and cost > 0:
+                yield {"kind": kind, "item": data.get("description"), "cost": cost}
+
+
+def dedupe_cost_items(
+    analyses: List[Dict], threshold: float = DEFAULT_THRESHOLD
+) -> List[Dict]:
+    """
+    Distinct cost items of one category's analyses. Items describing the same
+    work on several photos are counted once, at the highest estimate; lump
+    sums without a description are never merged.
+    Returns {"kind", "item", "cost", "photos"} per distinct item.
+    """
+    index = ProblemIndex(threshold, match_heads=True)
+    merged = []
+    for analysis in analyses:
+        photo = analysis.get("photo_path")
+        for entry in cost_entries(analysis):
+            if not entry["item"]:
+                merged.append({**entry, "photos": [photo]})
+                continue
+            index.add(
+                entry["item"], group=entry["kind"], photo=photo, cost=entry["cost"]
+            )
+    for cluster in index.clusters():
+        members = cluster["members"]
+        merged.append(
+            {
+                "kind": cluster["group"],
+                "item": cluster["problem"],
+                "cost": max(member["cost"] for member in members),
+                "photos": list(dict.fromkeys(member["photo"] for member in members)),
+            }
+        )
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show the distinct cost items of a renovation analysis"
+    )
+    parser.add_argument("results", help="renovation_analysis_results.json")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    with open(args.results, "r", encoding="utf-8") as f:
+        results = json.load(f)
+
+    for folder_name, analyses in results.items():
+        items = dedupe_cost_items(analyses, args.threshold)
+        listed = sum(1 for analysis in analyses for _ in cost_entries(analysis))
+        print(f"{folder_name}: {listed} cost items -> {len(items)} distinct")
+        for item in items:
+            if len(item["photos"]) > 1:
+                print(
+                    f"  - {item['kind']}: {item['item']} ({item['cost']:,.0f} CHF, "
+                    f"{len(item['photos'])} photos)"
+                )
+
+
+if __name__ == "__main__":
+    main()
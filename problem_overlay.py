@@ -0,0 +1,118 @@
+"""
+Local problem overlays
+----------------------
+Problem detection returns a normalised bounding box per problem in the same
+request (analyze_image_problems_located), so highlighting no longer needs a
+second, generative image call: the boxes and their numbered labels are drawn
+on the photo with PIL in a few milliseconds, at any resolution, and the
+result lines up exactly with the listed problems.
+
+Usage:
+    highlighted = draw_problems(image, problems)
+
+    python problem_overlay.py problems_photo1-balcony.jpg.csv --output-dir highlighted
+"""
+
+import argparse
+import csv
+import os
+from collections import defaultdict
+from typing import Dict, List
+
+from PIL import Image, ImageDraw, ImageFont
+
+from real_estate_problem_analyzer import CSV_BOX_COLUMNS
+
+BOX_COLOR = (220, 30, 30)
+FILL_ALPHA = 60
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single bitmap size
+        return ImageFont.load_default()
+
+
+def draw_problems(image: Image.Image, problems: List[Dict]) -> Image.Image:
+    """
+    Copy of `image` with a translucent box and a numbered label per problem.
+    Numbers follow the order of `problems`, as in format_located_problems.
+    """
+    base = image.convert("RGBA")
+    width, height = base.size
+    overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    line_width = max(2, round(min(width, height) / 200))
+    radius = max(10, round(min(width, height) / 40))
+    font = _font(round(radius * 1.2))
+
+    for number, problem in enumerate(problems, start=1):
+        box = problem.get("box")
+        if not box:
+            continue
+        x_min, y_min, x_max, y_max = (
+            round(box[0] * width),
+            round(box[1] * height),
+            round(box[2] * width),
+            round(box[3] * height),
+        )
+        draw.rectangle(
+            (x_min, y_min, x_max, y_max),
+            fill=BOX_COLOR + (FILL_ALPHA,),
+            outline=BOX_COLOR + (255,),
+            width=line_width,
+        )
+        # Label in the top-left corner, kept inside the image
+        cx = min(max(x_min + radius, radius), width - radius)
+        cy = min(max(y_min + radius, radius), height - radius)
+        draw.ellipse(
+            (cx - radius, cy - radius, cx + radius, cy + radius),
+            fill=BOX_COLOR + (255,),
+        )
+        draw.text((cx, cy), str(number), fill="white", font=font, anchor="mm")
+
+    return Image.alpha_composite(base, overlay).convert("RGB")
+
+
+def read_problems_csv(path: str) -> Dict[str, List[Dict]]:
+    """Image path -> located problems, from a real_estate_problem_analyzer CSV"""
+    problems = defaultdict(list)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            values = [row.get(column) for column in CSV_BOX_COLUMNS]
+            box = [float(v) for v in values] if all(values) else None
+            if box is None and row["Problem"].lower() == "no problems found":
+                continue
+            problems[row["Image"]].append({"problem": row["Problem"], "box": box})
+    return dict(problems)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Draw the problems of an analyzer CSV on their photos"
+    )
+    parser.add_argument("csv_file", help="CSV written by real_estate_problem_analyzer")
+    parser.add_argument("--output-dir", default=".", help="Folder for marked photos")
+    parser.add_argument(
+        "--overwrite", action="store_true", help="Replace existing marked photos"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for image_file, problems in read_problems_csv(args.csv_file).items():
+        stem = os.path.splitext(os.path.basename(image_file))[0]
+        output = os.path.join(args.output_dir, f"{stem}_problems_detected.jpg")
+        if os.path.exists(output) and not args.overwrite:
+            print(f"Skipping {output} (exists, use --overwrite)")
+            continue
+        unlocated = sum(problem["box"] is None for problem in problems)
+        if unlocated:
+            print(f"{image_file}: {unlocated} problem(s) without a box, not drawn")
+        with Image.open(image_file) as image:
+            draw_problems(image, problems).save(output)
+        print(f"Marked image saved as: {output}")
+
+
+if __name__ == "__main__":
+    main()
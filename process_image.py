@@ -1,10 +1,16 @@
 import os
 import sys
 
-import google.generativeai as genai
 from dotenv import load_dotenv
 from PIL import Image
 
+from async_runner import run_sync
+from lazy_import import lazy_module
+from model_cascade import ModelCascade, json_answer
+from tracing import record_usage, span
+
+genai = lazy_module("google.generativeai")
+
 
 def analyze_image(
     image_path,
@@ -16,20 +22,61 @@ def analyze_image(
 
     image = Image.open(image_path)
 
-    response = model.generate_content([prompt, image])
+    with span("analyze_image", model="gemini-2.0-flash", image=image_path):
+        response = model.generate_content([prompt, image])
+        record_usage(response)
     return response.text
 
 
-def analyze_image_(
+def escalate_analysis(text):
+    """The app reads the analysis as a JSON object"""
+    return None if isinstance(json_answer(text), dict) else "schema"
+
+
+def accept_any(text):
+    """Free-text answers have no schema to check"""
+    return None
+
+
+def escalation_for(prompt):
+    """Schema check for prompts asking for JSON, none for free text"""
+    return escalate_analysis if "json" in prompt.lower() else accept_any
+
+
+async def analyze_image_async_(
     image,
     api_key,
     prompt="You are an expert real estate agents. Do you see any structural flaws in this image",
+    escalate=None,
 ):
+    """
+    Analysis of `image` by the "analysis" cascade. `escalate` decides when to
+    ask the next model, by default checking the JSON schema only if the
+    prompt asks for JSON.
+    """
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    escalate = escalate or escalation_for(prompt)
 
-    response = model.generate_content([prompt, image])
-    return response.text
+    async def call(model_name):
+        model = genai.GenerativeModel(model_name)
+        with span("analyze_image_", model=model_name, image=image):
+            response = await model.generate_content_async([prompt, image])
+            record_usage(response)
+        return response.text
+
+    text, _ = await ModelCascade.for_task("analysis").run_async(call, escalate)
+    return text
+
+
+def analyze_image_(
+    image,
+    api_key,
+    prompt="You are an expert real estate agents. Do you see any structural flaws in this image",
+    escalate=None,
+):
+    return run_sync(
+        analyze_image_async_(image, api_key, prompt=prompt, escalate=escalate)
+    )
 
 
 if __name__ == "__main__":
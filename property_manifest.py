@@ -0,0 +1,140 @@
+"""
+Per-property photo manifest
+---------------------------
+Remembers, for each property, the content hash of every analysed photo with
+its category, its content-addressed copy under Categorised_photos/ and the
+stored per-photo results. When an agent adds or replaces a few photos of a
+listing, only those go through the models again; removed photos are dropped
+from the manifest and from the category folders.
+
+Usage:
+    manifest = PropertyManifest.for_property("Bahnhofstrasse 1, 8001 Zürich")
+    manifest.prune(photo.file_hash for photo in photos)
+    entry = manifest.get(photo.file_hash)  # None for new photos
+    ...
+    manifest.save()
+
+    python property_manifest.py properties/<property id>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+PROPERTIES_DIR = os.getenv("PROPERTIES_DIR", "properties")
+MANIFEST_NAME = "manifest.json"
+PHOTOS_DIRNAME = "Categorised_photos"
+RESULT_CACHE_NAME = "renovation_cache.json"
+
+
+def property_id(key: str) -> str:
+    """Stable folder name for a property key such as its address"""
+    normalised = " ".join(key.lower().split())
+    return hashlib.sha1(normalised.encode("utf-8")).hexdigest()[:16]
+
+
+def load_json(path: Path, default):
+    if not path.exists():
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: Path, data):
+    """Write through a temporary file so readers never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class PropertyManifest:
+    """Photo hash -> {name, category, path, row} for one property folder"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.path = self.root / MANIFEST_NAME
+        self.photos_dir = self.root / PHOTOS_DIRNAME
+        self.result_cache_path = self.root / RESULT_CACHE_NAME
+        self.photos: Dict[str, Dict] = load_json(self.path, {})
+
+    @classmethod
+    def for_property(cls, key: str, root: str = PROPERTIES_DIR) -> "PropertyManifest":
+        return cls(os.path.join(root, property_id(key)))
+
+    def __contains__(self, file_hash: str) -> bool:
+        return file_hash in self.photos
+
+    def __len__(self) -> int:
+        return len(self.photos)
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        return self.photos.get(file_hash)
+
+    def image_name(self, file_hash: str) -> str:
+        """Content-addressed file name, identical for identical uploads"""
+        return f"{file_hash[:16]}.jpg"
+
+    def add(self, file_hash: str, name: str, category: str):
+        """Record a classified photo saved as `image_name(file_hash)`"""
+        self.photos[file_hash] = {
+            "name": name,
+            "category": category,
+            "path": str(self.photos_dir / category / self.image_name(file_hash)),
+        }
+
+    def add_image(self, file_hash: str, name: str, category: str, image):
+        """Save an image classified elsewhere into its folder and record it"""
+        self.add(file_hash, name, category)
+        path = Path(self.photos[file_hash]["path"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        image.save(path)
+
+    def set_row(self, file_hash: str, row: Dict, **options):
+        """
+        Store the per-photo analysis row; `options` are the settings it was
+        computed with, a stored row is only reused under the same options.
+        """
+        self.photos[file_hash].update(row=row, options=options)
+
+    def stored_row(self, file_hash: str, **options) -> Optional[Dict]:
+        entry = self.photos.get(file_hash)
+        if entry is None or "row" not in entry or entry.get("options") != options:
+            return None
+        return entry["row"]
+
+    def prune(self, current_hashes: Iterable[str]) -> int:
+        """Forget photos no longer in the listing, deleting their copies"""
+        current = set(current_hashes)
+        removed = [h for h in self.photos if h not in current]
+        for file_hash in removed:
+            entry = self.photos.pop(file_hash)
+            if os.path.exists(entry["path"]):
+                os.remove(entry["path"])
+        return len(removed)
+
+    def save(self):
+        save_json(self.path, self.photos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show a property manifest")
+    parser.add_argument("property_dir", help="Folder of the property")
+    args = parser.parse_args()
+
+    manifest = PropertyManifest(args.property_dir)
+    cache = load_json(manifest.result_cache_path, {})
+    print(f"{len(manifest)} photos, {len(cache)} stored renovation analyses")
+    for file_hash, entry in sorted(
+        manifest.photos.items(), key=lambda item: item[1]["category"]
+    ):
+        status = "analysed" if "row" in entry else "classified"
+        print(f"{file_hash[:16]}  {entry['category']:<35} {status:<10} {entry['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Client-side request rate limiting
+---------------------------------
+A token bucket shared by all workers calling the same API, so a parallel
+batch stays under the provider's requests-per-minute quota instead of
+bursting into 429 responses. Usable from threads (`wait`) and from asyncio
+code (`await wait_async()`). SharedRateLimiter keeps the bucket in a SQLite
+file instead, so the worker processes of the job queue share one quota
+rather than each spending the full rate.
+
+Usage:
+    limiter = RateLimiter(requests_per_minute=60, burst=8)
+    limiter.wait()
+    response = model.generate_content(...)
+
+    limiter = RateLimiter.from_env("GEMINI_REQUESTS_PER_MINUTE", shared_path="jobs.db")
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Token bucket on requests per minute; `None` means unlimited"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, burst: int = 1):
+        self.rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(
+        cls, name: str, burst: int = 1, shared_path: Optional[str] = None
+    ) -> "RateLimiter":
+        """
+        Limiter configured by the requests-per-minute environment variable
+        `name`, shared with other processes through the SQLite file
+        `shared_path` if given
+        """
+        value = os.getenv(name)
+        rate = float(value) if value else None
+        if shared_path:
+            return SharedRateLimiter(shared_path, name, rate, burst=burst)
+        return cls(rate, burst=burst)
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller has to wait for it"""
+        if self.rate is None:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Tokens may go negative: later callers queue up behind earlier ones
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait(self) -> float:
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self) -> float:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token bucket `name` stored in a SQLite file, shared across processes"""
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        burst: int = 1,
+    ):
+        super().__init__(requests_per_minute, burst)
+        self.path = str(path)
+        self.name = name
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _reserve(self) -> float:
+        if self.rate is None:
+            return 0.0
+        # Wall-clock time, as monotonic clocks are not comparable across processes
+        now = time.time()
+        with self.lock, self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT tokens, updated FROM rate_limits WHERE name = ?",
+                    (self.name,),
+                ).fetchone()
+                tokens, updated = row if row else (float(self.burst), now)
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                tokens -= 1
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_limits (name, tokens, updated) "
+                    "VALUES (?, ?, ?)",
+                    (self.name, tokens, now),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    async def wait_async(self) -> float:
+        # The SQLite transaction may wait on other processes' locks, which
+        # must not block the event loop
+        delay = await asyncio.to_thread(self._reserve)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
@@ -2,15 +2,30 @@
 """
 Simple Real Estate Problem Analyzer using Google AI
 """
+
+import argparse
+import asyncio
 import csv
 import json
+import logging
+import math
 import os
+import re
 import sys
 
-import google.generativeai as genai
+import numpy as np
 from dotenv import load_dotenv
 from PIL import Image
 
+from async_runner import run_sync
+from lazy_import import lazy_module
+from model_cascade import ModelCascade
+from tracing import record_usage, span
+
+logger = logging.getLogger(__name__)
+
+genai = lazy_module("google.generativeai")
+
 # Load environment variables
 load_dotenv()
 
@@ -31,14 +46,30 @@ def analyze_image(image_path, api_key):
     
     Return ONLY a simple list of problems found, one per line. All the problems must be relevant and not similar to one another. If more, select the top 3 most important ones. If no problems, return "No problems found"."""
 
-    response = model.generate_content([prompt, image])
+    with span("analyze_image", model="gemini-2.0-flash", image=image_path):
+        response = model.generate_content([prompt, image])
+        record_usage(response)
     return response.text.strip()
 
 
-def analyze_image_problems(image, api_key):
+MAX_PROBLEMS = 3
+# Gemini's native box coordinates run from 0 to 1000
+BOX_SCALE = 1000
+
+
+def escalate_problems(text):
+    """Ask the stronger model for empty answers or more than the top problems"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return "empty answer"
+    if len(lines) > MAX_PROBLEMS:
+        return "format"
+    return None
+
+
+async def analyze_image_problems_async(image, api_key):
 
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
 
     prompt = """You are a real estate expert. Look at this photo and find any problems like:
     - Cracks, water damage, mold
@@ -54,32 +85,411 @@ def analyze_image_problems(image, api_key):
     Return only evident problems that can be clearly seen in the image. 
     Do not make guesses or assumptions about what might be wrong!"""
 
-    response = model.generate_content([prompt, image])
-    return response.text.strip()
+    async def call(model_name):
+        model = genai.GenerativeModel(model_name)
+        with span("analyze_image_problems", model=model_name, image=image):
+            response = await model.generate_content_async([prompt, image])
+            record_usage(response)
+        return response.text.strip()
+
+    problems, _ = await ModelCascade.for_task("problems").run_async(
+        call, escalate_problems
+    )
+    return problems
+
+
+def analyze_image_problems(image, api_key):
+    return run_sync(analyze_image_problems_async(image, api_key))
+
+
+LOCATE_PROMPT = """You are a real estate expert. Look at this photo and find problems like:
+- Cracks, water damage, mold
+- Structural issues
+- Electrical/plumbing problems
+- Safety hazards
+- Maintenance issues
+
+Return only evident problems that can be clearly seen in the image, at most the 3 most
+important ones, not similar to one another. Do not make guesses or assumptions!
+
+Return ONLY a JSON list, each entry with the problem and its bounding box in coordinates
+normalised to the whole image (0 to 1):
+[{"problem": "short description", "box": [x_min, y_min, x_max, y_max]}]
+If there are no problems, return []."""
+
+
+def escalate_located(problems):
+    if problems is None:
+        return "schema"
+    if len(problems) > MAX_PROBLEMS:
+        return "format"
+    return None
+
+
+async def analyze_image_problems_located_async(image, api_key):
+    """
+    Problems with their location in the same request: a list of
+    {"problem", "box"} with boxes normalised to the image, ready to be drawn
+    locally by problem_overlay.draw_problems.
+    """
+    genai.configure(api_key=api_key)
+
+    async def call(model_name):
+        model = genai.GenerativeModel(model_name)
+        with span("analyze_image_problems_located", model=model_name, image=image):
+            response = await model.generate_content_async([LOCATE_PROMPT, image])
+            record_usage(response)
+        return parse_located_problems(response.text)
+
+    problems, _ = await ModelCascade.for_task("problems").run_async(
+        call, escalate_located
+    )
+    return [
+        {"problem": str(p["problem"]).strip(), "box": normalised_box(p.get("box"))}
+        for p in (problems or [])[:MAX_PROBLEMS]
+    ]
+
+
+def analyze_image_problems_located(image, api_key):
+    return run_sync(analyze_image_problems_located_async(image, api_key))
+
+
+TILE_PROMPT = """You are a real estate expert inspecting a close-up crop of a larger room photo.
+Find evident problems such as hairline cracks, water stains, mould patches, peeling paint,
+damaged tiles, broken fixtures or electrical/plumbing hazards.
+Report only what is clearly visible in this crop. Do not make guesses or assumptions!
+
+Return ONLY a JSON list, at most 3 entries, each with the problem and its bounding box
+in coordinates normalised to this crop (0 to 1):
+[{"problem": "short description", "box": [x_min, y_min, x_max, y_max]}]
+If there are no problems, return []."""
+
+
+def split_into_tiles(size, tile_size=1024, overlap=0.2):
+    """Overlapping (left, top, right, bottom) tiles covering an image of `size`"""
+    width, height = size
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    return [
+        (left, top, min(left + tile_size, width), min(top + tile_size, height))
+        for top in starts(height)
+        for left in starts(width)
+    ]
+
+
+def tile_information(tile):
+    """Cheap local score: grey-level variance plus mean edge strength"""
+    gray = np.asarray(tile.convert("L").resize((128, 128)), dtype=np.float32)
+    edges = np.abs(np.diff(gray, axis=0)).mean() + np.abs(np.diff(gray, axis=1)).mean()
+    return float(gray.std() + edges)
+
+
+def parse_located_problems(text):
+    """The [{"problem", "box"}] list in a model answer, None if there is none"""
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        problems = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(problems, list):
+        return None
+    return [p for p in problems if isinstance(p, dict) and p.get("problem")]
 
 
-def save_to_csv(problems_text, image_file, output_file):
-    lines = problems_text.split("\n")
-    problems = [line.strip() for line in lines if line.strip()]
+def normalised_box(box):
+    """
+    [x_min, y_min, x_max, y_max] normalised to 0-1, or None if the box is
+    missing, malformed, out of range or empty. Whole-number boxes above 1 are
+    read as Gemini's native 0-1000 scale and rescaled.
+    """
+    try:
+        values = [float(v) for v in box]
+    except (TypeError, ValueError):
+        return None
+    if len(values) != 4 or not all(math.isfinite(v) for v in values):
+        return None
+    if max(values) > 1 and all(v.is_integer() for v in values):
+        values = [v / BOX_SCALE for v in values]
+    x0, y0, x1, y1 = values
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1))
+    if x0 < 0 or y0 < 0 or x1 > 1 or y1 > 1 or x0 == x1 or y0 == y1:
+        return None
+    return [x0, y0, x1, y1]
+
+
+def normalise_boxes(problems, size):
+    """Tiled-scan problems with pixel boxes -> boxes normalised to `size`"""
+    width, height = size
+    return [
+        {
+            "problem": problem["problem"],
+            "box": (
+                normalised_box(
+                    [
+                        problem["box"][0] / width,
+                        problem["box"][1] / height,
+                        problem["box"][2] / width,
+                        problem["box"][3] / height,
+                    ]
+                )
+                if problem.get("box")
+                else None
+            ),
+        }
+        for problem in problems
+    ]
+
+
+def format_located_problems(problems):
+    """Numbered text lines matching the labels of problem_overlay.draw_problems"""
+    if isinstance(problems, str):
+        return problems
+    if not problems:
+        return "No problems found"
+    return "\n".join(
+        f"{number}. {problem['problem']}" for number, problem in enumerate(problems, 1)
+    )
+
+
+def _box_iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / (union - intersection)
+
+
+def _same_problem(a, b):
+    words_a = set(re.findall(r"\w+", a.lower()))
+    words_b = set(re.findall(r"\w+", b.lower()))
+    if not words_a or not words_b:
+        return False
+    return len(words_a & words_b) / len(words_a | words_b) >= 0.3
+
+
+def merge_tile_problems(problems, iou_threshold=0.1):
+    """Deduplicate problems reported by overlapping tiles"""
+    merged = []
+    for problem in sorted(problems, key=lambda p: -p["score"]):
+        for kept in merged:
+            if kept["box"] is None or problem["box"] is None:
+                continue
+            if _box_iou(kept["box"], problem["box"]) >= iou_threshold and _same_problem(
+                kept["problem"], problem["problem"]
+            ):
+                kept["box"] = [
+                    min(kept["box"][0], problem["box"][0]),
+                    min(kept["box"][1], problem["box"][1]),
+                    max(kept["box"][2], problem["box"][2]),
+                    max(kept["box"][3], problem["box"][3]),
+                ]
+                kept["tiles"].extend(problem["tiles"])
+                break
+        else:
+            merged.append(problem)
+    return merged
+
+
+async def analyze_tile_async(tile, tile_box):
+    """
+    Analyse one crop with the "problems" cascade and map its boxes back to
+    full-image pixel coordinates
+    """
+
+    async def call(model_name):
+        model = genai.GenerativeModel(model_name)
+        with span("analyze_tile", model=model_name, tile=list(tile_box)):
+            response = await model.generate_content_async([TILE_PROMPT, tile])
+            record_usage(response)
+        return parse_located_problems(response.text)
+
+    entries, _ = await ModelCascade.for_task("problems").run_async(
+        call, escalate_located
+    )
+    left, top, right, bottom = tile_box
+    width, height = right - left, bottom - top
+
+    problems = []
+    for entry in (entries or [])[:MAX_PROBLEMS]:
+        box = normalised_box(entry.get("box"))
+        if box is not None:
+            x0, y0, x1, y1 = box
+            box = [
+                int(left + x0 * width),
+                int(top + y0 * height),
+                int(left + x1 * width),
+                int(top + y1 * height),
+            ]
+        problems.append(
+            {
+                "problem": str(entry["problem"]).strip(),
+                "box": box,
+                "tiles": [list(tile_box)],
+            }
+        )
+    return problems
+
+
+async def analyze_image_problems_tiled_async(
+    image,
+    api_key,
+    tile_size=1024,
+    overlap=0.2,
+    max_tiles=12,
+    min_information=12.0,
+    max_workers=4,
+):
+    """
+    High-resolution scanning mode: analyse overlapping full-resolution tiles,
+    skipping flat low-information tiles (bare walls, sky) and keeping at most
+    `max_tiles` of the most detailed ones, then merge the problems found.
+    At most `max_workers` tiles are in flight at once.
+    Returns a list of {"problem", "box", "tiles"} with boxes in image pixels.
+    """
+    genai.configure(api_key=api_key)
+
+    with span("analyze_image_problems_tiled", image=image) as tiling:
+        image = image.convert("RGB")
+        scored = []
+        for tile_box in split_into_tiles(image.size, tile_size, overlap):
+            tile = image.crop(tile_box)
+            score = tile_information(tile)
+            if score >= min_information:
+                scored.append((score, tile_box, tile))
+        scored.sort(key=lambda entry: -entry[0])
+        scored = scored[:max_tiles]
+
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def analyse(tile, tile_box):
+            async with semaphore:
+                return await analyze_tile_async(tile, tile_box)
+
+        outcomes = await asyncio.gather(
+            *(analyse(tile, tile_box) for _, tile_box, tile in scored),
+            return_exceptions=True,
+        )
+        problems = []
+        failed = 0
+        for (score, tile_box, _), tile_problems in zip(scored, outcomes):
+            if isinstance(tile_problems, Exception):
+                logger.warning(f"Tile {tile_box} analysis failed: {tile_problems}")
+                failed += 1
+                continue
+            for problem in tile_problems:
+                problem["score"] = score
+            problems.extend(tile_problems)
+        tiling.attributes["tiles"] = len(scored)
+        tiling.attributes["failed_tiles"] = failed
+
+        merged = merge_tile_problems(problems)
+        for problem in merged:
+            problem.pop("score", None)
+        return merged
+
+
+def analyze_image_problems_tiled(
+    image,
+    api_key,
+    tile_size=1024,
+    overlap=0.2,
+    max_tiles=12,
+    min_information=12.0,
+    max_workers=4,
+):
+    return run_sync(
+        analyze_image_problems_tiled_async(
+            image,
+            api_key,
+            tile_size=tile_size,
+            overlap=overlap,
+            max_tiles=max_tiles,
+            min_information=min_information,
+            max_workers=max_workers,
+        )
+    )
+
+
+def format_tiled_problems(problems):
+    """Text lines in the same shape as analyze_image_problems' output"""
+    if not problems:
+        return "No problems found"
+    lines = []
+    for problem in problems:
+        if problem["box"] is None:
+            lines.append(problem["problem"])
+            continue
+        x0, y0, x1, y1 = problem["box"]
+        lines.append(f"{problem['problem']} at ({(x0 + x1) // 2}, {(y0 + y1) // 2})")
+    return "\n".join(lines)
+
+
+CSV_BOX_COLUMNS = ["x_min", "y_min", "x_max", "y_max"]
+
+
+def save_to_csv(problems, image_file, output_file):
+    """
+    One row per problem. `problems` is the text of analyze_image_problems or
+    a list of {"problem", "box"}, whose normalised box fills the box columns.
+    """
+    if isinstance(problems, str):
+        lines = [line.strip() for line in problems.split("\n") if line.strip()]
+        if lines and lines[0].lower() == "no problems found":
+            lines = []
+        problems = [{"problem": line} for line in lines]
 
     with open(output_file, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(["Image", "Problem"])  # Header
+        writer.writerow(["Image", "Problem"] + CSV_BOX_COLUMNS)  # Header
 
-        if problems and problems[0].lower() != "no problems found":
-            for problem in problems:
-                writer.writerow([image_file, problem])
-        else:
-            writer.writerow([image_file, "No problems found"])
+        for problem in problems:
+            box = problem.get("box")
+            coordinates = [f"{v:.4f}" for v in box] if box else [""] * 4
+            writer.writerow([image_file, problem["problem"]] + coordinates)
+        if not problems:
+            writer.writerow([image_file, "No problems found"] + [""] * 4)
 
 
 def main():
     """Main function."""
-    if len(sys.argv) < 1:
-        print("Usage: python real_estate_problem_analyzer.py <image_file> [api_key]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Find problems in a room photo")
+    parser.add_argument("image_file")
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="Scan the full-resolution photo in overlapping tiles",
+    )
+    parser.add_argument(
+        "--locate",
+        action="store_true",
+        help="Also return a bounding box per problem, in the same request",
+    )
+    parser.add_argument(
+        "--highlight",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="Draw the numbered problem boxes locally (implies --locate)",
+    )
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--max-tiles", type=int, default=12)
+    parser.add_argument(
+        "--parquet", metavar="DIR", help="Also append the problems to a dataset"
+    )
+    args = parser.parse_args()
 
-    image_file = sys.argv[1]
+    image_file = args.image_file
     api_key = os.getenv("GOOGLE_API_KEY")
 
     if not api_key:
@@ -92,14 +502,46 @@ def main():
 
     try:
         print(f"Analyzing: {image_file}")
-        problems = analyze_image(image_file, api_key)
+        image = Image.open(image_file)
+        if args.tiled:
+            found = analyze_image_problems_tiled(
+                image,
+                api_key,
+                tile_size=args.tile_size,
+                max_tiles=args.max_tiles,
+            )
+            problems = format_tiled_problems(found)
+            found = normalise_boxes(found, image.size)
+        elif args.locate or args.highlight is not None:
+            found = analyze_image_problems_located(image.convert("RGB"), api_key)
+            problems = format_located_problems(found)
+        else:
+            found = problems = analyze_image(image_file, api_key)
         print(f"Found problems:\n{problems}")
 
         # Save to CSV
         output_file = f"problems_{os.path.basename(image_file)}.csv"
-        save_to_csv(problems, image_file, output_file)
+        save_to_csv(found, image_file, output_file)
         print(f"\nResults saved to: {output_file}")
 
+        if args.highlight is not None and isinstance(found, list):
+            from problem_overlay import draw_problems
+
+            stem = os.path.splitext(os.path.basename(image_file))[0]
+            highlighted = args.highlight or f"{stem}_problems_detected.jpg"
+            draw_problems(image, found).save(highlighted)
+            print(f"Marked image saved as: {highlighted}")
+
+        if args.parquet:
+            from analytics_export import export_property
+
+            export_property(
+                os.path.basename(image_file),
+                problems={os.path.basename(image_file): found},
+                root=args.parquet,
+            )
+            print(f"Problems appended to: {args.parquet}")
+
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
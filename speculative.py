@@ -0,0 +1,168 @@
+"""
+Speculative analysis of uploads
+-------------------------------
+Uploads are decoded and hashed as soon as they arrive (UploadManager), but the
+model calls used to wait for the address and the "Detect Anomalies" button.
+SpeculativeAnalysis starts classification, image analysis, problem detection
+and the anomaly overlay in the background right after upload, one task per
+(photo, step) on the shared event loop, so most results are ready by the time
+the user has typed the address. Steps of photos removed from the upload are
+cancelled; a step that failed or was cancelled is simply redone on demand.
+
+Usage:
+    speculation = SpeculativeAnalysis(upload_manager, api_key, prompt)
+    speculation.sync(photos, high_res=False)  # on every rerun
+    category = speculation.result(photo.file_hash, "category")  # None: do it now
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from PIL import Image
+
+from async_runner import submit
+from image_room_clasify import categorize_image_async_
+from nano_edit import detect_and_draw_async_
+from process_image import analyze_image_async_
+from real_estate_problem_analyzer import (
+    analyze_image_problems_located_async,
+    analyze_image_problems_tiled_async,
+    normalise_boxes,
+)
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def problems_step(high_res: bool) -> str:
+    return "problems_high_res" if high_res else "problems"
+
+
+class SpeculativeAnalysis:
+    """Per-session background analysis of uploads, keyed by file hash and step"""
+
+    def __init__(
+        self,
+        upload_manager,
+        api_key: str,
+        prompt: str,
+        local_classifier=None,
+        asset_cache=None,
+        targets: Sequence[str] = (),
+        vision_api_key: Optional[str] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        self.upload_manager = upload_manager
+        self.api_key = api_key
+        self.prompt = prompt
+        self.local_classifier = local_classifier
+        self.asset_cache = asset_cache
+        self.targets = list(targets)
+        self.vision_api_key = vision_api_key or api_key
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.futures: Dict[Tuple[str, str], concurrent.futures.Future] = {}
+        self.lock = threading.Lock()
+
+    def sync(self, photos, high_res: bool = False, skip: Set[str] = frozenset()):
+        """
+        Start the missing steps for `photos` (except file hashes in `skip`)
+        and cancel the steps of photos that are no longer uploaded.
+        """
+        current = {photo.file_hash for photo in photos}
+        with self.lock:
+            removed = [
+                self.futures.pop(key)
+                for key in list(self.futures)
+                if key[0] not in current
+            ]
+        # Outside the lock: cancelling runs the done callbacks right away
+        for future in removed:
+            future.cancel()
+
+        for photo in photos:
+            if photo.file_hash in skip:
+                continue
+            steps = ["category", "analysis", problems_step(high_res)]
+            if self.targets and self.asset_cache is not None:
+                steps.append("overlay")
+            with self.lock:
+                steps = [s for s in steps if (photo.file_hash, s) not in self.futures]
+            if steps:
+                self._start(photo, steps)
+
+    def _start(self, photo, steps: List[str]):
+        # One pinned analysis buffer shared by the steps, released after the last
+        image = self.upload_manager.analysis_image(photo)
+        remaining = [len(steps)]
+
+        def step_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.upload_manager.release(photo, keep=True)
+
+        for step in steps:
+            future = submit(self._run(step, photo, image))
+            with self.lock:
+                self.futures[(photo.file_hash, step)] = future
+            future.add_done_callback(step_done)
+
+    async def _run(self, step: str, photo, image: Image.Image):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            if step == "category":
+                return await categorize_image_async_(
+                    image, self.api_key, local_classifier=self.local_classifier
+                )
+            if step == "analysis":
+                return await analyze_image_async_(image, self.api_key, self.prompt)
+            if step == "problems":
+                return await analyze_image_problems_located_async(image, self.api_key)
+            if step == "problems_high_res":
+                full = photo.open_full_resolution()
+                problems = await analyze_image_problems_tiled_async(full, self.api_key)
+                return normalise_boxes(problems, full.size)
+            if step == "overlay":
+                overlay = await detect_and_draw_async_(
+                    image, self.targets, api_key=self.vision_api_key
+                )
+                # Rendered like the app's anomaly section, into the same cache
+                return self.asset_cache.overlay(
+                    photo.file_hash, self.targets, lambda: Image.fromarray(overlay)
+                )
+            raise ValueError(f"Unknown speculative step {step!r}")
+
+    def result(self, file_hash: str, step: str, timeout: Optional[float] = None):
+        """
+        Result of a speculative step, waiting for it if it is still running;
+        None if it was never started, failed or was cancelled.
+        """
+        with self.lock:
+            future = self.futures.get((file_hash, step))
+        if future is None:
+            return None
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            return None
+        except Exception:
+            with self.lock:
+                # Forget failures so the next sync retries them
+                if self.futures.get((file_hash, step)) is future:
+                    del self.futures[(file_hash, step)]
+            return None
+
+    def pending(self) -> int:
+        with self.lock:
+            return sum(not future.done() for future in self.futures.values())
+
+    def cancel_all(self):
+        with self.lock:
+            futures = list(self.futures.values())
+            self.futures.clear()
+        for future in futures:
+            future.cancel()
@@ -1,124 +1,251 @@
+import hashlib
 import json
 import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
 
-import altair as alt
-import openai
-import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
-from geopy.geocoders import Nominatim
 from PIL import Image
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 
+from apertus_client import analyze_description_async
+from asset_cache import DEFAULT_MAX_MB, AssetCache
+from description_parser import parse_description
+from image_hash import PerceptualHashIndex
 from image_room_clasify import clasify_image
+from job_queue import (
+    ACTIVE_STATUSES,
+    DEFAULT_JOBS_DIR,
+    JobQueue,
+    enqueue_property_analysis,
+    start_workers,
+)
+from lazy_import import lazy_module
+from local_room_classifier import load_default_classifier
 from nano_edit import detect_and_draw_
-from price_analasys import RenovationAnalyzer
 from process_image import analyze_image_
-from real_estate_problem_analyzer import analyze_image_problems
+from problem_dedup import ProblemIndex, dedupe_problems
+from problem_overlay import draw_problems
+from property_manifest import PropertyManifest
+from real_estate_problem_analyzer import (
+    analyze_image_problems_located,
+    analyze_image_problems_tiled,
+    format_located_problems,
+    normalise_boxes,
+)
+from speculative import SpeculativeAnalysis, problems_step
+from tracing import (
+    record_cache_hit,
+    span,
+    start_listing,
+    start_metrics_server,
+    tracer,
+)
+from upload_manager import DEFAULT_MEMORY_CAP_MB, UploadManager
+from video_keyframes import VIDEO_EXTENSIONS, KeyframeExtractor
+
+# Charting, tables and geocoding load on first use
+alt = lazy_module("altair")
+pd = lazy_module("pandas")
+geocoders = lazy_module("geopy.geocoders")
 
 # Load .env file
 load_dotenv()
 
+JOB_POLL_INTERVAL_S = 2.0
+ANOMALY_TARGETS = [
+    "couch",
+    "sofa",
+    "chair",
+    "bathtub",
+    "Countertop",
+    "Roof",
+    "roof",
+    "Wall",
+    "wall",
+    "House",
+    "Window",
+]
+
+
+COST_COLUMNS = [
+    "category",
+    "photo",
+    "label",
+    "description",
+    "cost",
+    "years_until",
+    "urgency",
+]
+LUMP_SUM_DESCRIPTIONS = {
+    "Immediate": "Immediate repairs",
+    "Future": "Future renovation",
+}
+MAX_CHART_SEGMENTS = 12
+
+
+def _cost_section_frame(entries, section, kind, years_until, urgency):
+    """Rows of one cost section (immediate or future) for all entries at once"""
+    prefix = f"cost_analysis.{section}"
+    default = LUMP_SUM_DESCRIPTIONS[kind]
+    sections = pd.DataFrame(
+        {
+            "category": entries["category"],
+            "photo": entries.get(
+                "photo_path", pd.Series(None, index=entries.index, dtype=object)
+            ),
+            "description": entries.get(f"{prefix}.description", default),
+            "lump_sum": pd.to_numeric(
+                entries.get(f"{prefix}.estimated_cost_chf", 0), errors="coerce"
+            ),
+            "items": entries.get(
+                f"{prefix}.items", pd.Series(None, index=entries.index)
+            ),
+            "years_until": years_until,
+            "urgency": urgency,
+        }
+    )
+    sections["description"] = sections["description"].fillna(default)
+    sections["lump_sum"] = sections["lump_sum"].fillna(0.0)
+    has_items = sections["items"].map(
+        lambda items: isinstance(items, list) and len(items) > 0
+    )
+
+    # If items are provided, plot each (avoids double counting the lump sum)
+    itemised = sections[has_items].explode("items", ignore_index=True)
+    item_fields = pd.DataFrame(
+        [item if isinstance(item, dict) else {} for item in itemised["items"]],
+        index=itemised.index,
+        columns=["item", "cost"],
+    )
+    itemised = itemised.assign(
+        label=f"{kind} · " + item_fields["item"].fillna("Item").astype(str),
+        cost=pd.to_numeric(item_fields["cost"], errors="coerce"),
+    )
+
+    # else plot the lump sum if > 0
+    lump = sections[~has_items & (sections["lump_sum"] > 0)].assign(
+        label=f"{kind} · " + ("Repairs" if kind == "Immediate" else "Renovation"),
+        cost=lambda df: df["lump_sum"],
+    )
+    frame = pd.concat([itemised, lump], ignore_index=True)
+    frame["cost"] = frame["cost"].fillna(0.0).astype(float)
+    return frame[COST_COLUMNS]
+
 
-def extract_cost_rows(analysis_json):
+def extract_cost_frame(analysis_json):
     """
-    Turns the LLM analysis JSON into tidy rows for plotting.
-    Supports multiple top-level categories, each with a list of entries.
+    Turns the LLM analysis JSON into a tidy DataFrame for plotting.
+    Supports multiple top-level categories, each with a list of entries;
+    the nested entries are flattened column-wise with pd.json_normalize.
     """
-    rows = []
     if not isinstance(analysis_json, dict):
-        return rows
-
-    for category, entries in analysis_json.items():
-        if not isinstance(entries, list):
-            continue
-        for entry in entries:
-            cat = entry.get("category", category)
-            rp = entry.get("renovation_prediction", {}) or {}
-            years_until = rp.get("years_until_renovation_needed")
-            urgency = rp.get("urgency_level")
-
-            cost = entry.get("cost_analysis") or {}
-            # Immediate repairs (single lump sum + optional items)
-            imm = cost.get("immediate_repairs") or {}
-            imm_cost = imm.get("estimated_cost_chf", 0) or 0
-            imm_desc = imm.get("description", "Immediate repairs")
-            imm_items = imm.get("items") or []
-            # If items are provided, plot each; else plot the lump sum if > 0
-            if imm_items:
-                for it in imm_items:
-                    rows.append(
-                        {
-                            "category": cat,
-                            "label": f"Immediate · {it.get('item','Item')}",
-                            "description": imm_desc,
-                            "cost": float(it.get("cost", 0) or 0),
-                            "years_until": 0,
-                            "urgency": "immediate",
-                        }
-                    )
-            elif imm_cost > 0:
-                rows.append(
-                    {
-                        "category": cat,
-                        "label": "Immediate · Repairs",
-                        "description": imm_desc,
-                        "cost": float(imm_cost),
-                        "years_until": 0,
-                        "urgency": "immediate",
-                    }
-                )
+        return pd.DataFrame(columns=COST_COLUMNS)
+    entries = [
+        {**entry, "category": entry.get("category", category)}
+        for category, category_entries in analysis_json.items()
+        if isinstance(category_entries, list)
+        for entry in category_entries
+        if isinstance(entry, dict)
+    ]
+    if not entries:
+        return pd.DataFrame(columns=COST_COLUMNS)
+
+    entries = pd.json_normalize(entries, max_level=2)
+    empty = pd.Series(None, index=entries.index, dtype=object)
+    immediate = _cost_section_frame(
+        entries, "immediate_repairs", "Immediate", 0, "immediate"
+    )
+    future = _cost_section_frame(
+        entries,
+        "future_renovation",
+        "Future",
+        entries.get("renovation_prediction.years_until_renovation_needed", empty),
+        entries.get("renovation_prediction.urgency_level", empty),
+    )
+    return pd.concat([immediate, future], ignore_index=True)
+
+
+def merge_duplicate_costs(df):
+    """
+    Keeps one row per distinct cost item of a category, at its highest
+    estimate: the same repair seen on several photos is costed once. Matches
+    problem_dedup.dedupe_cost_items: items of one photo and lump sums without
+    their own description are never merged.
+    """
+    parts = df["label"].str.split(" · ", n=1)
+    kind, item = parts.str[0], parts.str[1]
+    lump = item.isin(["Repairs", "Renovation"])
+    text = item.where(~lump, df["description"])
+    unnamed = lump & (df["description"] == kind.map(LUMP_SUM_DESCRIPTIONS))
+    index = ProblemIndex(match_heads=True)
+    clusters = [
+        # Negative ids keep unnamed lump sums apart from every cluster
+        -1 - i if skip else index.add(t, group=(category, k), photo=photo)
+        for i, (t, category, k, photo, skip) in enumerate(
+            zip(text, df["category"], kind, df["photo"], unnamed)
+        )
+    ]
+    return (
+        df.assign(cluster=clusters)
+        .sort_values("cost", ascending=False)
+        .drop_duplicates("cluster")
+        .drop(columns="cluster")
+    )
+
+
+def aggregate_cost_segments(df, max_segments=MAX_CHART_SEGMENTS):
+    """
+    Pre-aggregates cost rows to one row per (category, segment), keeping the
+    `max_segments` most expensive segments and folding the rest into
+    "Other", so the chart payload is bounded whatever the number of items.
+    """
+    totals = df.groupby("label")["cost"].sum().sort_values(ascending=False)
+    keep = totals.index[:max_segments]
+    df = df.assign(label=df["label"].where(df["label"].isin(keep), "Other"))
+    return (
+        df.groupby(["category", "label"], as_index=False, sort=False)
+        .agg(
+            cost=("cost", "sum"),
+            items=("cost", "size"),
+            description=("description", "first"),
+            urgency=("urgency", "first"),
+            years_until=("years_until", "min"),
+        )
+        .sort_values("cost", ascending=False, ignore_index=True)
+    )
 
-            # Future renovation (lump sum + items)
-            fut = cost.get("future_renovation") or {}
-            fut_desc = fut.get("description", "Future renovation")
-            fut_items = fut.get("items") or []
-            fut_lump = float(fut.get("estimated_cost_chf", 0) or 0)
-
-            # If itemized, prefer item rows (avoid double counting lump sum)
-            if fut_items:
-                for it in fut_items:
-                    rows.append(
-                        {
-                            "category": cat,
-                            "label": f"Future · {it.get('item','Item')}",
-                            "description": fut_desc,
-                            "cost": float(it.get("cost", 0) or 0),
-                            "years_until": years_until,
-                            "urgency": urgency,
-                        }
-                    )
-            elif fut_lump > 0:
-                rows.append(
-                    {
-                        "category": cat,
-                        "label": "Future · Renovation",
-                        "description": fut_desc,
-                        "cost": fut_lump,
-                        "years_until": years_until,
-                        "urgency": urgency,
-                    }
-                )
-    return rows
+
+def format_chf(costs):
+    """CHF 12'345 labels for a whole Series at once"""
+    return "CHF " + costs.round().astype("int64").astype(str).str.replace(
+        r"\B(?=(\d{3})+(?!\d))", "'", regex=True
+    )
 
 
 def build_cost_chart(analysis_json, width=800, bar_height=42):
     """
     Returns an Altair horizontal stacked bar chart with tooltips.
-    One bar per category; segments per cost item.
+    One bar per category; segments per (aggregated) cost item.
     """
-    rows = extract_cost_rows(analysis_json)
-    if not rows:
+    df = extract_cost_frame(analysis_json)
+    if df.empty:
         return None
 
-    df = pd.DataFrame(rows)
-    print("DataFrame for Chart:", df)
+    df = aggregate_cost_segments(merge_duplicate_costs(df))
+    df["years_until"] = pd.to_numeric(df["years_until"], errors="coerce")
 
     # Format CHF in tooltip via calculated field (keeps axis numeric)
-    df["cost_chf"] = df["cost"].map(lambda x: f"CHF {int(x):,}".replace(",", "'"))
+    df["cost_chf"] = format_chf(df["cost"])
 
     # Height scales with number of categories
     n_categories = df["category"].nunique()
-    chart_height = max(60 * 5, 60 + 10)
+    chart_height = max(60 * 5, 60 * n_categories + 10)
 
     chart = (
         alt.Chart(df)
@@ -130,6 +257,7 @@ def build_cost_chart(analysis_json, width=800, bar_height=42):
             tooltip=[
                 alt.Tooltip("category:N", title="Category"),
                 alt.Tooltip("label:N", title="Item"),
+                alt.Tooltip("items:Q", title="Items"),
                 alt.Tooltip("description:N", title="Description"),
                 alt.Tooltip("cost_chf:N", title="Cost"),
                 alt.Tooltip("urgency:N", title="Urgency"),
@@ -145,19 +273,292 @@ def build_cost_chart(analysis_json, width=800, bar_height=42):
     return chart
 
 
+def start_description_stream(property_description, apertus_api_key, placeholder):
+    """
+    Starts the Apertus description analysis in the background and streams its
+    tokens into `placeholder` while the rest of the script keeps running.
+    Returns the (future, render thread) pair to join at the end of the run.
+    """
+    tokens = queue.Queue()
+    future = analyze_description_async(
+        property_description, apertus_api_key, on_token=tokens.put
+    )
+    future.add_done_callback(lambda _: tokens.put(None))
+
+    def render():
+        placeholder.write("#### Processing description 🚀")
+        output_chunks = []
+        last_render = 0.0
+        while True:
+            token = tokens.get()
+            if token is None:
+                break
+            output_chunks.append(token)
+            # Throttle UI updates, one websocket message per token is too chatty
+            if time.monotonic() - last_render > 0.1:
+                placeholder.markdown(
+                    "#### Processing description 🚀\n\n" + "".join(output_chunks)
+                )
+                last_render = time.monotonic()
+
+        if not future.cancelled() and future.exception() is None:
+            placeholder.markdown(
+                "#### Description successfully processed with Apertus ✅\n\n"
+                + future.result()
+            )
+        else:
+            placeholder.empty()
+
+    render_thread = threading.Thread(target=render, daemon=True)
+    add_script_run_ctx(render_thread)
+    render_thread.start()
+    return future, render_thread
+
+
+@st.cache_resource
+def get_asset_cache():
+    """Encoded thumbnails and overlays, shared by all sessions (content-hashed)"""
+    return AssetCache(max_mb=float(os.getenv("ASSET_CACHE_MB", DEFAULT_MAX_MB)))
+
+
+def render_timing_panel(listing_id):
+    """Per-listing breakdown of where the time and tokens went"""
+    spans = tracer.spans_for_listing(listing_id)
+    if not spans:
+        return
+
+    df = pd.DataFrame([s.to_dict() for s in spans])
+    summary = (
+        df.groupby("stage")
+        .agg(
+            calls=("stage", "size"),
+            total_s=("latency_s", "sum"),
+            p50_s=("latency_s", "median"),
+            p95_s=("latency_s", lambda x: x.quantile(0.95)),
+            input_tokens=("input_tokens", "sum"),
+            output_tokens=("output_tokens", "sum"),
+            cache_hits=("cache_hit", "sum"),
+            retries=("retries", "sum"),
+            errors=("error", "count"),
+        )
+        .sort_values("total_s", ascending=False)
+    )
+
+    with st.expander("⏱️ Pipeline timing for this listing"):
+        st.bar_chart(summary["total_s"])
+        st.dataframe(summary.round(3), use_container_width=True)
+
+
+def render_cost_analysis(cost_analysis):
+    """Cost chart and per-category breakdown of a renovation analysis"""
+    # Here the horizontal bar chart for renovation costs is displayed
+    st.write("#### Cost Breakdown (interactive)")
+
+    chart = build_cost_chart(cost_analysis)
+
+    # streamlit embed chart box
+    if chart is not None:
+        st.container()
+        st.altair_chart(chart, use_container_width=True)
+    else:
+        st.info("No renovation expected 🤠👍.")
+
+    # Iterate through the categories in the JSON
+    for category, items in cost_analysis.items():
+        st.write(f"## {category}")  # Display the category name (e.g., "Kitchen")
+
+        for item in items:
+            # Display Photo Analysis
+            # with st.expander("Photo Analysis", expanded=True):
+            #     st.write("**Visible Elements:**")
+            #     st.write(", ".join(item["photo_analysis"]["visible_elements"]))
+            #     st.write(
+            #         "**Overall Condition:**",
+            #         item["photo_analysis"]["overall_condition"],
+            #     )
+            #     st.write(
+            #         "**Condition Details:**",
+            #         item["photo_analysis"]["condition_details"],
+            #     )
+
+            # Display Age Assessment
+            with st.expander("Age Assessment", expanded=True):
+                st.write(
+                    "**Estimated Years Since Renovation:**",
+                    item["age_assessment"]["estimated_years_since_renovation"],
+                )
+                st.write(
+                    "**Confidence Level:**",
+                    item["age_assessment"]["confidence_level"],
+                )
+                st.write("**Aging Indicators:**")
+                st.write(", ".join(item["age_assessment"]["aging_indicators"]))
+
+            # Display Renovation Prediction
+            with st.expander("Renovation Prediction", expanded=True):
+                st.write(
+                    "**Years Until Renovation Needed:**",
+                    item["renovation_prediction"]["years_until_renovation_needed"],
+                )
+                st.write(
+                    "**Urgency Level:**",
+                    item["renovation_prediction"]["urgency_level"],
+                )
+                st.write("**Recommended Actions:**")
+                st.write(
+                    ", ".join(item["renovation_prediction"]["recommended_actions"])
+                )
+
+            # Display Risk Assessment
+            with st.expander("Risk Assessment", expanded=True):
+                st.write("**Safety Risks:**")
+                st.write(", ".join(item["risk_assessment"]["safety_risks"]))
+                st.write("**Damage Risks:**")
+                st.write(", ".join(item["risk_assessment"]["damage_risks"]))
+                st.write(
+                    "**Priority Level:**",
+                    item["risk_assessment"]["priority_level"],
+                )
+
+
+@st.cache_resource
+def get_job_queue():
+    """Job queue shared by all sessions, starting local workers unless JOB_WORKERS=0"""
+    queue = JobQueue()
+    n_workers = int(os.getenv("JOB_WORKERS", os.cpu_count() or 1))
+    if n_workers > 0:
+        start_workers(n_workers, queue.path)
+    return queue
+
+
+def get_speculation(
+    upload_manager, api_key, prompt, local_classifier, asset_cache, vision_api_key
+):
+    """Background analysis of this session's uploads, see speculative.py"""
+    if "speculation" not in st.session_state:
+        st.session_state["speculation"] = SpeculativeAnalysis(
+            upload_manager,
+            api_key,
+            prompt,
+            local_classifier=local_classifier,
+            asset_cache=asset_cache,
+            targets=ANOMALY_TARGETS,
+            vision_api_key=vision_api_key,
+        )
+    return st.session_state["speculation"]
+
+
+def get_property_manifest(address):
+    """Manifest of the property at `address`, or of this session's listing"""
+    if "property_key" not in st.session_state:
+        st.session_state["property_key"] = f"session-{uuid.uuid4()}"
+    return PropertyManifest.for_property(address or st.session_state["property_key"])
+
+
+def enqueue_renovation_job(photos, property_description, manifest):
+    """
+    Snapshot the categorised photos and enqueue their renovation analysis.
+    The same photos and description map to the same job, across reruns too;
+    photos already costed for this property are reused from its result cache.
+    """
+    job_key = hashlib.sha1(
+        json.dumps(
+            [sorted(photo.file_hash for photo in photos), property_description]
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+    photos_dir = os.path.join(DEFAULT_JOBS_DIR, job_key, "Categorised_photos")
+    if not os.path.exists(photos_dir):
+        shutil.copytree(manifest.photos_dir, photos_dir)
+    return enqueue_property_analysis(
+        get_job_queue(),
+        photos_dir,
+        description=property_description or None,
+        categorised=True,
+        dedupe_key=job_key,
+        result_cache=manifest.result_cache_path,
+    )
+
+
+def render_renovation_job(job_id):
+    """Status of the renovation job, then its results once it succeeded"""
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        st.error(f"Renovation job {job_id} not found")
+        return
+
+    if job["status"] in ACTIVE_STATUSES:
+        progress = job["progress"] or "waiting for a worker"
+        st.info(f"Renovation analysis {job['status']} (job {job_id}): {progress}")
+        if st.button("Cancel renovation analysis", key=f"cancel-{job_id}"):
+            queue.cancel(job_id)
+        return
+    if job["status"] != "succeeded":
+        st.error(f"Renovation analysis {job['status']}: {job['error'] or ''}")
+        return
+
+    with open(job["result"]["results_path"], "r", encoding="utf-8") as f:
+        render_cost_analysis(json.load(f))
+
+
 def load_prompt(prompt_file):
     """Load the prompt from a text file."""
     with open(prompt_file, "r") as file:
         return file.read()
 
 
+def walkthrough_keyframes(video, upload_manager) -> list:
+    """
+    Keyframes of an uploaded video as photos of the upload manager, added as
+    they are extracted and counted against its memory cap. Extracted once per
+    video; only their file hashes are kept in the session state.
+    """
+    if video is None:
+        # Its keyframes are forgotten by the next sync
+        st.session_state.pop("walkthrough", None)
+        return []
+    key = (getattr(video, "file_id", video.name), video.size)
+    walkthrough = st.session_state.get("walkthrough")
+    if walkthrough is None or walkthrough["key"] != key:
+        hashes = []
+        # OpenCV reads from a path, so the upload is spooled to a temp file
+        suffix = os.path.splitext(video.name)[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix) as spooled:
+            video.seek(0)
+            shutil.copyfileobj(video, spooled)
+            spooled.flush()
+            with st.spinner("Selecting keyframes from the walkthrough video..."):
+                for upload in KeyframeExtractor.from_env().uploads(
+                    spooled.name, video.name
+                ):
+                    if not upload_manager.has_room(len(upload.getvalue())):
+                        st.warning(
+                            f"Memory cap reached after {len(hashes)} keyframes, "
+                            "the rest of the video is skipped"
+                        )
+                        break
+                    hashes.append(upload_manager.add(upload, held=True).file_hash)
+        walkthrough = {"key": key, "hashes": hashes}
+        st.session_state["walkthrough"] = walkthrough
+    photos = [upload_manager.get(h) for h in walkthrough["hashes"]]
+    return [photo for photo in photos if photo is not None]
+
+
 def main():
 
     st.title("HouseEval AI")
+    # One listing per session: the spans of earlier reruns (speculative
+    # analysis started on upload) belong to the same listing
+    if "listing_id" not in st.session_state:
+        st.session_state["listing_id"] = uuid.uuid4().hex[:12]
+    listing_id = start_listing(st.session_state["listing_id"])
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
     api_key = os.getenv("GOOGLE_API_KEY")
     video_key = os.getenv("GOOGLE_API_KEY")
     apertus_api_key = os.getenv("APERTUS_SWISSCOM_API_KEY")
-    analyzer = RenovationAnalyzer(api_key)
+    # Optional CPU pre-filter, only ambiguous photos go to Gemini
+    local_classifier = load_default_classifier()
 
     prompt_file = "streamlit-image-uploader/prompt.txt"
     prompt = load_prompt(prompt_file)
@@ -165,6 +566,13 @@ def main():
     uploaded_files = st.file_uploader(
         "Choose images...", type=["jpg", "jpeg", "png"], accept_multiple_files=True
     )
+    walkthrough_video = st.file_uploader(
+        "Or a walkthrough video (distinct, sharp frames are used as photos)",
+        type=sorted(extension.lstrip(".") for extension in VIDEO_EXTENSIONS),
+    )
+    high_res_scan = st.checkbox(
+        "High-resolution defect scan (slower, finds hairline cracks and small mould patches)"
+    )
 
     st.write("### Uploaded Images")
     images_container = st.container()
@@ -177,82 +585,207 @@ def main():
         "Add a description of the property (e.g., location, size, condition, etc.):"
     )
 
-    if uploaded_files:
+    # Each upload is decoded once into a thumbnail and an analysis buffer
+    if "upload_manager" not in st.session_state:
+        st.session_state["upload_manager"] = UploadManager(
+            memory_cap_mb=float(
+                os.getenv("SESSION_MEMORY_CAP_MB", DEFAULT_MEMORY_CAP_MB)
+            )
+        )
+    upload_manager = st.session_state["upload_manager"]
+    keyframes = walkthrough_keyframes(walkthrough_video, upload_manager)
+    photos = upload_manager.sync(
+        uploaded_files, keep=[photo.file_hash for photo in keyframes]
+    )
+    uploaded = {photo.file_hash for photo in photos}
+    photos += [photo for photo in keyframes if photo.file_hash not in uploaded]
+    asset_cache = get_asset_cache()
+
+    # Near-duplicate uploads are clustered so each cluster is analysed once
+    duplicate_index = PerceptualHashIndex()
+
+    if photos:
         # Create a horizontal scrollable container for images
         # add a button to process the images
 
         with images_container:
-            cols = st.columns(len(uploaded_files))
-            for col, uploaded_file in zip(cols, uploaded_files):
-                image = Image.open(uploaded_file)
+            cols = st.columns(len(photos))
+            for i, (col, photo) in enumerate(zip(cols, photos)):
+                duplicate_index.add_hash(i, photo.phash)
                 # analysis = analyze_image_(image, api_key)
                 # print(analysis)
                 col.image(
-                    image, caption=f"{uploaded_file.name}", use_container_width=True
+                    asset_cache.thumbnail(photo.file_hash, photo.thumbnail),
+                    caption=f"{photo.name}",
+                    use_container_width=True,
                 )
 
                 # Section for property description
 
+            n_clusters = len(duplicate_index.representatives)
+            if n_clusters < len(photos):
+                st.caption(
+                    f"{len(photos) - n_clusters} near-duplicate photo(s) "
+                    f"detected, analysing {n_clusters} distinct photo(s)."
+                )
+
+    # Classification, analysis, problems and anomaly overlays start in the
+    # background right after upload, so they are mostly done once the address
+    # is in; photos the property manifest already has are skipped
+    speculation = get_speculation(
+        upload_manager, api_key, prompt, local_classifier, asset_cache, video_key
+    )
+    if os.getenv("SPECULATIVE_ANALYSIS", "1") != "0":
+        skip = set()
+        if address:
+            manifest = get_property_manifest(address)
+            skip = {
+                photo.file_hash
+                for photo in photos
+                if manifest.stored_row(photo.file_hash, high_res=high_res_scan)
+                is not None
+            }
+        speculation.sync(
+            [photos[i] for i in duplicate_index.representatives],
+            high_res=high_res_scan,
+            skip=skip,
+        )
+
     if address:
+        description_job = None
+        if property_description:
+            # Start Apertus right away so its answer streams in while the
+            # images are being processed
+            description_job = start_description_stream(
+                property_description, apertus_api_key, st.empty()
+            )
+
+            # Facts the listing states are parsed locally and feed the cost engine
+            property_details = parse_description(property_description)
+            facts = {
+                name: value
+                for name, value in property_details.to_dict().items()
+                if name != "sources" and value is not None
+            }
+            if facts:
+                st.write("#### Facts from the description")
+                st.dataframe(pd.DataFrame([facts]), use_container_width=True)
+
         if st.button("Detect Anomalies"):
             st.write("### Anomaly Detection Results")
-            targets = [
-                "couch",
-                "sofa",
-                "chair",
-                "bathtub",
-                "Countertop",
-                "Roof",
-                "roof",
-                "Wall",
-                "wall",
-                "House",
-                "Window",
-            ]
+            targets = ANOMALY_TARGETS
             anomaly_container = st.container()
             with anomaly_container:
-                cols = st.columns(len(uploaded_files))
-                for col, uploaded_file in zip(cols, uploaded_files):
-                    image = Image.open(uploaded_file)
-                    # downsample image
-                    image = image.resize((512, 512))
-                    output_image_path = f"anomaly_{uploaded_file.name}"
-                    try:
-                        img = detect_and_draw_(
-                            image, target_objects=targets, api_key=video_key
-                        )
-                    except Exception as e:
-                        st.error(
-                            f"Error processing anomalies {uploaded_file.name}: {e}"
+                anomaly_images = {}
+                cols = st.columns(len(photos))
+                for i, (col, photo) in enumerate(zip(cols, photos)):
+                    representative = duplicate_index.representative(i)
+                    if representative in anomaly_images:
+                        record_cache_hit("detect_and_draw_")
+                        col.image(
+                            anomaly_images[representative],
+                            caption=f"Anomalies in {photo.name} "
+                            f"(same as {photos[representative].name})",
+                            use_container_width=True,
                         )
                         continue
-                    # Transform from cv2 to PIL
-                    output_im = Image.fromarray(img)
+
+                    # Overlays are cached per file hash and target list, wait
+                    # for the speculative one if it is still being rendered
+                    speculation.result(photo.file_hash, "overlay")
+                    output_im = asset_cache.get(
+                        asset_cache.overlay_key(photo.file_hash, targets)
+                    )
+                    if output_im is not None:
+                        record_cache_hit("detect_and_draw_")
+                    else:
+                        # 512x512 buffer, kept for the analysis loop below
+                        image = upload_manager.analysis_image(photo)
+                        try:
+                            output_im = asset_cache.overlay(
+                                photo.file_hash,
+                                targets,
+                                # Transform from cv2 to PIL
+                                lambda: Image.fromarray(
+                                    detect_and_draw_(
+                                        image, target_objects=targets, api_key=video_key
+                                    )
+                                ),
+                            )
+                        except Exception as e:
+                            st.error(f"Error processing anomalies {photo.name}: {e}")
+                            continue
+                        finally:
+                            upload_manager.release(photo, keep=True)
+                    anomaly_images[i] = output_im
                     # output_image = Image.open(output_image_path)
                     col.image(
                         output_im,
-                        caption=f"Anomalies in {uploaded_file.name}",
+                        caption=f"Anomalies in {photo.name}",
                         use_container_width=True,
                     )
 
+        # Photos analysed in an earlier run of this property are reused,
+        # only new or replaced ones go through the models
+        manifest = get_property_manifest(address)
+        manifest.prune(photo.file_hash for photo in photos)
+
         results = []
-        counter = 0
-
-        for uploaded_file in uploaded_files:
-            # Simulate processing with random outputs
-            image = Image.open(uploaded_file)
-            # downsample image
-            image = image.resize((512, 512))
-
-            # Clasify the image
-            try:
-                clasify_image(image, api_key, counter)
-            except Exception as e:
-                st.error(f"Error classifying image {uploaded_file.name}: {e}")
+        analysed_rows = {}
+
+        for i, photo in enumerate(photos):
+            # Reuse the analysis of the cluster's representative for duplicates
+            representative = duplicate_index.representative(i)
+            if representative in analysed_rows:
+                record_cache_hit("analyze_image_")
+                results.append(
+                    {**analysed_rows[representative], "Image Name": photo.name}
+                )
+                continue
+
+            stored_row = manifest.stored_row(photo.file_hash, high_res=high_res_scan)
+            if stored_row is not None:
+                record_cache_hit("analyze_image_")
+                analysed_rows[i] = {**stored_row, "Image Name": photo.name}
+                results.append(analysed_rows[i])
+                upload_manager.release(photo)
                 continue
-            counter += 1
-            analysis = analyze_image_(image, api_key, prompt=prompt)
-            problems = analyze_image_problems(image, api_key)
+
+            # Downsampled buffer from the single decode, released once processed
+            image = upload_manager.analysis_image(photo)
+
+            # Clasify the image, unless the speculative classification did
+            category = None
+            if photo.file_hash not in manifest:
+                category = speculation.result(photo.file_hash, "category")
+            if category is not None:
+                manifest.add_image(photo.file_hash, photo.name, category, image)
+            elif photo.file_hash not in manifest:
+                try:
+                    category = clasify_image(
+                        image,
+                        api_key,
+                        local_classifier=local_classifier,
+                        root_folder=manifest.photos_dir,
+                        image_name=manifest.image_name(photo.file_hash),
+                    )
+                except Exception as e:
+                    st.error(f"Error classifying image {photo.name}: {e}")
+                    upload_manager.release(photo)
+                    continue
+                manifest.add(photo.file_hash, photo.name, category)
+            analysis = speculation.result(photo.file_hash, "analysis")
+            if analysis is None:
+                analysis = analyze_image_(image, api_key, prompt=prompt)
+            # Problems with their normalised boxes, drawn locally below
+            problems = speculation.result(photo.file_hash, problems_step(high_res_scan))
+            if problems is None and high_res_scan:
+                full = photo.open_full_resolution()
+                problems = normalise_boxes(
+                    analyze_image_problems_tiled(full, api_key), full.size
+                )
+            elif problems is None:
+                problems = analyze_image_problems_located(image, api_key)
 
             # big results
 
@@ -280,31 +813,38 @@ def main():
                     )  # Parse the JSON string into a dictionary
 
                 except json.JSONDecodeError as e:
-                    st.error(
-                        f"Failed to parse analysis result for {uploaded_file.name}: {e}"
-                    )
+                    st.error(f"Failed to parse analysis result for {photo.name}: {e}")
                     analysis = {}  # Use an empty dictionary if parsing fails
             # transform analysis into a dictionary
             # Append results for the table
-            results.append(
-                {
-                    "Image Name": uploaded_file.name,
-                    "Facade": analysis.get("facade", ""),
-                    "Roof": analysis.get("roof", ""),
-                    "Secondary Rooms": analysis.get("secondary_rooms", ""),
-                    "Electrical": analysis.get("electrical", ""),
-                    "Sanitary": analysis.get("sanitary", ""),
-                    "Heating": analysis.get("heating", ""),
-                    "Moisture": analysis.get("moisture", ""),
-                    "Elevators": analysis.get("elevators", ""),
-                    "Overall Grade": analysis.get("overall_grade", ""),
-                    "Problems": problems,
-                }
-            )
+            analysed_rows[i] = {
+                "Image Name": photo.name,
+                "Facade": analysis.get("facade", ""),
+                "Roof": analysis.get("roof", ""),
+                "Secondary Rooms": analysis.get("secondary_rooms", ""),
+                "Electrical": analysis.get("electrical", ""),
+                "Sanitary": analysis.get("sanitary", ""),
+                "Heating": analysis.get("heating", ""),
+                "Moisture": analysis.get("moisture", ""),
+                "Elevators": analysis.get("elevators", ""),
+                "Overall Grade": analysis.get("overall_grade", ""),
+                "Problems": problems,
+            }
+            results.append(analysed_rows[i])
+            manifest.set_row(photo.file_hash, analysed_rows[i], high_res=high_res_scan)
+            upload_manager.release(photo)
+        manifest.save()
 
         # Display all results in a single table
         # st.table(results)
         df_results = pd.DataFrame(results)  # Convert the results list to a DataFrame
+        located = {
+            row["Image Name"]: row["Problems"]
+            for row in results
+            if isinstance(row["Problems"], list) and row["Problems"]
+        }
+        if "Problems" in df_results:
+            df_results["Problems"] = df_results["Problems"].map(format_located_problems)
 
         # Apply custom styles to the DataFrame
         styled_df = df_results.style.set_properties(
@@ -314,152 +854,60 @@ def main():
         # Display the styled DataFrame
         st.dataframe(styled_df, use_container_width=True)
 
-        # Price analysis section
-        print("Starting renovation analysis with Gemini 2.0-flash...")
-        print(f"Found {len(analyzer.category_data)} categories in CSV")
-        print(
-            f"Will analyze folders: {list(analyzer.folder_to_category_mapping.keys())}"
+        # The same problem photographed from several angles is listed once
+        categories = {
+            photo.name: manifest.get(photo.file_hash)["category"]
+            for photo in photos
+            if photo.file_hash in manifest
+        }
+        distinct_problems = dedupe_problems(
+            {row["Image Name"]: row["Problems"] for row in results}, categories
         )
-
-        # Run analysis
-        results = analyzer.analyze_all_categories()
-
-        # Save results
-        analyzer.save_results(results)
-
-        # Generate and save summary report
-        summary = analyzer.generate_summary_report(results)
-        with open("renovation_analysis_summary.md", "w", encoding="utf-8") as f:
-            f.write(summary)
-
-        print("\nAnalysis complete!")
-        print(f"Results saved to: renovation_analysis_results.json")
-        print(f"Summary report saved to: renovation_analysis_summary.md")
-
-        if property_description:
-            tmp = st.empty()
-
-            with tmp:
-                st.write("#### Processing description 🚀")
-
-            # Analyse property description with LLM
-            client = openai.OpenAI(
-                api_key=apertus_api_key,
-                base_url="https://api.swisscom.com/layer/swiss-ai-weeks/apertus-70b/v1",
+        listed = sum(len(problem["photos"]) for problem in distinct_problems)
+        if listed > len(distinct_problems):
+            st.write("#### Distinct problems")
+            st.caption(
+                f"{listed} problems listed across photos, "
+                f"{len(distinct_problems)} distinct."
             )
-
-            stream = client.chat.completions.create(
-                model="swiss-ai/Apertus-70B",
-                messages=[
+            st.dataframe(
+                pd.DataFrame(
                     {
-                        "role": "system",
-                        "content": "You are the world's best real estate expert. I need you to read the \
-                    following description of a property and return me an opinion. \
-                    Your response should be concise, and have up to 150 words for potential real estate \
-                    buyers or morgage provider, depending on the use case the user is signalizing. \
-                    Your answer should be a holistic but very short analysis but also concentrated on \
-                    whether renovations might be needed. Note that the very first thing you need to tell \
-                    me is the year the building was constructed, and summarize all renovations performed in \
-                    the property if the user has included these. \
-                    STRUCTURE IT WITH BULLET POINTS. ANSWER ONLY IN ENGLISH, 200 WORDS ABSOLUTE MAX!",
-                    },
-                    {"role": "user", "content": property_description},
-                ],
-                stream=True,
+                        "Problem": [p["problem"] for p in distinct_problems],
+                        "Category": [p["category"] for p in distinct_problems],
+                        "Photos": [", ".join(p["photos"]) for p in distinct_problems],
+                    }
+                ),
+                use_container_width=True,
             )
 
-            output_chunks = []
-            for chunk in stream:
-                content = chunk.choices[0].delta.content or ""
-                output_chunks.append(content)
-                print(content, end="", flush=True)
-
-            # Join all chunks into a single string
-            # TODO: Feed back description outputs as a summary
-            description_output = "".join(output_chunks)
-
-            # remove
-            tmp.empty()
-            st.write("#### Description successfully processed with Apertus ✅")
-            st.write(description_output)
-        # Here the horizontal bar chart for renovation costs is displayed
-        st.write("#### Cost Breakdown (interactive)")
-
-        with open(
-            "renovation_analysis_results.json",
-            "r",
-        ) as f:
-            cost_analysis = json.load(f)
-            chart = build_cost_chart(cost_analysis)
-
-            # streamlit embed chart box
-            if chart is not None:
-                st.container()
-                st.altair_chart(chart, use_container_width=True)
-            else:
-                st.info("No renovation expected 🤠👍.")
-
-        # Iterate through the categories in the JSON
-        for category, items in cost_analysis.items():
-            st.write(f"## {category}")  # Display the category name (e.g., "Kitchen")
-
-            for item in items:
-                # Display Photo Analysis
-                # with st.expander("Photo Analysis", expanded=True):
-                #     st.write("**Visible Elements:**")
-                #     st.write(", ".join(item["photo_analysis"]["visible_elements"]))
-                #     st.write(
-                #         "**Overall Condition:**",
-                #         item["photo_analysis"]["overall_condition"],
-                #     )
-                #     st.write(
-                #         "**Condition Details:**",
-                #         item["photo_analysis"]["condition_details"],
-                #     )
-
-                # Display Age Assessment
-                with st.expander("Age Assessment", expanded=True):
-                    st.write(
-                        "**Estimated Years Since Renovation:**",
-                        item["age_assessment"]["estimated_years_since_renovation"],
-                    )
-                    st.write(
-                        "**Confidence Level:**",
-                        item["age_assessment"]["confidence_level"],
-                    )
-                    st.write("**Aging Indicators:**")
-                    st.write(", ".join(item["age_assessment"]["aging_indicators"]))
-
-                # Display Renovation Prediction
-                with st.expander("Renovation Prediction", expanded=True):
-                    st.write(
-                        "**Years Until Renovation Needed:**",
-                        item["renovation_prediction"]["years_until_renovation_needed"],
-                    )
-                    st.write(
-                        "**Urgency Level:**",
-                        item["renovation_prediction"]["urgency_level"],
-                    )
-                    st.write("**Recommended Actions:**")
-                    st.write(
-                        ", ".join(item["renovation_prediction"]["recommended_actions"])
+        # Problem boxes come with the detection, so they are drawn right here
+        if located:
+            with st.expander("Problem locations", expanded=False):
+                marked = [photo for photo in photos if photo.name in located]
+                for col, photo in zip(st.columns(len(marked)), marked):
+                    col.image(
+                        draw_problems(photo.thumbnail, located[photo.name]),
+                        caption=format_located_problems(located[photo.name]),
+                        use_container_width=True,
                     )
 
-                # Display Risk Assessment
-                with st.expander("Risk Assessment", expanded=True):
-                    st.write("**Safety Risks:**")
-                    st.write(", ".join(item["risk_assessment"]["safety_risks"]))
-                    st.write("**Damage Risks:**")
-                    st.write(", ".join(item["risk_assessment"]["damage_risks"]))
-                    st.write(
-                        "**Priority Level:**",
-                        item["risk_assessment"]["priority_level"],
-                    )
+        if description_job is not None:
+            future, render_thread = description_job
+            render_thread.join()
+            if not future.cancelled() and future.exception() is not None:
+                st.error(f"Error processing description: {future.exception()}")
+
+        # Renovation costing runs in the job queue workers: the page returns
+        # right away and the analysis survives a closed browser tab
+        job_id = enqueue_renovation_job(photos, property_description, manifest)
+        st.fragment(render_renovation_job, run_every=JOB_POLL_INTERVAL_S)(job_id)
 
     if address:
         st.write("### Property Location on Map")
-        geolocator = Nominatim(user_agent="housing-check")
-        location = geolocator.geocode(address)
+        geolocator = geocoders.Nominatim(user_agent="housing-check")
+        with span("geocode", model="nominatim"):
+            location = geolocator.geocode(address)
 
         if location:
             df = pd.DataFrame(
@@ -469,6 +917,8 @@ def main():
         else:
             st.error("Could not find that address. Try a different format.")
 
+        render_timing_panel(listing_id)
+
 
 if __name__ == "__main__":
     main()
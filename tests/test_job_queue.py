@@ -0,0 +1,61 @@
+import multiprocessing
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from job_queue import JobQueue, enqueue_property_analysis, run_worker
+
+REPO = Path(__file__).resolve().parent.parent
+# Eight photos and the 0-byte Eingang_ai_highlighted.jpg
+PHOTOS = sorted((REPO / "photos").glob("*.jp*g"))[:9]
+UNREADABLE = "Eingang_ai_highlighted.jpg"
+
+
+def fake_worker(db_path):
+    """run_worker answering from the benchmark fixtures"""
+    from fake_backend import FakeBackend
+
+    with FakeBackend().install():
+        run_worker(db_path, poll_interval=0.1)
+
+
+@pytest.mark.parametrize("daemon", [True, False], ids=["app", "cli"])
+def test_property_job_decodes_a_batch_in_worker_processes(
+    tmp_path, monkeypatch, daemon
+):
+    pytest.importorskip("google.generativeai")
+    photos_dir = tmp_path / "photos"
+    photos_dir.mkdir()
+    for photo in PHOTOS:
+        shutil.copy(photo, photos_dir / photo.name)
+    # Enough for ImagePipeline.for_batch to ask for a process pool
+    monkeypatch.setenv("IMAGE_PROCESSES", "2")
+    monkeypatch.setenv("GOOGLE_API_KEY", "fake-key")
+    monkeypatch.chdir(REPO)
+
+    queue = JobQueue(tmp_path / "jobs.sqlite")
+    job_id = enqueue_property_analysis(
+        queue, str(photos_dir), jobs_dir=str(tmp_path / "jobs")
+    )
+    # Started like start_workers does; the app's workers are daemonic
+    context = multiprocessing.get_context("spawn")
+    worker = context.Process(target=fake_worker, args=(queue.path,), daemon=daemon)
+    worker.start()
+    try:
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            job = queue.get(job_id)
+            if job["status"] not in ("queued", "running") or job["error"]:
+                break
+            time.sleep(0.2)
+    finally:
+        worker.terminate()
+        worker.join()
+
+    assert job["error"] is None
+    assert job["status"] == "succeeded"
+    assert job["result"]["photos"] > 0
+    assert list(job["result"]["skipped"]) == [UNREADABLE]
+    assert Path(job["result"]["summary_path"]).exists()
@@ -0,0 +1,73 @@
+from problem_dedup import dedupe_cost_items, dedupe_problems, head_phrase
+
+KITCHEN_ITEMS = [
+    ("Replace kitchen cabinets", 15000),
+    ("Replace kitchen countertop", 6000),
+    ("Replace floor tiles", 4000),
+    ("Replace wall tiles", 3000),
+]
+
+
+def analysis(photo, items=(), lump_sum=None, description=None):
+    immediate = {"items": [{"item": item, "cost": cost} for item, cost in items]}
+    if lump_sum is not None:
+        immediate = {"estimated_cost_chf": lump_sum}
+        if description:
+            immediate["description"] = description
+    return {"photo_path": photo, "cost_analysis": {"immediate_repairs": immediate}}
+
+
+def total(items):
+    return sum(item["cost"] for item in items)
+
+
+def test_items_of_one_photo_are_never_merged():
+    items = dedupe_cost_items([analysis("kitchen.jpg", KITCHEN_ITEMS)])
+    assert len(items) == 4
+    assert total(items) == 28000
+
+
+def test_different_work_items_across_photos_stay_apart():
+    analyses = [analysis(f"{i}.jpg", [item]) for i, item in enumerate(KITCHEN_ITEMS)]
+    assert total(dedupe_cost_items(analyses)) == 28000
+
+
+def test_same_item_on_two_photos_is_counted_once_at_its_highest_cost():
+    analyses = [
+        analysis("a.jpg", [("Replace kitchen cabinets", 15000)]),
+        analysis("b.jpg", [("Kitchen cabinet replacement", 12000)]),
+    ]
+    items = dedupe_cost_items(analyses)
+    assert len(items) == 1
+    assert items[0]["cost"] == 15000
+    assert items[0]["photos"] == ["a.jpg", "b.jpg"]
+
+
+def test_lump_sums_without_description_are_never_merged():
+    analyses = [analysis("a.jpg", lump_sum=5000), analysis("b.jpg", lump_sum=7000)]
+    assert total(dedupe_cost_items(analyses)) == 12000
+
+
+def test_described_lump_sums_merge_like_items():
+    analyses = [
+        analysis("a.jpg", lump_sum=5000, description="Repair water damage"),
+        analysis("b.jpg", lump_sum=7000, description="Repair water damage"),
+    ]
+    assert total(dedupe_cost_items(analyses)) == 7000
+
+
+def test_head_phrase():
+    assert head_phrase("Replace floor tiles in bathroom") == ("tile", "floor")
+    assert head_phrase("Kitchen cabinet replacement") == ("cabinet", "kitchen")
+    assert head_phrase("Repair crack in ceiling") == ("crack", None)
+
+
+def test_same_problem_on_two_photos_is_reported_once():
+    problems = dedupe_problems(
+        {
+            "a.jpg": "1. Water stain on ceiling",
+            "b.jpg": "1. water stains on the ceiling",
+        }
+    )
+    assert len(problems) == 1
+    assert problems[0]["photos"] == ["a.jpg", "b.jpg"]
@@ -0,0 +1,344 @@
+"""
+Latency and cost instrumentation for the pipeline stages
+--------------------------------------------------------
+Every analysis stage (classification, description, problems, anomalies,
+renovation costing, geocoding) records a span with its latency, model,
+image hash, token usage, bytes, retries and cache hits.
+
+Finished spans are kept in memory (for the per-listing timing panel in the
+app), aggregated into Prometheus-style histograms and, when TRACE_JSONL is
+set, appended to a JSONL file.
+
+Usage:
+    with trace_listing("listing-42"):
+        with span("classify", model="gemini-2.5-flash", image=image) as s:
+            response = model.generate_content([prompt, image])
+            record_usage(response)
+
+    @traced("problems", model="gemini-2.0-flash")
+    def analyze_image_problems(image, api_key): ...
+
+    start_metrics_server(9100)  # GET /metrics
+"""
+
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from image_hash import file_hash
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MAX_SPANS = 10000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_listing = contextvars.ContextVar("current_listing", default=None)
+# Retries already spent on the call the next span times (cascade, job retry)
+_pending_retries = contextvars.ContextVar("pending_retries", default=0)
+
+
+@dataclass
+class Span:
+    stage: str
+    listing_id: Optional[str] = None
+    image_hash: Optional[str] = None
+    model: Optional[str] = None
+    started_at: str = ""
+    latency_s: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    retries: int = 0
+    cache_hit: bool = False
+    error: Optional[str] = None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: Optional[str] = None
+    attributes: Dict = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def image_fingerprint(image) -> Optional[str]:
+    """Short content hash of a PIL image or of the bytes of an image file"""
+    if image is None:
+        return None
+    if isinstance(image, (str, os.PathLike)):
+        try:
+            with open(image, "rb") as f:
+                return file_hash(f.read())[:16]
+        except OSError:
+            return None
+    if not hasattr(image, "tobytes"):
+        return None
+    # Hashing 20MP of raw pixels is slow, a box-reduced copy is good enough
+    factor = max(1, int((image.size[0] * image.size[1] / 1_000_000) ** 0.5))
+    sample = image.reduce(factor) if factor > 1 else image
+    digest = hashlib.sha256(f"{image.mode}{image.size}".encode())
+    digest.update(sample.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class Tracer:
+    """Thread-safe store of finished spans with per-stage aggregates"""
+
+    def __init__(self, max_spans: int = MAX_SPANS, jsonl_path: Optional[str] = None):
+        self.spans = deque(maxlen=max_spans)
+        self.jsonl_path = jsonl_path
+        self.lock = threading.Lock()
+        self.stats: Dict[tuple, Dict] = {}
+
+    def record(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+            key = (span.stage, span.model or "")
+            stats = self.stats.setdefault(
+                key,
+                {
+                    "count": 0,
+                    "sum": 0.0,
+                    "buckets": [0] * len(LATENCY_BUCKETS),
+                    "errors": 0,
+                    "cache_hits": 0,
+                    "retries": 0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                },
+            )
+            stats["count"] += 1
+            stats["sum"] += span.latency_s
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if span.latency_s <= bound:
+                    stats["buckets"][i] += 1
+            stats["errors"] += span.error is not None
+            stats["cache_hits"] += span.cache_hit
+            stats["retries"] += span.retries
+            stats["input_tokens"] += span.input_tokens
+            stats["output_tokens"] += span.output_tokens
+            stats["bytes_in"] += span.bytes_in
+            stats["bytes_out"] += span.bytes_out
+
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False) + "\n")
+
+    def spans_for_listing(self, listing_id: str) -> List[Span]:
+        with self.lock:
+            return [s for s in self.spans if s.listing_id == listing_id]
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format of the per-stage aggregates"""
+        lines = [
+            "# HELP housing_stage_latency_seconds Pipeline stage latency",
+            "# TYPE housing_stage_latency_seconds histogram",
+        ]
+        counters = {
+            "errors": "housing_stage_errors_total",
+            "cache_hits": "housing_stage_cache_hits_total",
+            "retries": "housing_stage_retries_total",
+            "input_tokens": "housing_stage_input_tokens_total",
+            "output_tokens": "housing_stage_output_tokens_total",
+            "bytes_in": "housing_stage_bytes_in_total",
+            "bytes_out": "housing_stage_bytes_out_total",
+        }
+        with self.lock:
+            items = sorted(self.stats.items())
+            for (stage, model), stats in items:
+                labels = f'stage="{stage}",model="{model}"'
+                for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                    lines.append(
+                        f'housing_stage_latency_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'housing_stage_latency_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}'
+                )
+                lines.append(
+                    f"housing_stage_latency_seconds_sum{{{labels}}} {stats['sum']:.6f}"
+                )
+                lines.append(
+                    f"housing_stage_latency_seconds_count{{{labels}}} {stats['count']}"
+                )
+            for key, name in counters.items():
+                lines.append(f"# TYPE {name} counter")
+                for (stage, model), stats in items:
+                    lines.append(
+                        f'{name}{{stage="{stage}",model="{model}"}} {stats[key]}'
+                    )
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.stats.clear()
+
+
+tracer = Tracer(jsonl_path=os.getenv("TRACE_JSONL"))
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_listing() -> Optional[str]:
+    return _current_listing.get()
+
+
+def start_listing(listing_id: Optional[str] = None) -> str:
+    """
+    Tag every following span in this context with a listing id, e.g. once
+    per Streamlit session. Prefer trace_listing() where a block fits.
+    """
+    listing_id = listing_id or uuid.uuid4().hex[:12]
+    _current_listing.set(listing_id)
+    return listing_id
+
+
+@contextmanager
+def trace_listing(listing_id: Optional[str] = None):
+    """Group all spans recorded inside the block under one listing id"""
+    listing_id = listing_id or uuid.uuid4().hex[:12]
+    token = _current_listing.set(listing_id)
+    try:
+        yield listing_id
+    finally:
+        _current_listing.reset(token)
+
+
+@contextmanager
+def span(stage: str, model: Optional[str] = None, image=None, **attributes):
+    """Time a block as one pipeline stage"""
+    parent = _current_span.get()
+    current = Span(
+        stage=stage,
+        listing_id=_current_listing.get(),
+        image_hash=image_fingerprint(image),
+        model=model,
+        started_at=datetime.now().isoformat(),
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes,
+    )
+    current.retries = _pending_retries.get()
+    token = _current_span.set(current)
+    # Retries belong to this span, not to the spans nested in it
+    retries_token = _pending_retries.set(0)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.latency_s = time.perf_counter() - start
+        _pending_retries.reset(retries_token)
+        _current_span.reset(token)
+        tracer.record(current)
+
+
+@contextmanager
+def retry_attempt(retries: int):
+    """Count `retries` earlier attempts on the next span opened in the block"""
+    token = _pending_retries.set(retries)
+    try:
+        yield
+    finally:
+        _pending_retries.reset(token)
+
+
+def record_cache_hit(stage: str, image=None, **attributes):
+    """Record a stage that was served from a cache without doing any work"""
+    with span(stage, image=image, **attributes) as s:
+        s.cache_hit = True
+
+
+def record_usage(response, current: Optional[Span] = None):
+    """Copy token usage and response size from a generate_content response"""
+    current = current or _current_span.get()
+    if current is None or response is None:
+        return
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        current.input_tokens += getattr(usage, "prompt_token_count", 0) or 0
+        current.output_tokens += getattr(usage, "candidates_token_count", 0) or 0
+    try:
+        current.bytes_out += len(response.text.encode("utf-8"))
+    except Exception:
+        pass
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp")
+
+
+def _find_image(args, kwargs):
+    candidates = list(args) + list(kwargs.values())
+    for value in candidates:
+        if hasattr(value, "tobytes") and hasattr(value, "size"):
+            return value
+    for value in candidates:
+        if isinstance(value, (str, os.PathLike)) and os.fspath(value).lower().endswith(
+            IMAGE_EXTENSIONS
+        ):
+            return value
+    return None
+
+
+def traced(stage: str, model: Optional[str] = None):
+    """Decorator recording a span per call, hashing the first image argument"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage, model=model, image=_find_image(args, kwargs)):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def in_context(function, *args, **kwargs):
+    """Bind the current trace context for use in a worker thread"""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function, *args, **kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = tracer.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port: int = 9100, host: str = "0.0.0.0"):
+    """Serve GET /metrics on a daemon thread (idempotent)"""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        _metrics_server.daemon_threads = True
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
@@ -0,0 +1,125 @@
+"""
+Train and evaluate the local room classifier
+--------------------------------------------
+Expects one folder per category, e.g. Categorised_photos/Kitchen/*.jpg, and
+reports hold-out accuracy, how many images would be answered locally at the
+confidence threshold (and how accurate those are) and feature throughput.
+
+Usage:
+    python train_room_classifier.py Categorised_photos --output room_classifier.npz
+    python train_room_classifier.py Categorised_photos --evaluate room_classifier.npz
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from local_room_classifier import (
+    DEFAULT_CONFIDENCE,
+    DEFAULT_MODEL_PATH,
+    LocalRoomClassifier,
+    extract_features,
+    open_for_features,
+)
+
+PHOTO_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp"]
+
+
+def load_dataset(root: Path):
+    """Extract features for every image under root/<category>/"""
+    features, labels, paths = [], [], []
+    start = time.perf_counter()
+    for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+        for file in sorted(folder.iterdir()):
+            if file.suffix.lower() not in PHOTO_EXTENSIONS:
+                continue
+            try:
+                with open_for_features(file) as image:
+                    features.append(extract_features(image))
+            except Exception as e:
+                print(f"Skipping {file}: {e}")
+                continue
+            labels.append(folder.name)
+            paths.append(file)
+    elapsed = time.perf_counter() - start
+
+    if not features:
+        return np.zeros((0, 0), dtype=np.float32), labels, paths, elapsed
+    return np.stack(features), labels, paths, elapsed
+
+
+def split_dataset(n: int, eval_fraction: float, seed: int):
+    order = np.random.default_rng(seed).permutation(n)
+    n_eval = int(round(n * eval_fraction))
+    return order[n_eval:], order[:n_eval]
+
+
+def evaluate(classifier: LocalRoomClassifier, features, labels, threshold):
+    probabilities = classifier.predict_proba_features(features)
+    predicted = [classifier.labels[i] for i in probabilities.argmax(axis=1)]
+    confidence = probabilities.max(axis=1)
+    correct = np.array([p == t for p, t in zip(predicted, labels)])
+    local = confidence >= threshold
+
+    print(f"Accuracy: {correct.mean():.1%} on {len(labels)} images")
+    print(
+        f"Answered locally at confidence >= {threshold}: {local.mean():.1%} "
+        f"(accuracy {correct[local].mean() if local.any() else 0:.1%}), "
+        f"escalated: {(~local).sum()}"
+    )
+    print("Per category:")
+    for label in sorted(set(labels)):
+        mask = np.array([t == label for t in labels])
+        print(f"  {label:40s} {correct[mask].mean():6.1%}  ({mask.sum()} images)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local room classifier")
+    parser.add_argument("data", help="Folder with one sub-folder per category")
+    parser.add_argument("--output", "-o", default=DEFAULT_MODEL_PATH)
+    parser.add_argument(
+        "--evaluate", metavar="MODEL", help="Only evaluate an existing model"
+    )
+    parser.add_argument("--eval-fraction", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    features, labels, paths, elapsed = load_dataset(Path(args.data))
+    if not labels:
+        print(f"No labelled images found in {args.data}")
+        sys.exit(1)
+    print(
+        f"Extracted features for {len(labels)} images in {elapsed:.2f}s "
+        f"({len(labels) / elapsed:.0f} images/s)"
+    )
+
+    if args.evaluate:
+        evaluate(
+            LocalRoomClassifier.load(args.evaluate), features, labels, args.threshold
+        )
+        return
+
+    train_idx, eval_idx = split_dataset(len(labels), args.eval_fraction, args.seed)
+    classifier = LocalRoomClassifier.train(
+        features[train_idx], [labels[i] for i in train_idx], epochs=args.epochs
+    )
+    if len(eval_idx):
+        evaluate(
+            classifier,
+            features[eval_idx],
+            [labels[i] for i in eval_idx],
+            args.threshold,
+        )
+
+    # Refit on everything before saving
+    classifier = LocalRoomClassifier.train(features, labels, epochs=args.epochs)
+    classifier.save(args.output)
+    print(f"Model saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
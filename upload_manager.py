@@ -0,0 +1,188 @@
+"""
+Memory-bounded handling of uploaded listing photos
+--------------------------------------------------
+Each upload is decoded once (JPEGs in draft mode, at reduced resolution) into
+a small display thumbnail and the 512x512 analysis buffer. Thumbnails are kept
+for the whole session, analysis buffers only while they are being processed:
+they are released afterwards and evicted least-recently-used first when the
+session goes over its memory cap, then re-decoded on demand.
+
+Peak memory therefore scales with the number of photos processed
+concurrently, not with the size of the listing. Uploads the session holds
+itself (keyframes of a walkthrough video, added with `held=True`) count
+against the cap with their encoded bytes, and has_room() tells whether one
+more fits.
+"""
+
+import io
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from image_hash import file_hash, phash
+
+ANALYSIS_SIZE = (512, 512)
+THUMBNAIL_SIZE = 256
+DEFAULT_MEMORY_CAP_MB = 256
+
+
+@dataclass
+class UploadedPhoto:
+    """One upload: its identity, a thumbnail and its original dimensions"""
+
+    name: str
+    file_hash: str
+    original_size: Tuple[int, int]
+    thumbnail: Image.Image
+    phash: int
+    source: object = field(repr=False, default=None)
+    # Encoded bytes held by the session rather than by Streamlit
+    held_bytes: int = 0
+
+    def open_full_resolution(self) -> Image.Image:
+        """Decode the original at full size, e.g. for the tiled defect scan"""
+        return Image.open(io.BytesIO(self.source.getvalue()))
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def decode_upload(data: bytes, analysis_size=ANALYSIS_SIZE):
+    """Single decode producing (thumbnail, analysis buffer, original size)"""
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    if image.format == "JPEG":
+        # Let libjpeg downscale by 1/2..1/8 while decoding
+        image.draft("RGB", (analysis_size[0] * 2, analysis_size[1] * 2))
+    image = image.convert("RGB")
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    analysis = image.resize(analysis_size)
+    image.close()
+    return thumbnail, analysis, original_size
+
+
+class UploadManager:
+    """Per-session store of uploads with a cap on decoded analysis buffers"""
+
+    def __init__(
+        self,
+        memory_cap_mb: float = DEFAULT_MEMORY_CAP_MB,
+        analysis_size: Tuple[int, int] = ANALYSIS_SIZE,
+    ):
+        self.memory_cap_bytes = int(memory_cap_mb * 2**20)
+        self.analysis_size = analysis_size
+        self.photos: Dict[str, UploadedPhoto] = {}
+        self.buffers: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self.in_use: Dict[str, int] = {}
+        self.lock = threading.RLock()
+
+    def add(self, uploaded_file, held: bool = False) -> UploadedPhoto:
+        """
+        Register one upload, decoding it unless the same content is known.
+        `held` uploads are kept by the session and count against the cap.
+        """
+        data = uploaded_file.getvalue()
+        key = file_hash(data)
+        with self.lock:
+            photo = self.photos.get(key)
+        if photo is None:
+            thumbnail, analysis, original_size = decode_upload(data, self.analysis_size)
+            photo = UploadedPhoto(
+                name=uploaded_file.name,
+                file_hash=key,
+                original_size=original_size,
+                thumbnail=thumbnail,
+                phash=phash(thumbnail),
+                source=uploaded_file,
+                held_bytes=len(data) if held else 0,
+            )
+            with self.lock:
+                self.photos[key] = photo
+                self._store_buffer(key, analysis)
+        else:
+            photo.source = uploaded_file
+        return photo
+
+    def has_room(self, n_bytes: int) -> bool:
+        """
+        Whether `n_bytes` more held data stay under the cap. Analysis buffers
+        do not count, as they are evicted to make room.
+        """
+        with self.lock:
+            thumbnails = sum(_image_bytes(p.thumbnail) for p in self.photos.values())
+            held = sum(p.held_bytes for p in self.photos.values())
+        return thumbnails + held + n_bytes <= self.memory_cap_bytes
+
+    def sync(self, uploaded_files, keep: Iterable[str] = ()) -> List[UploadedPhoto]:
+        """
+        Register new uploads and forget removed ones, except the photos whose
+        file hash is in `keep`. Returns the photos of `uploaded_files` in
+        upload order; files already seen (same content) are not decoded again.
+        """
+        current = [self.add(uploaded_file) for uploaded_file in uploaded_files or []]
+        seen = {photo.file_hash for photo in current} | set(keep)
+
+        with self.lock:
+            for key in list(self.photos):
+                if key not in seen:
+                    del self.photos[key]
+                    self.buffers.pop(key, None)
+                    self.in_use.pop(key, None)
+        return current
+
+    def analysis_image(self, photo: UploadedPhoto) -> Image.Image:
+        """
+        The analysis-size buffer for `photo`, pinned until release() is called.
+        Re-decodes from the upload if the buffer has been evicted.
+        """
+        with self.lock:
+            buffer = self.buffers.get(photo.file_hash)
+            if buffer is not None:
+                self.buffers.move_to_end(photo.file_hash)
+            self.in_use[photo.file_hash] = self.in_use.get(photo.file_hash, 0) + 1
+        if buffer is None:
+            _, buffer, _ = decode_upload(photo.source.getvalue(), self.analysis_size)
+            with self.lock:
+                self._store_buffer(photo.file_hash, buffer)
+        return buffer
+
+    def release(self, photo: UploadedPhoto, keep: bool = False):
+        """Unpin the buffer; it is dropped right away unless `keep` is set"""
+        with self.lock:
+            count = self.in_use.get(photo.file_hash, 0) - 1
+            if count > 0:
+                self.in_use[photo.file_hash] = count
+                return
+            self.in_use.pop(photo.file_hash, None)
+            if not keep:
+                self.buffers.pop(photo.file_hash, None)
+
+    def _store_buffer(self, key: str, image: Image.Image):
+        self.buffers[key] = image
+        self.buffers.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used, unpinned buffers until under the cap"""
+        for key in list(self.buffers):
+            if self.memory_bytes <= self.memory_cap_bytes:
+                break
+            if key not in self.in_use:
+                del self.buffers[key]
+
+    @property
+    def memory_bytes(self) -> int:
+        with self.lock:
+            thumbnails = sum(_image_bytes(p.thumbnail) for p in self.photos.values())
+            held = sum(p.held_bytes for p in self.photos.values())
+            buffers = sum(_image_bytes(image) for image in self.buffers.values())
+        return thumbnails + held + buffers
+
+    def get(self, file_hash: str) -> Optional[UploadedPhoto]:
+        return self.photos.get(file_hash)
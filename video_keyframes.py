@@ -0,0 +1,249 @@
+"""
+Keyframes of walkthrough videos
+-------------------------------
+A five-minute walkthrough is around 9000 frames, almost all of them
+near-copies of their neighbours or smeared by camera motion. KeyframeExtractor
+streams the video with OpenCV, looks at a few frames per second (the others
+are grabbed but not decoded), and starts a new scene whenever the colour
+histogram of a frame moves away from the one that opened the current scene.
+Of each scene only the sharpest frame is kept, and only if it is not blurred
+compared to the rest of the video and does not repeat a room already kept
+(pHash), so a walkthrough gives a few dozen distinct, sharp photos for room
+classification and problem detection.
+
+Only the current frame and the best frame of the current scene are held in
+memory, whatever the length of the video.
+
+Sampling is tuned with VIDEO_SAMPLE_FPS, VIDEO_SCENE_THRESHOLD and
+VIDEO_MAX_KEYFRAMES.
+
+Usage:
+    for upload in KeyframeExtractor().uploads("walkthrough.mp4"):
+        photo = upload_manager.add(upload, held=True)
+
+    python video_keyframes.py walkthrough.mp4 --output-dir Property_photos
+"""
+import argparse
+import io
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+from PIL import Image
+
+from image_hash import DEFAULT_THRESHOLD, PerceptualHashIndex, phash
+from lazy_import import lazy_module
+from photo_sampling import photo_quality
+
+cv2 = lazy_module("cv2")
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".avi", ".mkv", ".webm"}
+DEFAULT_SAMPLE_FPS = 2.0
+# Bhattacharyya distance of hue/saturation histograms to the scene's first frame
+DEFAULT_SCENE_THRESHOLD = 0.35
+DEFAULT_MIN_SCENE_S = 1.0
+DEFAULT_MAX_KEYFRAMES = 60
+# Best frame of a scene is dropped below this share of the average sharpness
+DEFAULT_MIN_RELATIVE_SHARPNESS = 0.2
+SHARPNESS_DECAY = 0.9
+PREVIEW_WIDTH = 256
+HISTOGRAM_BINS = [16, 8]
+JPEG_QUALITY = 92
+
+
+@dataclass
+class Keyframe:
+    """Sharpest frame of one scene"""
+
+    frame_index: int
+    time_s: float
+    sharpness: float
+    phash: int
+    image: Image.Image = field(repr=False)
+
+
+class KeyframeUpload:
+    """A keyframe encoded as JPEG, shaped like a Streamlit upload"""
+
+    def __init__(self, name: str, image: Image.Image):
+        self.name = name
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+        self.data = buffer.getvalue()
+
+    def getvalue(self) -> bytes:
+        return self.data
+
+
+def keyframe_name(video_name: str, keyframe: Keyframe) -> str:
+    minutes, seconds = divmod(keyframe.time_s, 60)
+    return f"{Path(video_name).stem}_{int(minutes):02d}m{seconds:04.1f}s.jpg"
+
+
+def _preview(frame: np.ndarray) -> np.ndarray:
+    height, width = frame.shape[:2]
+    size = (PREVIEW_WIDTH, max(1, round(height * PREVIEW_WIDTH / width)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def _histogram(preview: np.ndarray) -> np.ndarray:
+    hsv = cv2.cvtColor(preview, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, HISTOGRAM_BINS, [0, 180, 0, 256])
+    return cv2.normalize(histogram, histogram).ravel()
+
+
+class KeyframeExtractor:
+    """Streaming scene-change keyframe selection"""
+
+    def __init__(
+        self,
+        sample_fps: float = DEFAULT_SAMPLE_FPS,
+        scene_threshold: float = DEFAULT_SCENE_THRESHOLD,
+        min_scene_s: float = DEFAULT_MIN_SCENE_S,
+        max_keyframes: Optional[int] = DEFAULT_MAX_KEYFRAMES,
+        duplicate_bits: int = DEFAULT_THRESHOLD,
+        min_relative_sharpness: float = DEFAULT_MIN_RELATIVE_SHARPNESS,
+    ):
+        self.sample_fps = sample_fps
+        self.scene_threshold = scene_threshold
+        self.min_scene_s = min_scene_s
+        self.max_keyframes = max_keyframes
+        self.duplicate_bits = duplicate_bits
+        self.min_relative_sharpness = min_relative_sharpness
+
+    @classmethod
+    def from_env(cls) -> "KeyframeExtractor":
+        sample_fps = os.getenv("VIDEO_SAMPLE_FPS")
+        scene_threshold = os.getenv("VIDEO_SCENE_THRESHOLD")
+        max_keyframes = os.getenv("VIDEO_MAX_KEYFRAMES")
+        return cls(
+            sample_fps=float(sample_fps) if sample_fps else DEFAULT_SAMPLE_FPS,
+            scene_threshold=(
+                float(scene_threshold) if scene_threshold else DEFAULT_SCENE_THRESHOLD
+            ),
+            max_keyframes=(
+                int(max_keyframes) if max_keyframes else DEFAULT_MAX_KEYFRAMES
+            ),
+        )
+
+    def _sampled_frames(self, capture) -> Iterator[tuple]:
+        """(frame index, seconds, BGR frame) at about sample_fps"""
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(fps / self.sample_fps))
+        frame_index = -1
+        # grab() demuxes without converting, only sampled frames are retrieved
+        while capture.grab():
+            frame_index += 1
+            if frame_index % step:
+                continue
+            ok, frame = capture.retrieve()
+            if ok and frame is not None:
+                yield frame_index, frame_index / fps, frame
+
+    def extract(self, path) -> Iterator[Keyframe]:
+        """Keyframes of the video at `path`, yielded as each scene ends"""
+        capture = cv2.VideoCapture(str(path))
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video: {path}")
+
+        kept = PerceptualHashIndex(self.duplicate_bits)
+        average_sharpness = None
+        anchor = None  # histogram of the scene's first frame
+        scene_start = 0.0
+        best = None  # (sharpness, frame index, seconds, phash, frame)
+
+        def finish_scene() -> Optional[Keyframe]:
+            sharpness, frame_index, time_s, value, frame = best
+            if sharpness < self.min_relative_sharpness * average_sharpness:
+                return None
+            match, distance = kept.nearest(value)
+            if match is not None and distance <= self.duplicate_bits:
+                return None
+            kept.add_hash(frame_index, value)
+            image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            return Keyframe(frame_index, time_s, sharpness, value, image)
+
+        try:
+            for frame_index, time_s, frame in self._sampled_frames(capture):
+                preview = _preview(frame)
+                histogram = _histogram(preview)
+                image = Image.fromarray(cv2.cvtColor(preview, cv2.COLOR_BGR2RGB))
+                sharpness, _ = photo_quality(image)
+                average_sharpness = (
+                    sharpness
+                    if average_sharpness is None
+                    else SHARPNESS_DECAY * average_sharpness
+                    + (1 - SHARPNESS_DECAY) * sharpness
+                )
+
+                if anchor is not None and time_s - scene_start >= self.min_scene_s:
+                    distance = cv2.compareHist(
+                        anchor, histogram, cv2.HISTCMP_BHATTACHARYYA
+                    )
+                    if distance > self.scene_threshold:
+                        keyframe = finish_scene()
+                        if keyframe is not None:
+                            yield keyframe
+                            if self.max_keyframes and len(kept) >= self.max_keyframes:
+                                return
+                        anchor, best = None, None
+
+                if anchor is None:
+                    anchor, scene_start = histogram, time_s
+                if best is None or sharpness > best[0]:
+                    best = (sharpness, frame_index, time_s, phash(image), frame)
+
+            if best is not None:
+                keyframe = finish_scene()
+                if keyframe is not None:
+                    yield keyframe
+        finally:
+            capture.release()
+
+    def uploads(self, path, name: Optional[str] = None) -> Iterator[KeyframeUpload]:
+        """Keyframes as JPEG uploads named after the video and their time"""
+        name = name or Path(path).name
+        for keyframe in self.extract(path):
+            yield KeyframeUpload(keyframe_name(name, keyframe), keyframe.image)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract distinct, sharp keyframes from a walkthrough video"
+    )
+    parser.add_argument("video", help="Walkthrough video file")
+    parser.add_argument(
+        "--output-dir", default=None, help="Folder for the JPEGs (default: list only)"
+    )
+    parser.add_argument("--sample-fps", type=float, default=DEFAULT_SAMPLE_FPS)
+    parser.add_argument(
+        "--scene-threshold", type=float, default=DEFAULT_SCENE_THRESHOLD
+    )
+    parser.add_argument("--max-keyframes", type=int, default=DEFAULT_MAX_KEYFRAMES)
+    args = parser.parse_args()
+
+    extractor = KeyframeExtractor(
+        sample_fps=args.sample_fps,
+        scene_threshold=args.scene_threshold,
+        max_keyframes=args.max_keyframes,
+    )
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    count = 0
+    for keyframe in extractor.extract(args.video):
+        count += 1
+        name = keyframe_name(args.video, keyframe)
+        if args.output_dir:
+            keyframe.image.save(
+                Path(args.output_dir) / name, format="JPEG", quality=JPEG_QUALITY
+            )
+        print(
+            f"{name}  frame {keyframe.frame_index}  sharpness {keyframe.sharpness:.4f}"
+        )
+    print(f"{count} keyframes from {args.video}")
+
+
+if __name__ == "__main__":
+    main()